@@ -0,0 +1,41 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from safety_app import user_cache
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that resolves the token and its user through
+    safety_app.user_cache instead of a token/user join on every request.
+    Deleting a token (api_logout) or saving the user drops the entries.
+    """
+
+    def authenticate_credentials(self, key):
+        user_id = user_cache.token_user_id(key)
+        user = user_cache.user_for(user_id) if user_id is not None else None
+        return self._checked(user, key)
+
+    async def aauthenticate(self, request):
+        """authenticate() for async views, which DRF does not dispatch."""
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise AuthenticationFailed(_('Invalid token header.'))
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise AuthenticationFailed(_('Invalid token header. Token string should not contain invalid characters.'))
+        user_id = await user_cache.atoken_user_id(key)
+        user = await user_cache.auser_for(user_id) if user_id is not None else None
+        return self._checked(user, key)
+
+    def _checked(self, user, key):
+        if user is None:
+            raise AuthenticationFailed(_('Invalid token.'))
+        if not user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+        return user, Token(key=key, user=user)
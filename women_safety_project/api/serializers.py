@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from safety_app import regions
 from safety_app.models import TrustedContact, Profile, SOSLog, JourneyTracker, IncidentReport, UserLocation
 
 
@@ -35,9 +36,13 @@ class RegisterSerializer(serializers.Serializer):
 
 
 class TrustedContactSerializer(serializers.ModelSerializer):
+    account = serializers.SlugRelatedField(
+        slug_field='username', queryset=User.objects.all(), required=False, allow_null=True
+    )
+
     class Meta:
         model = TrustedContact
-        fields = ['id', 'name', 'email', 'phone_number']
+        fields = ['id', 'name', 'email', 'phone_number', 'account']
         read_only_fields = ['id']
 
 
@@ -63,16 +68,14 @@ class JourneySerializer(serializers.ModelSerializer):
 
     class Meta:
         model = JourneyTracker
-        fields = ['id', 'destination', 'eta_minutes', 'started_at', 'status', 'remaining_seconds']
+        fields = ['id', 'destination', 'destination_lat', 'destination_lon', 'eta_minutes', 'started_at', 'status',
+                  'remaining_seconds']
         read_only_fields = ['id', 'started_at', 'status']
 
     def get_remaining_seconds(self, obj):
         if obj.status != 'active':
             return 0
-        from django.utils import timezone
-        elapsed = (timezone.now() - obj.started_at).total_seconds()
-        remaining = obj.eta_minutes * 60 - elapsed
-        return max(0, int(remaining))
+        return max(0, int(obj.remaining_seconds()))
 
 
 class IncidentReportSerializer(serializers.ModelSerializer):
@@ -81,9 +84,19 @@ class IncidentReportSerializer(serializers.ModelSerializer):
         fields = ['id', 'latitude', 'longitude', 'description', 'severity', 'reported_at']
         read_only_fields = ['id', 'reported_at']
 
+    def create(self, validated_data):
+        shard = regions.shard_for(validated_data['latitude'], validated_data['longitude'])
+        return IncidentReport.objects.using(shard).create(**validated_data)
+
 
 class NearbyAlertSerializer(serializers.Serializer):
     username = serializers.CharField()
     distance = serializers.FloatField()
     lat = serializers.FloatField()
     lon = serializers.FloatField()
+
+
+class LocationFixSerializer(serializers.Serializer):
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+    lon = serializers.FloatField(min_value=-180, max_value=180)
+    ts = serializers.DateTimeField()
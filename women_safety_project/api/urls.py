@@ -13,16 +13,22 @@ urlpatterns = [
     # Contacts
     path('contacts/', views.api_contacts, name='api_contacts'),
     path('contacts/<int:contact_id>/', views.api_contact_delete, name='api_contact_delete'),
+    path('contacts/import/', views.api_contacts_import, name='api_contacts_import'),
+    path('contacts/export.<str:fmt>', views.api_contacts_export, name='api_contacts_export'),
 
     # SOS
     path('sos/trigger/', views.api_sos_trigger, name='api_sos_trigger'),
     path('sos/deactivate/', views.api_sos_deactivate, name='api_sos_deactivate'),
     path('sos/status/', views.api_sos_status, name='api_sos_status'),
     path('sos/history/', views.api_sos_history, name='api_sos_history'),
+    path('sos/history/export.<str:fmt>', views.api_sos_history_export, name='api_sos_history_export'),
 
     # Location & Alerts
     path('location/update/', views.api_update_location, name='api_update_location'),
+    path('location/batch/', views.api_update_location_batch, name='api_update_location_batch'),
+    path('location/trail/<int:user_id>/', views.api_location_trail, name='api_location_trail'),
     path('location/alerts/', views.api_check_alerts, name='api_check_alerts'),
+    path('location/alerts/stream/', views.api_alert_stream, name='api_alert_stream'),
 
     # Voice
     path('voice/analyze/', views.api_analyze_voice, name='api_analyze_voice'),
@@ -34,4 +40,14 @@ urlpatterns = [
 
     # Incidents
     path('incidents/', views.api_incidents, name='api_incidents'),
+    path('incidents/viewport/', views.api_incidents_viewport, name='api_incidents_viewport'),
+    path('incidents/export.<str:fmt>', views.api_incidents_export, name='api_incidents_export'),
+
+    # Risk surface
+    path('risk/tiles/<int:z>/<int:x>/<int:y>.png', views.api_risk_tile, name='api_risk_tile'),
+    path('risk/point/', views.api_risk_point, name='api_risk_point'),
+
+    # Routing
+    path('route/', views.api_route, name='api_route'),
+    path('geocode/', views.api_geocode, name='api_geocode'),
 ]
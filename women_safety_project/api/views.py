@@ -1,29 +1,141 @@
-import time
+import csv
+import io
+import json
 import math
-import random
+from functools import wraps
 
 from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.csrf import csrf_exempt
 from datetime import timedelta
 
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed, PermissionDenied
 
+from safety_app import (exporting, history, journeys, location_writer, pagination, regions, risk, routing, user_cache,
+                        voice)
+from safety_app.alerts import alert_event_stream
 from safety_app.models import (
-    TrustedContact, Profile, UserLocation,
+    TrustedContact,
     SOSLog, JourneyTracker, IncidentReport
 )
-from safety_app.views import haversine, _send_sos_alert
+from safety_app.views import (
+    _check_alerts, _parse_radius_query,
+    _bounding_box_filter, _filter_radius,
+    _incident_viewport, _parse_viewport, _parse_point, _parse_route_query, _risk_tile_response,
+    _parse_geocode_query, _geocode, _destination_point,
+    _send_sos_alert, _send_safe_update, _send_duress_alert, _analyze_voice_chunk,
+)
+from .authentication import CachedTokenAuthentication
 from .serializers import (
     RegisterSerializer, UserSerializer, ProfileSerializer,
     TrustedContactSerializer, SOSLogSerializer,
-    JourneySerializer, IncidentReportSerializer, NearbyAlertSerializer
+    JourneySerializer, IncidentReportSerializer, NearbyAlertSerializer,
+    LocationFixSerializer,
 )
 
 
+def _paginated(request, queryset, ordering, serializer_class, filter_page=None, using=None):
+    """{'results', 'next'} for one keyset page of queryset; 400 on a bad cursor."""
+    try:
+        page = pagination.paginate_request(request, queryset, ordering, using)
+    except ValueError:
+        return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+    items = filter_page(page.items) if filter_page else page.items
+    return Response({
+        'results': serializer_class(items, many=True).data,
+        'next': page.next_url,
+    })
+
+
+def _async_api_view(methods):
+    """
+    api_view for async views, which DRF can't run: the allowed methods (405
+    otherwise) and DEFAULT_AUTHENTICATION_CLASSES in order, i.e. the token,
+    then the session with its CSRF check (401 without either). Responses are
+    plain JsonResponses.
+    """
+    def decorator(view):
+        @csrf_exempt
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return JsonResponse({'error': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+            try:
+                auth = await CachedTokenAuthentication().aauthenticate(request)
+            except AuthenticationFailed:
+                return JsonResponse({'error': 'Authentication required'}, status=status.HTTP_401_UNAUTHORIZED)
+            if auth is not None:
+                request.user = auth[0]
+            else:
+                user = await request.auser()
+                if not user.is_active:
+                    return JsonResponse({'error': 'Authentication required'}, status=status.HTTP_401_UNAUTHORIZED)
+                try:
+                    SessionAuthentication().enforce_csrf(request)
+                except PermissionDenied as exc:
+                    return JsonResponse({'error': str(exc.detail)}, status=status.HTTP_403_FORBIDDEN)
+                request.user = user
+            return await view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _request_data(request):
+    """request.data for async views: a JSON object body or form fields. Raises ValueError."""
+    if request.content_type != 'application/json':
+        return request.POST
+    data = json.loads(request.body or b'{}')
+    if not isinstance(data, dict):
+        raise ValueError('Expected a JSON object')
+    return data
+
+
+def _export_filter(request, queryset, time_field, kind_field):
+    """
+    Narrow an export to ?user= (id or username), ?<kind_field>= and
+    [?start=, ?end=) (ISO 8601), oldest first. Staff export everyone's rows
+    unless they name a user; everyone else only their own. Raises ValueError.
+    """
+    params = request.query_params
+    user = params.get('user')
+    if user:
+        lookup = {'id': int(user)} if user.isdigit() else {'username': user}
+        user_id = User.objects.filter(**lookup).values_list('id', flat=True).first()
+        if user_id is None:
+            raise ValueError(f'No user {user!r}')
+        if user_id != request.user.id and not request.user.is_staff:
+            raise PermissionDenied("Only staff can export other users' records")
+        queryset = queryset.filter(user_id=user_id)
+    elif not request.user.is_staff:
+        queryset = queryset.filter(user_id=request.user.id)
+
+    kind = params.get(kind_field)
+    if kind:
+        if kind not in dict(queryset.model._meta.get_field(kind_field).choices):
+            raise ValueError(f'Unknown {kind_field} {kind!r}')
+        queryset = queryset.filter(**{kind_field: kind})
+
+    for param, lookup in (('start', 'gte'), ('end', 'lt')):
+        if params.get(param):
+            when = parse_datetime(params[param])
+            if when is None or timezone.is_naive(when):
+                raise ValueError(f'{param} must be a timezone-aware ISO 8601 datetime')
+            queryset = queryset.filter(**{f'{time_field}__{lookup}': when})
+    return queryset.order_by(time_field, 'id')
+
+
 # ─── Auth ────────────────────────────────────────────────────────────────────
 
 @api_view(['POST'])
@@ -51,7 +163,8 @@ def api_login(request):
 
 @api_view(['POST'])
 def api_logout(request):
-    request.user.auth_token.delete()
+    # The delete signal also evicts the token from the auth cache.
+    Token.objects.filter(user=request.user).delete()
     return Response({'status': 'logged out'})
 
 
@@ -59,10 +172,7 @@ def api_logout(request):
 
 @api_view(['GET', 'PATCH'])
 def api_profile(request):
-    try:
-        profile = request.user.profile
-    except Profile.DoesNotExist:
-        profile = Profile.objects.create(user=request.user)
+    profile = user_cache.profile_for(request.user)
 
     if request.method == 'GET':
         return Response(ProfileSerializer(profile).data)
@@ -82,7 +192,8 @@ def api_profile(request):
 
     profile.real_pin = real_pin
     profile.duress_pin = duress_pin
-    profile.save()
+    # The cached copy may be stale; don't write its SOS flag back.
+    profile.save(update_fields=['real_pin', 'duress_pin'])
     return Response({'status': 'PINs updated'})
 
 
@@ -92,7 +203,7 @@ def api_profile(request):
 def api_contacts(request):
     if request.method == 'GET':
         contacts = TrustedContact.objects.filter(user=request.user)
-        return Response(TrustedContactSerializer(contacts, many=True).data)
+        return _paginated(request, contacts, 'id', TrustedContactSerializer)
 
     serializer = TrustedContactSerializer(data=request.data)
     if serializer.is_valid():
@@ -101,6 +212,79 @@ def api_contacts(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+MAX_CONTACT_IMPORT = 1000
+CONTACT_FIELDS = ['name', 'email', 'phone_number']
+
+
+def _contact_rows(request):
+    """Contacts posted as a JSON array, a CSV body or a CSV upload ('file'). Raises ValueError."""
+    upload = request.FILES.get('file') if request.content_type.startswith('multipart/') else None
+    if upload is not None or request.content_type == 'text/csv':
+        raw = upload.read() if upload is not None else request.body
+        try:
+            return list(csv.DictReader(io.StringIO(raw.decode('utf-8-sig'))))
+        except (UnicodeDecodeError, csv.Error):
+            raise ValueError('Unreadable CSV')
+    rows = request.data.get('contacts') if isinstance(request.data, dict) else request.data
+    if not isinstance(rows, list):
+        raise ValueError('Expected a list of contacts')
+    return rows
+
+
+def _phone_key(phone_number):
+    return ''.join(ch for ch in phone_number if ch.isdigit())
+
+
+@api_view(['POST'])
+def api_contacts_import(request):
+    """
+    Add many trusted contacts at once. The batch is validated as a whole;
+    contacts whose email or phone number the user already has (or that
+    repeat within the batch) are skipped.
+    """
+    try:
+        rows = _contact_rows(request)
+    except ValueError as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    if not rows:
+        return Response({'error': 'No contacts given'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(rows) > MAX_CONTACT_IMPORT:
+        return Response({'error': f'At most {MAX_CONTACT_IMPORT} contacts per import'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    serializer = TrustedContactSerializer(data=rows, many=True)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    with transaction.atomic():
+        existing = TrustedContact.objects.filter(user=request.user).values_list('email', 'phone_number')
+        emails = {email.lower() for email, _ in existing}
+        phones = {_phone_key(phone) for _, phone in existing} - {''}
+        new = []
+        for contact in serializer.validated_data:
+            email, phone = contact['email'].lower(), _phone_key(contact['phone_number'])
+            if email in emails or phone in phones:
+                continue
+            emails.add(email)
+            if phone:
+                phones.add(phone)
+            new.append(TrustedContact(user=request.user, **contact))
+        TrustedContact.objects.bulk_create(new)
+    # bulk_create sends no post_save, so the cached list is dropped here.
+    user_cache.invalidate_contacts(request.user.id)
+    return Response({'created': len(new), 'skipped': len(rows) - len(new)}, status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET'])
+def api_contacts_export(request, fmt):
+    """The user's trusted contacts as a streamed CSV or NDJSON download (re-importable as is)."""
+    contacts = TrustedContact.objects.filter(user=request.user).order_by('id')
+    try:
+        return exporting.stream(contacts, CONTACT_FIELDS, fmt, 'trusted-contacts')
+    except ValueError:
+        return Response({'error': 'Format must be csv or ndjson'}, status=status.HTTP_404_NOT_FOUND)
+
+
 @api_view(['DELETE'])
 def api_contact_delete(request, contact_id):
     try:
@@ -114,129 +298,176 @@ def api_contact_delete(request, contact_id):
 # ─── SOS ─────────────────────────────────────────────────────────────────────
 
 @api_view(['POST'])
+@location_writer.urgent()
 def api_sos_trigger(request):
     user = request.user
-    contacts = TrustedContact.objects.filter(user=user)
     trigger = request.data.get('trigger', 'triggered')
     lat = request.data.get('lat')
     lon = request.data.get('lon')
 
-    try:
-        profile = user.profile
-        profile.is_sos_active = True
-        profile.save()
-    except Profile.DoesNotExist:
-        Profile.objects.create(user=user, is_sos_active=True)
-
-    _send_sos_alert(user, lat, lon, contacts, trigger_type=trigger)
+    user_cache.set_sos_active(user, True)
+    _send_sos_alert(user, lat, lon, user_cache.contacts_for(user), trigger_type=trigger)
     return Response({'status': 'sos_triggered'})
 
 
 @api_view(['POST'])
+@location_writer.urgent()
 def api_sos_deactivate(request):
     pin = request.data.get('pin', '')
-    try:
-        profile = request.user.profile
-    except Profile.DoesNotExist:
-        return Response({'error': 'Profile not found'}, status=status.HTTP_404_NOT_FOUND)
+    profile = user_cache.profile_for(request.user)
 
     if pin == profile.real_pin:
-        profile.is_sos_active = False
-        profile.save()
-        SOSLog.objects.create(user=request.user, action='deactivated')
+        user_cache.set_sos_active(request.user, False)
+        _send_safe_update(request.user, user_cache.contacts_for(request.user))
         return Response({'status': 'deactivated', 'duress': False})
 
     elif pin == profile.duress_pin:
         # Don't actually deactivate — covert alert
-        SOSLog.objects.create(user=request.user, action='duress', notes='Duress PIN entered on mobile')
-        from django.core.mail import send_mail
-        from django.conf import settings as django_settings
-        contacts = TrustedContact.objects.filter(user=request.user)
-        if contacts:
-            send_mail(
-                'HIGH PRIORITY SILENT ALERT - DURESS PIN ENTERED',
-                f'URGENT: {request.user.username} entered Duress PIN on mobile. Send immediate help!',
-                django_settings.DEFAULT_FROM_EMAIL,
-                [c.email for c in contacts]
-            )
+        _send_duress_alert(
+            request.user,
+            user_cache.contacts_for(request.user),
+            notes='Duress PIN entered on mobile',
+        )
         return Response({'status': 'deactivated', 'duress': True})
 
     return Response({'error': 'Invalid PIN'}, status=status.HTTP_400_BAD_REQUEST)
 
 
-@api_view(['GET'])
-def api_sos_status(request):
-    try:
-        profile = request.user.profile
-        return Response({'is_sos_active': profile.is_sos_active})
-    except Profile.DoesNotExist:
-        return Response({'is_sos_active': False})
+@_async_api_view(['GET'])
+async def api_sos_status(request):
+    profile = await user_cache.aprofile_for(request.user)
+    return JsonResponse({'is_sos_active': profile.is_sos_active})
 
 
 @api_view(['GET'])
 def api_sos_history(request):
     logs = SOSLog.objects.filter(user=request.user)
-    return Response(SOSLogSerializer(logs, many=True).data)
+    return _paginated(request, logs, '-timestamp', SOSLogSerializer)
+
+
+SOS_EXPORT_FIELDS = ['id', 'user_id', 'action', 'latitude', 'longitude', 'timestamp', 'notes']
+
+
+@api_view(['GET'])
+def api_sos_history_export(request, fmt):
+    """SOS logs as a streamed CSV or NDJSON download; filters as in _export_filter (?action=)."""
+    try:
+        logs = _export_filter(request, SOSLog.objects.all(), 'timestamp', 'action')
+    except ValueError as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        return exporting.stream(logs, SOS_EXPORT_FIELDS, fmt, 'sos-logs')
+    except ValueError:
+        return Response({'error': 'Format must be csv or ndjson'}, status=status.HTTP_404_NOT_FOUND)
 
 
 # ─── Location ────────────────────────────────────────────────────────────────
 
+@_async_api_view(['POST'])
+async def api_update_location(request):
+    try:
+        data = _request_data(request)
+        lat, lon = float(data['lat']), float(data['lon'])
+    except (KeyError, TypeError, ValueError):
+        return JsonResponse({'error': 'lat/lon required'}, status=status.HTTP_400_BAD_REQUEST)
+    await location_writer.arecord(request.user, [(timezone.now(), lat, lon)])
+    return JsonResponse({'status': 'updated'})
+
+
+MAX_LOCATION_BATCH = 1000
+
+
 @api_view(['POST'])
-def api_update_location(request):
-    lat = request.data.get('lat')
-    lon = request.data.get('lon')
-    if lat and lon:
-        loc, _ = UserLocation.objects.get_or_create(user=request.user)
-        loc.latitude = float(lat)
-        loc.longitude = float(lon)
-        loc.save()
-        return Response({'status': 'updated'})
-    return Response({'error': 'lat/lon required'}, status=status.HTTP_400_BAD_REQUEST)
+def api_update_location_batch(request):
+    """Ingest a backlog of timestamped fixes: {"fixes": [{"lat", "lon", "ts"}, ...]}."""
+    fixes = request.data.get('fixes') if isinstance(request.data, dict) else request.data
+    if not isinstance(fixes, list) or not fixes:
+        return Response({'error': 'fixes must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(fixes) > MAX_LOCATION_BATCH:
+        return Response({'error': f'At most {MAX_LOCATION_BATCH} fixes per batch'}, status=status.HTTP_400_BAD_REQUEST)
+
+    serializer = LocationFixSerializer(data=fixes, many=True)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    fixes = sorted(serializer.validated_data, key=lambda fix: fix['ts'])
+    latest = fixes[-1]
+    location_writer.record(request.user, [(fix['ts'], fix['lat'], fix['lon']) for fix in fixes])
+    return Response({'status': 'updated', 'accepted': len(fixes), 'latest': latest['ts']})
+
+
+MAX_TRAIL_SPAN = timedelta(days=7)
+
+
+def _can_view_trail(viewer, target):
+    """
+    Own trail always; someone else's only while they have an active SOS or
+    journey, and only for staff or a contact linked to the viewer's account.
+    """
+    if viewer == target:
+        return True
+    in_danger = (
+        user_cache.profile_for(target).is_sos_active
+        or JourneyTracker.objects.filter(user=target, status='active').exists()
+    )
+    if not in_danger:
+        return False
+    return viewer.is_staff or any(c.account_id == viewer.id for c in user_cache.contacts_for(target))
 
 
 @api_view(['GET'])
-def api_check_alerts(request):
-    try:
-        my_loc = request.user.userlocation
-        if not my_loc.latitude:
-            return Response({'alerts': []})
-    except UserLocation.DoesNotExist:
-        return Response({'alerts': []})
-
-    time_threshold = timezone.now() - timedelta(minutes=10)
-    nearby_alerts = []
-    active_users = UserLocation.objects.filter(
-        last_updated__gte=time_threshold,
-        user__profile__is_sos_active=True
-    ).exclude(user=request.user)
-
-    for au in active_users:
-        if au.latitude is None or au.longitude is None:
-            continue
-        distance = haversine(my_loc.latitude, my_loc.longitude, au.latitude, au.longitude)
-        if distance <= 5.0:
-            nearby_alerts.append({
-                'username': au.user.username,
-                'distance': round(distance, 2),
-                'lat': au.latitude,
-                'lon': au.longitude,
-            })
-
-    return Response({'alerts': nearby_alerts})
-
-
-# ─── Voice Analysis (Mock) ───────────────────────────────────────────────────
+def api_location_trail(request, user_id):
+    """Trail between ?start= and ?end= (ISO 8601, default last 24 h) as [epoch_s, lat, lon] rows."""
+    target = User.objects.filter(id=user_id).first()
+    if target is None or not _can_view_trail(request.user, target):
+        return Response({'error': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
 
-@api_view(['POST'])
-def api_analyze_voice(request):
-    time.sleep(0.3)
-    danger_detected = random.random() > 0.90
+    end = parse_datetime(request.query_params.get('end', '')) or timezone.now()
+    start = parse_datetime(request.query_params.get('start', '')) or end - timedelta(hours=24)
+    if timezone.is_naive(start) or timezone.is_naive(end) or not start <= end <= start + MAX_TRAIL_SPAN:
+        return Response(
+            {'error': 'start/end must be timezone-aware and at most 7 days apart'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    track = history.trail(target, start, end)
     return Response({
-        'danger_detected': danger_detected,
-        'confidence': round(random.uniform(0.7, 0.99), 2) if danger_detected else 0.0
+        'username': target.username,
+        'start': start,
+        'end': end,
+        'points': track.tolist(),
     })
 
 
+@_async_api_view(['GET'])
+async def api_check_alerts(request):
+    return JsonResponse({'alerts': await _check_alerts(request.user)})
+
+
+@_async_api_view(['GET'])
+async def api_alert_stream(request):
+    """Server-Sent Events feed of nearby alerts for token clients (ASGI only)."""
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=status.HTTP_204_NO_CONTENT)
+    response = StreamingHttpResponse(alert_event_stream(request.user), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# ─── Voice Analysis ──────────────────────────────────────────────────────────
+
+@_async_api_view(['POST'])
+async def api_analyze_voice(request):
+    """One chunk of Guardian Mode audio (see safety_app.voice)."""
+    try:
+        return JsonResponse(await _analyze_voice_chunk(request, request.user))
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    except voice.VoiceBusy as exc:
+        return JsonResponse({'error': str(exc)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
 # ─── Safe Walk / Journey ─────────────────────────────────────────────────────
 
 @api_view(['GET', 'POST'])
@@ -254,13 +485,20 @@ def api_journey(request):
 
     if not destination or not eta:
         return Response({'error': 'destination and eta_minutes required'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        dest_lat, dest_lon = _destination_point(request.data)
+    except ValueError as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
     JourneyTracker.objects.filter(user=request.user, status='active').update(status='cancelled')
     journey = JourneyTracker.objects.create(
         user=request.user,
         destination=destination,
+        destination_lat=dest_lat,
+        destination_lon=dest_lon,
         eta_minutes=int(eta),
     )
+    journeys.schedule(journey)
     return Response(JourneySerializer(journey).data, status=status.HTTP_201_CREATED)
 
 
@@ -285,12 +523,113 @@ def api_journey_cancel(request):
 @api_view(['GET', 'POST'])
 def api_incidents(request):
     if request.method == 'GET':
+        try:
+            near = _parse_radius_query(request.query_params)
+        except ValueError:
+            return Response({'error': 'Invalid lat/lon/radius_km'}, status=status.HTTP_400_BAD_REQUEST)
         cutoff = timezone.now() - timedelta(days=30)
         incidents = IncidentReport.objects.filter(reported_at__gte=cutoff)
-        return Response(IncidentReportSerializer(incidents, many=True).data)
+        filter_page = None
+        shards = regions.all_shards()
+        if near:
+            # Paged newest-first over the bounding box; the exact radius check
+            # then trims each page, so a page can hold fewer than page_size.
+            incidents = _bounding_box_filter(incidents, *near)
+            filter_page = lambda rows: _filter_radius(rows, *near, nearest_first=False)
+            shards = regions.shards_near(*near)
+        return _paginated(request, incidents, '-reported_at', IncidentReportSerializer, filter_page, shards)
 
     serializer = IncidentReportSerializer(data=request.data)
     if serializer.is_valid():
         serializer.save(user=request.user)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(['GET'])
+def api_incidents_viewport(request):
+    try:
+        viewport = _parse_viewport(request.query_params)
+    except ValueError:
+        return Response({'error': 'bbox=west,south,east,north and zoom=0..22 required'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    return Response(_incident_viewport(*viewport))
+
+
+INCIDENT_EXPORT_FIELDS = ['id', 'user_id', 'latitude', 'longitude', 'severity', 'description', 'reported_at']
+
+
+@api_view(['GET'])
+def api_incidents_export(request, fmt):
+    """
+    Incident reports as a streamed CSV or NDJSON download; filters as in
+    _export_filter (?severity=). Every region shard is read at once and the
+    rows merged by time. Row ids are per shard.
+    """
+    try:
+        incidents = _export_filter(request, IncidentReport.objects.all(), 'reported_at', 'severity')
+    except ValueError as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        return exporting.stream(incidents, INCIDENT_EXPORT_FIELDS, fmt, 'incidents', regions.all_shards())
+    except ValueError:
+        return Response({'error': 'Format must be csv or ndjson'}, status=status.HTTP_404_NOT_FOUND)
+
+
+# ─── Risk Surface ────────────────────────────────────────────────────────────
+
+class PNGRenderer(BaseRenderer):
+    """Lets clients negotiate ``Accept: image/png`` for tiles."""
+    media_type = 'image/png'
+    format = 'png'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Tiles bypass rendering; only error payloads (e.g. 401) land here.
+        return data if isinstance(data, bytes) else JSONRenderer().render(data)
+
+
+@api_view(['GET'])
+@renderer_classes([PNGRenderer, JSONRenderer])
+def api_risk_tile(request, z, x, y):
+    return _risk_tile_response(z, x, y)
+
+
+@api_view(['GET'])
+def api_risk_point(request):
+    try:
+        lat, lon = _parse_point(request.query_params)
+    except ValueError:
+        return Response({'error': 'lat and lon required'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'lat': lat, 'lon': lon, **risk.risk_at(lat, lon)})
+
+
+# ─── Routing ─────────────────────────────────────────────────────────────────
+
+@api_view(['GET'])
+def api_route(request):
+    try:
+        start, end, safety = _parse_route_query(request.query_params)
+    except ValueError:
+        return Response({'error': 'from=lat,lon and to=lat,lon required; safety must be 0..10'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    try:
+        return Response(routing.plan(start, end, safety))
+    except routing.RoutingError as exc:
+        return Response({'error': str(exc)}, status=exc.status)
+
+
+# ─── Place Search ────────────────────────────────────────────────────────────
+
+@api_view(['GET'])
+def api_geocode(request):
+    try:
+        query, origin, limit = _parse_geocode_query(request.query_params)
+    except ValueError:
+        return Response({'error': 'q required; limit must be 1..20; lat/lon must be valid'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    results = _geocode(request.user, query, origin, limit)
+    if results is None:
+        return Response({'error': 'Place search is not set up'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return Response({'results': results})
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import TrustedContact, Profile, UserLocation, SOSLog, JourneyTracker, IncidentReport
+from .models import TrustedContact, Profile, UserLocation, SOSLog, JourneyTracker, IncidentReport, Notification, LocationTrail
 
 admin.site.register(TrustedContact)
 admin.site.register(Profile)
@@ -7,3 +7,5 @@ admin.site.register(UserLocation)
 admin.site.register(SOSLog)
 admin.site.register(JourneyTracker)
 admin.site.register(IncidentReport)
+admin.site.register(Notification)
+admin.site.register(LocationTrail)
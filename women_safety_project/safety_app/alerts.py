@@ -0,0 +1,139 @@
+"""
+Server-push community alerts.
+
+SOS views publish a small event whenever an SOS is triggered or cleared.
+Every open alert stream (served by an async view under ASGI) wakes up, and
+if the event could change what that subscriber sees it re-runs the nearby
+alert query and pushes the new list as a Server-Sent Event.
+
+The broker is in-process. Events published by another worker are picked up
+on the periodic refresh, so several workers still converge within
+ALERT_STREAM_REFRESH_SECONDS.
+"""
+import asyncio
+import json
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from . import geodesy, regions, sos_snapshot
+
+
+class AlertBroker:
+    """Fan out SOS state changes to the asyncio queues of open streams."""
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        subscription = (asyncio.get_running_loop(), asyncio.Queue(maxsize=64))
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event):
+        """Thread-safe; callable from sync views running in worker threads."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, event)
+            except RuntimeError:
+                # Loop already closed; the stream is being torn down.
+                pass
+
+
+def _offer(queue, event):
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        # A backed-up subscriber recomputes from the DB anyway.
+        pass
+
+
+broker = AlertBroker()
+
+
+def publish_sos_state(user, active, lat=None, lon=None):
+    """Refresh the SOS snapshot and notify open streams once the change is committed."""
+    event = {
+        'username': user.username,
+        'active': active,
+        'lat': float(lat) if lat else None,
+        'lon': float(lon) if lon else None,
+    }
+
+    def _publish():
+        # Snapshot first: streams woken by the event re-read it.
+        sos_snapshot.publish()
+        broker.publish(event)
+    transaction.on_commit(_publish)
+
+
+def _load_alerts(user):
+    from .views import _nearby_sos_alerts
+
+    my_loc = regions.user_location(user.id)
+    if my_loc is None or not my_loc.latitude:
+        return None, []
+    return (my_loc.latitude, my_loc.longitude), _nearby_sos_alerts(user, my_loc)
+
+
+def _is_relevant(event, origin, shown, radius_km):
+    """Whether an event could change the alert list this subscriber sees."""
+    if event['username'] in shown:
+        return True
+    if not event['active']:
+        return False
+    if origin is None or event['lat'] is None or event['lon'] is None:
+        return True
+    distance = geodesy.distances_km(origin[0], origin[1], event['lat'], event['lon'])
+    # Margin for the subscriber having moved since the last refresh.
+    return distance <= radius_km * 1.5
+
+
+def _sse(event, payload):
+    return f'event: {event}\ndata: {json.dumps(payload)}\n\n'
+
+
+async def alert_event_stream(user):
+    """Async iterator of SSE frames carrying the user's nearby alerts."""
+    from .views import ALERT_RADIUS_KM
+
+    refresh = getattr(settings, 'ALERT_STREAM_REFRESH_SECONDS', 30)
+    keepalive = getattr(settings, 'ALERT_STREAM_KEEPALIVE_SECONDS', 15)
+    subscription = broker.subscribe()
+    _, queue = subscription
+    load_alerts = sync_to_async(_load_alerts)
+    last_alerts = None
+    try:
+        yield 'retry: 5000\n\n'
+        while True:
+            origin, alerts = await load_alerts(user)
+            if alerts != last_alerts:
+                yield _sse('alerts', {'alerts': alerts})
+                last_alerts = alerts
+            shown = {alert['username'] for alert in alerts}
+
+            deadline = time.monotonic() + refresh
+            while True:
+                timeout = min(deadline - time.monotonic(), keepalive)
+                if timeout <= 0:
+                    break
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                if _is_relevant(event, origin, shown, ALERT_RADIUS_KM):
+                    break
+    finally:
+        broker.unsubscribe(subscription)
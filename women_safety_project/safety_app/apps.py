@@ -1,5 +1,19 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class SafetyAppConfig(AppConfig):
     name = 'safety_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        # Background threads are opt-in per process: a deployment normally
+        # runs them once, as `manage.py run_journey_scheduler` and
+        # `manage.py run_outbox`. Journeys still active from before a restart
+        # must expire even if no new one is started; the thread loads them
+        # from the database first.
+        from . import journeys, outbox
+        journeys.ensure_started()
+        if getattr(settings, 'OUTBOX_AUTOSTART', False):
+            outbox.dispatcher.start()
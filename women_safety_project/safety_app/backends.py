@@ -0,0 +1,15 @@
+from django.contrib.auth.backends import ModelBackend
+
+from . import user_cache
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend whose per-request session user lookup goes through user_cache."""
+
+    def get_user(self, user_id):
+        user = user_cache.user_for(user_id)
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        user = await user_cache.auser_for(user_id)
+        return user if self.user_can_authenticate(user) else None
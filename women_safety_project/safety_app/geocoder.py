@@ -0,0 +1,339 @@
+"""
+Offline place search for Safe Route and Safe Walk destinations.
+
+``manage.py import_places`` reads a local gazetteer and saves a search
+index as flat arrays (GEOCODER_INDEX_PATH). The gazetteer is either an
+OpenStreetMap XML extract (named streets and points of interest) or a CSV
+with name, latitude, longitude and an optional kind column. The index holds:
+
+- every place's display name, kind and coordinates
+- sorted arrays of normalised names and of name words, each pointing at
+  its place, so that everything starting with a prefix is one
+  binary-search slice
+- trigram posting lists in CSR form (sorted trigrams, offsets, places), for
+  queries with typos or missing spaces
+
+Like the walking graph, each process loads the file once and again when it
+is replaced, so searching costs no queries.
+
+A query matches a place when every query word is a prefix of one of the
+name's words. The last word may be half-typed, which is what autocomplete
+needs. When that gives too few results, names sharing enough trigrams with
+the query are added at a lower score. Results are ranked by match quality,
+boosted by place importance, and scaled by how close each place is to the
+searcher.
+"""
+import csv
+import io
+import os
+import re
+import tempfile
+import threading
+import unicodedata
+import xml.etree.ElementTree as ET
+from array import array
+
+import numpy as np
+from django.conf import settings
+
+from . import geodesy
+from .routing import open_osm
+
+# Tag keys that make a named OSM element worth finding, most specific first.
+PLACE_KEYS = ('place', 'amenity', 'shop', 'tourism', 'leisure', 'railway', 'public_transport', 'office', 'highway')
+STREET = 'street'
+IMPORTANCE = {
+    'city': 0.3, 'town': 0.25, 'suburb': 0.2, 'neighbourhood': 0.15, 'quarter': 0.15, 'village': 0.15,
+    'station': 0.1, 'hospital': 0.1, 'police': 0.1,
+}
+# Same-named street segments closer than this (in degrees) are one result.
+STREET_MERGE_DEGREES = 0.01
+PREFIX_SCORE = 0.8
+NAME_PREFIX_SCORE = 1.0
+EXACT_SCORE = 1.2
+TRIGRAM_SCORE = 0.7
+MIN_SIMILARITY = 0.3
+MAX_QUERY_LENGTH = 100
+
+_NON_WORD = re.compile(r'[^\w]+')
+
+
+def index_path():
+    return str(getattr(settings, 'GEOCODER_INDEX_PATH',
+                       os.path.join(settings.BASE_DIR, 'data', 'places.npz')))
+
+
+def normalise(text):
+    """Lower-case, accent-free words separated by single spaces."""
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(_NON_WORD.sub(' ', text.casefold()).replace('_', ' ').split())
+
+
+def trigrams(norm):
+    padded = f'  {norm} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# ─── Importing ───────────────────────────────────────────────────────────────
+
+def _kind(tags, is_way):
+    for key in PLACE_KEYS:
+        value = tags.get(key)
+        if value:
+            if key == 'highway':
+                # Named roads are destinations; other highway features only as nodes (bus stops).
+                return STREET if is_way else (value if value == 'bus_stop' else None)
+            return value
+    return None
+
+
+def places_from_osm(source):
+    """[(name, kind, lat, lon)] for the named streets and points of interest in an OSM XML stream."""
+    node_ids, lats, lons = array('q'), array('d'), array('d')
+    places, way_places = [], []
+    way_refs, tags = [], {}
+    for _, elem in ET.iterparse(source, events=('end',)):
+        if elem.tag == 'node':
+            lat, lon = float(elem.get('lat')), float(elem.get('lon'))
+            node_ids.append(int(elem.get('id')))
+            lats.append(lat)
+            lons.append(lon)
+            kind = _kind(tags, is_way=False)
+            if tags.get('name') and kind:
+                places.append((tags['name'], kind, lat, lon))
+            tags = {}
+        elif elem.tag == 'nd':
+            way_refs.append(int(elem.get('ref')))
+        elif elem.tag == 'tag':
+            tags[elem.get('k')] = elem.get('v')
+        elif elem.tag == 'way':
+            kind = _kind(tags, is_way=True)
+            if tags.get('name') and kind and way_refs:
+                # The middle node stands for the whole way.
+                way_places.append((tags['name'], kind, way_refs[len(way_refs) // 2]))
+            way_refs, tags = [], {}
+        elif elem.tag == 'relation':
+            way_refs, tags = [], {}
+        else:
+            continue
+        elem.clear()
+
+    ids = np.frombuffer(node_ids, dtype=np.int64)
+    order = np.argsort(ids)
+    ids, node_lat, node_lon = ids[order], np.frombuffer(lats)[order], np.frombuffer(lons)[order]
+    seen = set()
+    for name, kind, ref in way_places:
+        pos = int(np.searchsorted(ids, ref))
+        if pos == len(ids) or ids[pos] != ref:
+            continue
+        lat, lon = float(node_lat[pos]), float(node_lon[pos])
+        if kind == STREET:
+            key = (normalise(name), round(lat / STREET_MERGE_DEGREES), round(lon / STREET_MERGE_DEGREES))
+            if key in seen:
+                continue
+            seen.add(key)
+        places.append((name, kind, lat, lon))
+    return places
+
+
+def places_from_csv(text):
+    """[(name, kind, lat, lon)] from CSV with name, latitude/lat, longitude/lon[, kind] columns."""
+    places = []
+    for row in csv.DictReader(io.StringIO(text)):
+        row = {k.strip().lower(): (v or '').strip() for k, v in row.items() if k}
+        name = row.get('name')
+        lat, lon = row.get('latitude') or row.get('lat'), row.get('longitude') or row.get('lon')
+        if not (name and lat and lon):
+            continue
+        places.append((name, row.get('kind') or 'place', float(lat), float(lon)))
+    return places
+
+
+def build_index(places):
+    """Search index arrays for a list of (name, kind, lat, lon)."""
+    places = [p for p in places if normalise(p[0])]
+    names = [p[0] for p in places]
+    norms = [normalise(name) for name in names]
+    kinds = [p[1] for p in places]
+
+    words, word_place = [], []
+    for i, norm in enumerate(norms):
+        for word in set(norm.split()):
+            words.append(word)
+            word_place.append(i)
+    words = np.array(words, dtype=str)
+    order = np.argsort(words, kind='stable')
+
+    grams, gram_place, gram_count = [], [], np.zeros(len(places), dtype=np.int32)
+    for i, norm in enumerate(norms):
+        tri = trigrams(norm)
+        grams.extend(tri)
+        gram_place.extend([i] * len(tri))
+        gram_count[i] = len(tri)
+    keys, inverse = np.unique(np.array(grams, dtype='<U3'), return_inverse=True)
+    by_gram = np.argsort(inverse, kind='stable')
+    indptr = np.zeros(len(keys) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(inverse, minlength=len(keys)), out=indptr[1:])
+    norms = np.array(norms, dtype=str)
+    by_name = np.argsort(norms, kind='stable')
+
+    return {
+        'name': np.array(names, dtype=str),
+        'sorted_norm': norms[by_name],
+        'sorted_place': by_name.astype(np.int32),
+        'kind': np.array(kinds, dtype=str),
+        'lat': np.array([p[2] for p in places], dtype=np.float64),
+        'lon': np.array([p[3] for p in places], dtype=np.float64),
+        'importance': np.array([IMPORTANCE.get(kind, 0.0) for kind in kinds], dtype=np.float32),
+        'word': words[order],
+        'word_place': np.array(word_place, dtype=np.int32)[order],
+        'trigram': keys,
+        'trigram_indptr': indptr,
+        'trigram_place': np.array(gram_place, dtype=np.int32)[by_gram],
+        'trigram_count': gram_count,
+    }
+
+
+def save_index(arrays, path=None):
+    path = path or index_path()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix='.places-', suffix='.npz', dir=os.path.dirname(path) or '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def import_file(source_path, output=None):
+    """Index an .osm / .osm.gz / .osm.bz2 extract or a .csv gazetteer. Returns the arrays."""
+    if source_path.lower().endswith('.csv'):
+        with open(source_path, encoding='utf-8-sig', newline='') as f:
+            places = places_from_csv(f.read())
+    else:
+        with open_osm(source_path) as source:
+            places = places_from_osm(source)
+    arrays = build_index(places)
+    save_index(arrays, output)
+    return arrays
+
+
+# ─── Searching ───────────────────────────────────────────────────────────────
+
+class PlaceIndex:
+
+    def __init__(self, arrays):
+        for key, value in arrays.items():
+            setattr(self, key, value)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls({key: data[key] for key in data.files})
+
+    def __len__(self):
+        return len(self.name)
+
+    @staticmethod
+    def _slice(keys, prefix):
+        return np.searchsorted(keys, prefix, side='left'), np.searchsorted(keys, prefix + '\U0010ffff', side='left')
+
+    def prefix_matches(self, words):
+        """Places with a name word starting with each of ``words``."""
+        # Narrowest slice first: later words only filter what is left.
+        slices = sorted((self._slice(self.word, word) for word in words), key=lambda bounds: bounds[1] - bounds[0])
+        lo, hi = slices[0]
+        matched = np.unique(self.word_place[lo:hi])
+        for lo, hi in slices[1:]:
+            if not len(matched):
+                break
+            matched = matched[np.isin(matched, self.word_place[lo:hi])]
+        return matched
+
+    def trigram_matches(self, norm):
+        """(places, Jaccard similarity) for names sharing at least MIN_SIMILARITY of their trigrams."""
+        query = np.array(sorted(trigrams(norm)), dtype='<U3')
+        pos = np.searchsorted(self.trigram, query)
+        inside = pos < len(self.trigram)
+        pos = pos[inside][self.trigram[pos[inside]] == query[inside]]
+        if not len(pos):
+            return np.empty(0, dtype=np.int32), np.empty(0)
+        postings = np.concatenate([self.trigram_place[self.trigram_indptr[p]:self.trigram_indptr[p + 1]]
+                                   for p in pos])
+        places, shared = np.unique(postings, return_counts=True)
+        similarity = shared / (len(query) + self.trigram_count[places] - shared)
+        keep = similarity >= MIN_SIMILARITY
+        return places[keep], similarity[keep]
+
+    def search(self, query, origin=None, limit=8):
+        """
+        Best ``limit`` places for ``query`` as dicts {'name', 'kind', 'lat', 'lon'},
+        plus 'distance_km' when ``origin`` (lat, lon) is given.
+        """
+        norm = normalise(query[:MAX_QUERY_LENGTH])
+        if not norm or not len(self):
+            return []
+        places = self.prefix_matches(norm.split())
+        score = np.full(len(places), PREFIX_SCORE)
+        if len(places):
+            lo, hi = self._slice(self.sorted_norm, norm)
+            score[np.isin(places, self.sorted_place[lo:hi])] = NAME_PREFIX_SCORE
+            exact_hi = np.searchsorted(self.sorted_norm, norm, side='right')
+            score[np.isin(places, self.sorted_place[lo:exact_hi])] = EXACT_SCORE
+        if len(places) < limit:
+            fuzzy, similarity = self.trigram_matches(norm)
+            # Prefix matches come first, so np.unique keeps their higher score.
+            places, first = np.unique(np.concatenate([places, fuzzy]), return_index=True)
+            score = np.concatenate([score, TRIGRAM_SCORE * similarity])[first]
+        if not len(places):
+            return []
+
+        rank = score + self.importance[places]
+        distance = None
+        if origin is not None:
+            distance = geodesy.distances_km(origin[0], origin[1], self.lat[places], self.lon[places])
+            scale = getattr(settings, 'GEOCODER_PROXIMITY_KM', 5.0)
+            rank = rank * (0.3 + 0.7 / (1 + distance / scale))
+        if len(rank) > limit:
+            top = np.argpartition(-rank, limit)[:limit]
+            top = top[np.argsort(-rank[top], kind='stable')]
+        else:
+            top = np.argsort(-rank, kind='stable')
+
+        results = []
+        for i in top.tolist():
+            place = int(places[i])
+            row = {
+                'name': str(self.name[place]),
+                'kind': str(self.kind[place]),
+                'lat': round(float(self.lat[place]), 6),
+                'lon': round(float(self.lon[place]), 6),
+            }
+            if distance is not None:
+                row['distance_km'] = round(float(distance[i]), 2)
+            results.append(row)
+        return results
+
+
+_index = None
+_index_identity = None
+_lock = threading.Lock()
+
+
+def get_index():
+    """This process's place index, loading or reloading the file as needed. None if not built."""
+    global _index, _index_identity
+    path = index_path()
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    identity = (st.st_ino, st.st_mtime_ns, st.st_size)
+    with _lock:
+        if _index is None or identity != _index_identity:
+            _index, _index_identity = PlaceIndex.load(path), identity
+        return _index
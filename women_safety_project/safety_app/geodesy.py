@@ -0,0 +1,127 @@
+"""
+Vectorised great-circle distances.
+
+Every function takes plain floats or array-likes of latitudes/longitudes in
+degrees and works on whole arrays at once, so ranking thousands of
+candidate rows costs one NumPy pass instead of one Python call per row.
+"""
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def distances_km(lat, lon, lats, lons):
+    """Haversine distance from one point to each of N points."""
+    lat1 = np.radians(lat)
+    lat2 = np.radians(np.asarray(lats, dtype=float))
+    dlat = lat2 - lat1
+    dlon = np.radians(np.asarray(lons, dtype=float) - lon)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def pairwise_km(lats1, lons1, lats2, lons2):
+    """Haversine distance between the i-th points of two equal-length sets."""
+    lat1 = np.radians(np.asarray(lats1, dtype=float))
+    lat2 = np.radians(np.asarray(lats2, dtype=float))
+    dlon = np.radians(np.asarray(lons2, dtype=float) - np.asarray(lons1, dtype=float))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def distance_matrix_km(lats1, lons1, lats2, lons2):
+    """N×M matrix of haversine distances between two point sets."""
+    lat1 = np.radians(np.asarray(lats1, dtype=float))[:, None]
+    lon1 = np.radians(np.asarray(lons1, dtype=float))[:, None]
+    lat2 = np.radians(np.asarray(lats2, dtype=float))[None, :]
+    lon2 = np.radians(np.asarray(lons2, dtype=float))[None, :]
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def bounding_box(lat, lon, radius_km):
+    """
+    (min_lat, max_lat, min_lon, max_lon) enclosing a circle of radius_km.
+
+    Longitudes are not wrapped, so a box crossing the antimeridian has
+    min_lon < -180 or max_lon > 180. A circle around a pole spans every
+    longitude.
+    """
+    angle = radius_km / EARTH_RADIUS_KM
+    dlat = float(np.degrees(angle))
+    if lat + dlat >= 90.0 or lat - dlat <= -90.0 or angle >= np.pi / 2:
+        return max(lat - dlat, -90.0), min(lat + dlat, 90.0), lon - 180.0, lon + 180.0
+    # Widest longitude offset on the circle, reached north or south of its
+    # centre's parallel, so wider than radius / cos(lat) away from the equator.
+    dlon = float(np.degrees(np.arcsin(min(np.sin(angle) / np.cos(np.radians(lat)), 1.0))))
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+
+def in_bounding_box(lats, lons, box):
+    """Boolean mask of the points that fall inside box."""
+    min_lat, max_lat, min_lon, max_lon = box
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    centre = (min_lon + max_lon) / 2
+    half_width = (max_lon - min_lon) / 2
+    offset = np.abs((lons - centre + 180.0) % 360.0 - 180.0)
+    return (lats >= min_lat) & (lats <= max_lat) & (offset <= half_width)
+
+
+def within_radius(lat, lon, lats, lons, radius_km):
+    """
+    Indices and distances of the points within radius_km, nearest first.
+
+    The bounding box discards most candidates before any trigonometry runs.
+    """
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    candidates = np.flatnonzero(in_bounding_box(lats, lons, bounding_box(lat, lon, radius_km)))
+    dist = distances_km(lat, lon, lats[candidates], lons[candidates])
+    keep = dist <= radius_km
+    candidates, dist = candidates[keep], dist[keep]
+    order = np.argsort(dist, kind='stable')
+    return candidates[order], dist[order]
+
+
+def simplify_track(lats, lons, tolerance_m):
+    """
+    Indices of the points Douglas–Peucker keeps for a track.
+
+    Points are projected onto a local equirectangular plane, which is
+    accurate to well under a metre over the extent of a day's walking.
+    """
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    n = len(lats)
+    if n <= 2:
+        return np.arange(n)
+
+    metres = EARTH_RADIUS_KM * 1000
+    x = np.radians(lons) * np.cos(np.radians(lats.mean())) * metres
+    y = np.radians(lats) * metres
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        xs = x[start + 1:end] - x[start]
+        ys = y[start + 1:end] - y[start]
+        dx = x[end] - x[start]
+        dy = y[end] - y[start]
+        length = np.hypot(dx, dy)
+        if length == 0:
+            offsets = np.hypot(xs, ys)
+        else:
+            offsets = np.abs(dy * xs - dx * ys) / length
+        i = int(np.argmax(offsets))
+        if offsets[i] > tolerance_m:
+            split = start + 1 + i
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return np.flatnonzero(keep)
@@ -0,0 +1,74 @@
+"""
+Geohash encoding and cell lookups.
+
+Region shards (safety_app.regions) are keyed by geohash prefix: a point's
+cell names the shard it is stored in, and the cells covering a box tell
+which shards hold the rows inside it.
+"""
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+PRECISION = 9
+
+
+def encode(lat, lon, precision=PRECISION):
+    """Geohash string for a point."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                value = (value << 1) | 1
+                lon_lo = mid
+            else:
+                value <<= 1
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                value = (value << 1) | 1
+                lat_lo = mid
+            else:
+                value <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(lat_degrees, lon_degrees) spanned by one cell at this precision."""
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = precision * 5 // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def box_cells(min_lat, min_lon, max_lat, max_lon, precision):
+    """Set of geohash cells covering a box; longitudes past ±180 wrap around."""
+    lat_deg, lon_deg = cell_size(precision)
+    cells = set()
+    y = min_lat
+    while True:
+        x = min_lon
+        while True:
+            cells.add(encode(y, _wrap_lon(x), precision))
+            if x >= max_lon:
+                break
+            x = min(x + lon_deg, max_lon)
+        if y >= max_lat:
+            break
+        y = min(y + lat_deg, max_lat)
+    return cells
+
+
+def _wrap_lon(lon):
+    return (lon + 180.0) % 360.0 - 180.0
@@ -0,0 +1,123 @@
+"""
+Location history.
+
+Every fix is appended to LocationPoint (by safety_app.location_writer,
+together with the user's current location). The compaction job folds each
+finished UTC day into a single LocationTrail row per user: the fixes are
+packed as little-endian float64 (epoch seconds, lat, lon) triples and
+thinned with Douglas–Peucker, and trails past the retention window are
+dropped. Storage therefore grows with users × retained days, not with the
+ping rate.
+
+Points are stored in the region shard they were recorded in and compacted
+there (see safety_app.regions), so a trail is read from every shard.
+"""
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import geodesy, regions
+from .models import LocationPoint, LocationTrail
+
+DTYPE = np.dtype('<f8')
+
+
+def pack(track):
+    return np.ascontiguousarray(track, dtype=DTYPE).tobytes()
+
+
+def unpack(blob):
+    return np.frombuffer(bytes(blob), dtype=DTYPE).reshape(-1, 3)
+
+
+def _as_track(points):
+    track = np.array(
+        [(p.recorded_at.timestamp(), p.latitude, p.longitude) for p in points],
+        dtype=DTYPE,
+    )
+    return track.reshape(-1, 3)
+
+
+def trail(user, start, end):
+    """(N, 3) array of (epoch seconds, lat, lon) between two datetimes, oldest first."""
+    parts = [
+        unpack(t.points) for t in regions.fan_out(LocationTrail.objects.filter(
+            user=user,
+            day__gte=start.astimezone(dt_timezone.utc).date(),
+            day__lte=end.astimezone(dt_timezone.utc).date(),
+        ))
+    ]
+    parts.append(_as_track(regions.fan_out(LocationPoint.objects.filter(
+        user=user, recorded_at__gte=start, recorded_at__lte=end,
+    ))))
+    track = np.concatenate(parts)
+    track = track[(track[:, 0] >= start.timestamp()) & (track[:, 0] <= end.timestamp())]
+    return track[np.argsort(track[:, 0], kind='stable')]
+
+
+def _merge(track, tolerance_m):
+    track = track[np.argsort(track[:, 0], kind='stable')]
+    _, first = np.unique(track[:, 0], return_index=True)
+    track = track[first]
+    return track[geodesy.simplify_track(track[:, 1], track[:, 2], tolerance_m)]
+
+
+def compact_day(user_id, day, tolerance_m, using=DEFAULT_DB_ALIAS):
+    """Fold one user's raw fixes for one day in one shard into their trail there. Returns (raw, kept)."""
+    day_start = datetime.combine(day, dt_time.min, tzinfo=dt_timezone.utc)
+    raw = LocationPoint.objects.using(using).filter(
+        user_id=user_id,
+        recorded_at__gte=day_start,
+        recorded_at__lt=day_start + timedelta(days=1),
+    )
+    trails = LocationTrail.objects.using(using)
+    with transaction.atomic(using=using):
+        points = list(raw)
+        existing = trails.filter(user_id=user_id, day=day).first()
+        parts = [_as_track(points)]
+        if existing:
+            parts.append(unpack(existing.points))
+        track = _merge(np.concatenate(parts), tolerance_m)
+        trails.update_or_create(
+            user_id=user_id, day=day,
+            defaults={'points': pack(track), 'point_count': len(track)},
+        )
+        LocationPoint.objects.using(using).filter(id__in=[p.id for p in points]).delete()
+    return len(points), len(track)
+
+
+def compact(older_than_days=None, tolerance_m=None, retention_days=None):
+    """Compact every finished day older than the cutoff and purge expired trails."""
+    if older_than_days is None:
+        older_than_days = getattr(settings, 'LOCATION_HISTORY_COMPACT_AFTER_DAYS', 1)
+    if tolerance_m is None:
+        tolerance_m = getattr(settings, 'LOCATION_HISTORY_SIMPLIFY_METERS', 10)
+    if retention_days is None:
+        retention_days = getattr(settings, 'LOCATION_HISTORY_RETENTION_DAYS', 28)
+
+    today = timezone.now().astimezone(dt_timezone.utc).date()
+    cutoff = datetime.combine(today - timedelta(days=older_than_days), dt_time.min, tzinfo=dt_timezone.utc)
+    days = (
+        LocationPoint.objects.filter(recorded_at__lt=cutoff)
+        .annotate(day=TruncDate('recorded_at', tzinfo=dt_timezone.utc))
+        .values_list('user_id', 'day')
+        .distinct()
+        .order_by()
+    )
+    stats = {'days': 0, 'raw': 0, 'kept': 0, 'purged': 0}
+    for alias in regions.all_shards():
+        for user_id, day in list(days.using(alias)):
+            raw, kept = compact_day(user_id, day, tolerance_m, using=alias)
+            stats['days'] += 1
+            stats['raw'] += raw
+            stats['kept'] += kept
+
+        purged, _ = LocationTrail.objects.using(alias).filter(
+            day__lt=today - timedelta(days=retention_days),
+        ).delete()
+        stats['purged'] += purged
+    return stats
@@ -0,0 +1,154 @@
+"""
+Server-side Safe Walk expiry.
+
+Deadlines (started_at + eta_minutes) of active journeys are kept in a heap.
+A scheduler thread sleeps until the earliest one, then expires everything
+that is due in one pass and fires the auto_journey SOS. A live client
+still fires that SOS itself at the deadline (with a fresh GPS fix); the
+server waits JOURNEY_EXPIRY_GRACE_SECONDS longer and only acts on
+journeys that are still active, i.e. when the phone has gone quiet.
+
+The heap is rebuilt from the database on start-up and every
+JOURNEY_SCHEDULER_RESYNC_SECONDS, which also picks up journeys started in
+other processes. Run one per deployment with ``manage.py
+run_journey_scheduler``. JOURNEY_SCHEDULER_AUTOSTART (off by default) starts
+one in every process that loads the app instead, which suits a single
+development server (see SafetyAppConfig.ready).
+"""
+import heapq
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from . import regions, user_cache
+from .models import JourneyTracker
+
+logger = logging.getLogger(__name__)
+
+
+class JourneyScheduler:
+    """Min-heap of (deadline + grace, journey id) drained by a single thread."""
+
+    def __init__(self):
+        self.grace = getattr(settings, 'JOURNEY_EXPIRY_GRACE_SECONDS', 60)
+        self.resync = getattr(settings, 'JOURNEY_SCHEDULER_RESYNC_SECONDS', 60)
+        self._heap = []
+        self._scheduled = set()
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = None
+
+    def start(self):
+        """Run on a daemon thread (idempotent)."""
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run_forever, name='journey-scheduler', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+
+    def schedule(self, journey):
+        with self._cond:
+            self._push(journey.id, journey.deadline.timestamp())
+            self._cond.notify()
+
+    def _push(self, journey_id, deadline):
+        if journey_id not in self._scheduled:
+            self._scheduled.add(journey_id)
+            heapq.heappush(self._heap, (deadline + self.grace, journey_id))
+
+    def rebuild(self):
+        """Load the deadline of every active journey from the database."""
+        active = JourneyTracker.objects.filter(status='active').only('id', 'started_at', 'eta_minutes').order_by()
+        entries = [(j.deadline.timestamp() + self.grace, j.id) for j in active]
+        with self._cond:
+            self._heap = entries
+            heapq.heapify(self._heap)
+            self._scheduled = {journey_id for _, journey_id in entries}
+            self._cond.notify()
+
+    def pop_due(self, now=None):
+        now = now or time.time()
+        due = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                _, journey_id = heapq.heappop(self._heap)
+                self._scheduled.discard(journey_id)
+                due.append(journey_id)
+        return due
+
+    def run_forever(self):
+        next_resync = 0
+        while True:
+            try:
+                if time.monotonic() >= next_resync:
+                    self.rebuild()
+                    next_resync = time.monotonic() + self.resync
+                due = self.pop_due()
+                if due:
+                    expire(due)
+            except Exception:
+                logger.exception('Journey scheduler pass failed')
+            finally:
+                close_old_connections()
+
+            with self._cond:
+                if self._stop:
+                    return
+                timeout = next_resync - time.monotonic()
+                if self._heap:
+                    timeout = min(timeout, self._heap[0][0] - time.time())
+                if timeout > 0:
+                    self._cond.wait(timeout)
+
+
+def expire(journey_ids):
+    """
+    Expire the given journeys that are still active and fire their SOS, all
+    in one transaction (one savepoint per journey, so one failure doesn't
+    undo the rest). Returns how many fired.
+    """
+    from .views import _send_sos_alert
+
+    fired = 0
+    with transaction.atomic():
+        journeys = JourneyTracker.objects.filter(id__in=journey_ids, status='active').select_related('user')
+        for journey in journeys:
+            try:
+                with transaction.atomic():
+                    # Conditional update: only one process wins each journey.
+                    if not JourneyTracker.objects.filter(id=journey.id, status='active').update(status='expired'):
+                        continue
+                    user = journey.user
+                    user_cache.set_sos_active(user, True)
+                    loc = regions.user_location(user.id)
+                    lat = loc.latitude if loc else None
+                    lon = loc.longitude if loc else None
+                    _send_sos_alert(user, lat, lon, user_cache.contacts_for(user), trigger_type='auto_journey')
+            except Exception:
+                logger.exception('Could not expire journey %s', journey.id)
+                continue
+            fired += 1
+    return fired
+
+
+scheduler = JourneyScheduler()
+
+
+def ensure_started():
+    if getattr(settings, 'JOURNEY_SCHEDULER_AUTOSTART', False):
+        scheduler.start()
+
+
+def schedule(journey):
+    """Track a newly started journey once it is committed."""
+    def _schedule():
+        ensure_started()
+        scheduler.schedule(journey)
+    transaction.on_commit(_schedule)
@@ -0,0 +1,313 @@
+"""
+Load generator that plays realistic mobile-client traffic against /api/.
+
+Every virtual user logs in (registering on first use) and then runs its own
+timeline on a thread with one keep-alive connection, as the app does:
+
+- a location fix every 30 s, drifting on a short random walk
+- an alert poll every 10 s
+- a journey poll every 20 s (some users start a Safe Walk first)
+- a voice clip for analysis every 60 s
+- now and then an SOS, cancelled with the real PIN a little later
+
+Each activity starts at a random phase so users don't arrive in lockstep.
+run_stage() returns per-endpoint latency percentiles, throughput and error
+rates; only the standard library is used, so it runs anywhere the server does.
+
+Most of a user's time is idle between polls, so how many users one server
+process holds depends on whether an open connection pins a worker thread.
+To compare the WSGI and ASGI deployments, run the same stages against each
+with one server process, e.g.::
+
+    gunicorn -w 1 --threads 32 women_safety_project.wsgi
+    uvicorn --workers 1 women_safety_project.asgi:application
+
+and feed both result files to capacity(), or to ``loadtest --compare``.
+"""
+import http.client
+import io
+import json
+import math
+import random
+import threading
+import time
+import uuid
+import wave
+from urllib.parse import urlsplit
+
+DEFAULT_INTERVALS = {
+    'location': 30.0,
+    'alerts': 10.0,
+    'journey': 20.0,
+    'voice': 60.0,
+}
+DEFAULT_SOS_PER_HOUR = 0.5
+JOURNEY_SHARE = 0.3
+SOS_HOLD_SECONDS = (20.0, 90.0)
+REAL_PIN = '2580'
+DURESS_PIN = '0852'
+# Around Kolkata, where the seed data lives.
+CENTRE = (22.5726, 88.3639)
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(q / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def silent_wav(seconds=1.0, rate=16000):
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(b'\x00\x00' * int(seconds * rate))
+    return buf.getvalue()
+
+
+def _multipart(field, filename, data, content_type):
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f'Content-Type: {content_type}\r\n\r\n'
+    ).encode() + data + f'\r\n--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+class Recorder:
+    """Thread-safe per-endpoint samples: (latency seconds, ok)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+
+    def add(self, endpoint, latency, ok):
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append((latency, ok))
+
+    def report(self, elapsed):
+        endpoints = {}
+        total = errors = 0
+        with self.lock:
+            items = sorted(self.samples.items())
+        for endpoint, samples in items:
+            latencies = sorted(latency * 1000 for latency, _ in samples)
+            failed = sum(1 for _, ok in samples if not ok)
+            total += len(samples)
+            errors += failed
+            endpoints[endpoint] = {
+                'requests': len(samples),
+                'errors': failed,
+                'error_rate': round(failed / len(samples), 4),
+                'throughput_rps': round(len(samples) / elapsed, 2),
+                'p50_ms': round(percentile(latencies, 50), 1),
+                'p95_ms': round(percentile(latencies, 95), 1),
+                'p99_ms': round(percentile(latencies, 99), 1),
+                'max_ms': round(latencies[-1], 1),
+            }
+        return {
+            'requests': total,
+            'errors': errors,
+            'error_rate': round(errors / total, 4) if total else 0.0,
+            'throughput_rps': round(total / elapsed, 2) if elapsed else 0.0,
+            'endpoints': endpoints,
+        }
+
+
+class Client:
+    """One device: a keep-alive connection and the user's token."""
+
+    def __init__(self, base_url, recorder, timeout=30.0):
+        parts = urlsplit(base_url)
+        self.https = parts.scheme == 'https'
+        self.host = parts.netloc
+        self.prefix = parts.path.rstrip('/')
+        self.recorder = recorder
+        self.timeout = timeout
+        self.token = None
+        self.conn = None
+
+    def _connection(self):
+        if self.conn is None:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            self.conn = cls(self.host, timeout=self.timeout)
+        return self.conn
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def request(self, endpoint, method, path, payload=None, body=None, content_type=None, record=True):
+        """(status, parsed JSON or None). Status 0 means the request never completed."""
+        headers = {'Accept': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f'Token {self.token}'
+        if payload is not None:
+            body, content_type = json.dumps(payload).encode(), 'application/json'
+        if content_type:
+            headers['Content-Type'] = content_type
+
+        started = time.perf_counter()
+        try:
+            conn = self._connection()
+            conn.request(method, self.prefix + path, body=body, headers=headers)
+            response = conn.getresponse()
+            raw = response.read()
+            status = response.status
+            if response.getheader('Connection', '').lower() == 'close':
+                self.close()
+        except (OSError, http.client.HTTPException):
+            self.close()
+            status, raw = 0, b''
+        latency = time.perf_counter() - started
+
+        if record:
+            self.recorder.add(endpoint, latency, 200 <= status < 400)
+        try:
+            return status, json.loads(raw) if raw else None
+        except ValueError:
+            return status, None
+
+    def sign_in(self, username, password):
+        credentials = {'username': username, 'password': password}
+        status, data = self.request('login', 'POST', '/auth/login/', credentials, record=False)
+        if status != 200:
+            status, data = self.request('register', 'POST', '/auth/register/',
+                                        {**credentials, 'password2': password}, record=False)
+        if status not in (200, 201):
+            raise RuntimeError(f'Could not sign in {username}: HTTP {status} {data}')
+        self.token = data['token']
+        self.request('profile', 'PATCH', '/profile/', {'real_pin': REAL_PIN, 'duress_pin': DURESS_PIN}, record=False)
+
+
+class VirtualUser(threading.Thread):
+
+    def __init__(self, index, options, recorder, stop):
+        super().__init__(name=f'loadgen-{index}', daemon=True)
+        self.options = options
+        self.stop = stop
+        self.rng = random.Random(options['seed'] * 100003 + index)
+        self.username = f"{options['user_prefix']}{index}"
+        self.client = Client(options['base_url'], recorder)
+        self.lat = CENTRE[0] + self.rng.uniform(-0.05, 0.05)
+        self.lon = CENTRE[1] + self.rng.uniform(-0.05, 0.05)
+        self.sos_until = None
+        self.ready = False
+
+    def location(self):
+        self.lat += self.rng.gauss(0, 0.0003)
+        self.lon += self.rng.gauss(0, 0.0003)
+        self.client.request('location_update', 'POST', '/location/update/',
+                            {'lat': round(self.lat, 6), 'lon': round(self.lon, 6)})
+
+    def alerts(self):
+        self.client.request('alerts_poll', 'GET', '/location/alerts/')
+
+    def journey(self):
+        self.client.request('journey_poll', 'GET', '/journey/')
+
+    def voice(self):
+        body, content_type = _multipart('audio', 'clip.wav', self.options['clip'], 'audio/wav')
+        self.client.request('voice_analyze', 'POST', '/voice/analyze/', body=body, content_type=content_type)
+
+    def sos(self, now):
+        if self.sos_until is None:
+            self.client.request('sos_trigger', 'POST', '/sos/trigger/',
+                                {'lat': round(self.lat, 6), 'lon': round(self.lon, 6), 'trigger': 'triggered'})
+            self.sos_until = now + self.rng.uniform(*SOS_HOLD_SECONDS)
+        elif now >= self.sos_until:
+            self.client.request('sos_deactivate', 'POST', '/sos/deactivate/', {'pin': REAL_PIN})
+            self.sos_until = None
+
+    def run(self):
+        try:
+            self.client.sign_in(self.username, self.options['password'])
+        except RuntimeError as exc:
+            self.options['errors'].append(str(exc))
+            return
+        self.ready = True
+        if self.rng.random() < JOURNEY_SHARE:
+            self.client.request('journey_start', 'POST', '/journey/',
+                                {'destination': 'Home', 'eta_minutes': self.rng.choice([15, 30, 45, 60])})
+
+        intervals = self.options['intervals']
+        start = time.monotonic()
+        due = {name: start + self.rng.uniform(0, interval) for name, interval in intervals.items()}
+        sos_rate = self.options['sos_per_hour'] / 3600.0
+        next_sos_check = start + 1.0
+
+        while not self.stop.is_set():
+            now = time.monotonic()
+            for name, at in due.items():
+                if now >= at:
+                    getattr(self, name)()
+                    due[name] = at + intervals[name]
+            if now >= next_sos_check:
+                if self.sos_until is not None or self.rng.random() < sos_rate:
+                    self.sos(now)
+                next_sos_check = now + 1.0
+            wake = min(min(due.values()), next_sos_check)
+            self.stop.wait(max(wake - time.monotonic(), 0.0))
+
+        if self.sos_until is not None:
+            self.client.request('sos_deactivate', 'POST', '/sos/deactivate/', {'pin': REAL_PIN}, record=False)
+        self.client.close()
+
+
+def run_stage(users, duration, ramp_up=0.0, base_url='http://127.0.0.1:8000/api', password='Load-test-pass-1',
+              user_prefix='loadtest-', intervals=None, sos_per_hour=DEFAULT_SOS_PER_HOUR, seed=0):
+    """Drive ``users`` virtual users for ``duration`` seconds after starting them over ``ramp_up`` seconds."""
+    recorder = Recorder()
+    stop = threading.Event()
+    options = {
+        'base_url': base_url,
+        'password': password,
+        'user_prefix': user_prefix,
+        'intervals': {**DEFAULT_INTERVALS, **(intervals or {})},
+        'sos_per_hour': sos_per_hour,
+        'seed': seed,
+        'clip': silent_wav(),
+        'errors': [],
+    }
+    threads = [VirtualUser(i, options, recorder, stop) for i in range(users)]
+    for i, thread in enumerate(threads):
+        thread.start()
+        if ramp_up and users > 1:
+            time.sleep(ramp_up / (users - 1))
+
+    # Measure steady state only: drop anything recorded while ramping up.
+    with recorder.lock:
+        recorder.samples = {}
+    started = time.monotonic()
+    stop.wait(duration)
+    stop.set()
+    elapsed = time.monotonic() - started
+    report = recorder.report(elapsed)
+    for thread in threads:
+        thread.join()
+    return {
+        'users': users,
+        'active_users': sum(1 for thread in threads if thread.ready),
+        'duration_s': round(elapsed, 2),
+        'ramp_up_s': ramp_up,
+        'sign_in_errors': options['errors'][:10],
+        **report,
+    }
+
+
+def capacity(results, slo_ms=1000.0, max_error_rate=0.01):
+    """
+    Users per server process a loadtest run sustained: the largest stage in
+    which every user signed in, errors stayed within max_error_rate and every
+    endpoint's p95 within slo_ms. 0 if no stage passed.
+    """
+    passed = [
+        stage['users'] for stage in results['stages']
+        if stage['active_users'] == stage['users'] and stage['error_rate'] <= max_error_rate
+        and all(row['p95_ms'] <= slo_ms for row in stage['endpoints'].values())
+    ]
+    return max(passed, default=0) / (results.get('server_processes') or 1)
@@ -0,0 +1,233 @@
+"""
+Location writes, optionally group-committed by a single writer thread.
+
+SQLite admits one writer at a time, and each commit costs a journal sync.
+Under heavy location traffic every `update_location` paying for its own
+transaction means writers queue on the lock, and past the busy timeout
+they fail with "database is locked".
+
+With LOCATION_WRITE_BATCHING on, request threads hand their fixes to one
+writer thread per process and wait for the result. The writer collects
+whatever arrives within LOCATION_BATCH_WINDOW_MS (up to
+LOCATION_BATCH_MAX_FIXES) and commits it as one transaction per region
+shard (see safety_app.regions): one UPDATE per user for their newest fix,
+plus one INSERT for all history points. The response still means the fix
+is committed.
+
+SOS writes never go through the queue. They run synchronously inside
+``urgent()``, and the writer holds off starting a batch while any urgent
+write in the process is open, so an SOS waits for at most the batch being
+committed. Fixes from users with a live SOS are SOS writes too. Across
+processes the busy timeout and WAL (see settings_production) arbitrate.
+
+Async views use ``arecord()``, which awaits the batch instead of parking a
+thread on it.
+"""
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import metrics, regions, sos_snapshot
+from .models import LocationPoint, UserLocation
+
+logger = logging.getLogger(__name__)
+
+
+def move_user(user_id, lat, lon, when=None):
+    """
+    Move the user's current location with a single UPDATE (INSERT on the
+    first fix in a region, which also drops the row left in the old one).
+    A fix older than the stored location (a delayed batch) is skipped, so
+    the location never moves back in time. Returns whether it moved.
+    """
+    now = timezone.now()
+    when = min(when, now) if when else now
+    fields = {
+        'latitude': lat,
+        'longitude': lon,
+        'last_updated': when,
+    }
+    older = Q(last_updated__lt=when) | Q(last_updated__isnull=True)
+    shard = regions.shard_for(lat, lon)
+    locations = UserLocation.objects.using(shard)
+    if not locations.filter(older, user_id=user_id).update(**fields):
+        if locations.filter(user_id=user_id).exists():
+            return False
+        if any(UserLocation.objects.using(other).filter(user_id=user_id, last_updated__gte=when).exists()
+               for other in regions.all_shards() if other != shard):
+            # Already seen later in another region.
+            return False
+        _, created = locations.get_or_create(user_id=user_id, defaults={'latitude': lat, 'longitude': lon})
+        # auto_now stamped the new row with the current time, not the fix's.
+        query = locations.filter(user_id=user_id) if created else locations.filter(older, user_id=user_id)
+        if not query.update(**fields) and not created:
+            # Lost a race with a concurrent, newer first fix.
+            return False
+        regions.forget_elsewhere(UserLocation, user_id, shard)
+        regions.remember(user_id, shard)
+    if sos_snapshot.contains(user_id):
+        sos_snapshot.publish_on_commit(using=shard)
+    return True
+
+
+def write_fixes(fixes_by_user):
+    """Apply {user_id: [(recorded_at, lat, lon), ...]} in one transaction per shard."""
+    newest = {user_id: max(fixes, key=lambda fix: fix[0]) for user_id, fixes in fixes_by_user.items()}
+    points = regions.group_by_shard(
+        LocationPoint(user_id=user_id, recorded_at=recorded_at, latitude=lat, longitude=lon)
+        for user_id, fixes in fixes_by_user.items()
+        for recorded_at, lat, lon in fixes
+    )
+    for shard, shard_points in points.items():
+        with transaction.atomic(using=shard):
+            for user_id, (when, lat, lon) in newest.items():
+                if regions.shard_for(lat, lon) == shard:
+                    move_user(user_id, lat, lon, when)
+            LocationPoint.objects.using(shard).bulk_create(shard_points)
+
+
+# ─── SOS priority ────────────────────────────────────────────────────────────
+
+_urgent_count = 0
+_urgent_done = threading.Condition()
+
+
+@contextmanager
+def urgent():
+    """Mark an SOS write in progress; batches wait for it. Usable as a decorator."""
+    global _urgent_count
+    with _urgent_done:
+        _urgent_count += 1
+    try:
+        yield
+    finally:
+        with _urgent_done:
+            _urgent_count -= 1
+            _urgent_done.notify_all()
+
+
+def _wait_for_urgent():
+    with _urgent_done:
+        _urgent_done.wait_for(lambda: _urgent_count == 0)
+
+
+# ─── Writer ──────────────────────────────────────────────────────────────────
+
+class LocationWriter:
+    """Single thread that commits queued fixes in batches."""
+
+    def __init__(self, window_ms=None, max_fixes=None):
+        self.window = (window_ms if window_ms is not None else getattr(settings, 'LOCATION_BATCH_WINDOW_MS', 5)) / 1000
+        self.max_fixes = max_fixes or getattr(settings, 'LOCATION_BATCH_MAX_FIXES', 500)
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Run the writer on a daemon thread (idempotent)."""
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run_forever, name='location-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, user_id, fixes):
+        """Queue [(recorded_at, lat, lon)] for ``user_id``; the Future resolves once committed."""
+        future = Future()
+        self._queue.put((user_id, list(fixes), future))
+        return future
+
+    def run_forever(self):
+        while True:
+            first = self._queue.get()
+            # Let requests arriving in the next few milliseconds share the commit.
+            time.sleep(self.window)
+            try:
+                self.write([first] + self._drain(self.max_fixes - len(first[1])))
+            finally:
+                close_old_connections()
+
+    def _drain(self, room):
+        items = []
+        while room > 0:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            items.append(item)
+            room -= len(item[1])
+        return items
+
+    def write_pending(self):
+        """Commit everything queued, on the calling thread. Returns the number of fixes written."""
+        items = self._drain(float('inf'))
+        if items:
+            self.write(items)
+        return sum(len(fixes) for _, fixes, _ in items)
+
+    def write(self, items):
+        fixes_by_user = {}
+        for user_id, fixes, _ in items:
+            fixes_by_user.setdefault(user_id, []).extend(fixes)
+        _wait_for_urgent()
+        try:
+            write_fixes(fixes_by_user)
+        except Exception as exc:
+            logger.exception('Location batch of %d users failed', len(fixes_by_user))
+            for _, _, future in items:
+                future.set_exception(exc)
+            return
+        metrics.observe('raksha_location_batch_fixes', sum(len(fixes) for fixes in fixes_by_user.values()))
+        for _, _, future in items:
+            future.set_result(True)
+
+
+writer = LocationWriter()
+
+
+def record(user, fixes):
+    """
+    Move ``user`` to the newest of ``fixes`` [(recorded_at, lat, lon)] and
+    append all of them to their history.
+    """
+    if not _batched(user):
+        _write_urgent(user.id, fixes)
+        return
+    writer.start()
+    try:
+        writer.submit(user.id, fixes).result(timeout=getattr(settings, 'LOCATION_WRITE_TIMEOUT_SECONDS', 5))
+    except FutureTimeout:
+        # Still queued and will be committed; don't hold the client any longer.
+        logger.warning('Location write for user %s still queued after timeout', user.id)
+
+
+async def arecord(user, fixes):
+    """record() for async views."""
+    if not _batched(user):
+        await sync_to_async(_write_urgent)(user.id, fixes)
+        return
+    writer.start()
+    # shield: a timed-out wait must not cancel the Future the writer will resolve.
+    committed = asyncio.shield(asyncio.wrap_future(writer.submit(user.id, fixes)))
+    try:
+        await asyncio.wait_for(committed, getattr(settings, 'LOCATION_WRITE_TIMEOUT_SECONDS', 5))
+    except asyncio.TimeoutError:
+        logger.warning('Location write for user %s still queued after timeout', user.id)
+
+
+def _batched(user):
+    return getattr(settings, 'LOCATION_WRITE_BATCHING', False) and not sos_snapshot.contains(user.id)
+
+
+def _write_urgent(user_id, fixes):
+    with urgent():
+        write_fixes({user_id: fixes})
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from safety_app import routing
+
+
+class Command(BaseCommand):
+    help = 'Build the Safe Route walking graph from a local OpenStreetMap XML extract (.osm, .osm.gz, .osm.bz2).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('osm_file')
+        parser.add_argument('--output', default=None, help='Where to write the graph (default: ROUTING_GRAPH_PATH).')
+
+    def handle(self, *args, **options):
+        output = options['output'] or routing.graph_path()
+        arrays = routing.build_from_osm(options['osm_file'], output)
+        self.stdout.write(
+            f"Wrote {len(arrays['lat'])} nodes and {len(arrays['indices'])} directed edges to {output}; "
+            f"running workers pick it up on their next route request."
+        )
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from safety_app import history
+
+
+class Command(BaseCommand):
+    help = 'Pack finished days of raw location fixes into simplified trails and purge expired trails.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=None,
+                            help='Only compact days at least this old (default: LOCATION_HISTORY_COMPACT_AFTER_DAYS).')
+        parser.add_argument('--tolerance', type=float, default=None,
+                            help='Douglas–Peucker tolerance in metres (default: LOCATION_HISTORY_SIMPLIFY_METERS).')
+        parser.add_argument('--retention-days', type=int, default=None,
+                            help='Delete trails older than this (default: LOCATION_HISTORY_RETENTION_DAYS).')
+
+    def handle(self, *args, **options):
+        stats = history.compact(
+            older_than_days=options['older_than_days'],
+            tolerance_m=options['tolerance'],
+            retention_days=options['retention_days'],
+        )
+        self.stdout.write(
+            f"Compacted {stats['days']} user-days: {stats['raw']} fixes -> {stats['kept']} kept; "
+            f"purged {stats['purged']} expired rows."
+        )
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from safety_app import geocoder
+
+
+class Command(BaseCommand):
+    help = ('Build the destination search index from a local gazetteer: an OpenStreetMap XML extract '
+            '(.osm, .osm.gz, .osm.bz2) or a CSV with name, latitude, longitude and optional kind columns.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('source')
+        parser.add_argument('--output', default=None, help='Where to write the index (default: GEOCODER_INDEX_PATH).')
+
+    def handle(self, *args, **options):
+        output = options['output'] or geocoder.index_path()
+        arrays = geocoder.import_file(options['source'], output)
+        self.stdout.write(
+            f"Indexed {len(arrays['name'])} places ({len(arrays['word'])} name words) into {output}; "
+            f"running workers pick it up on their next search."
+        )
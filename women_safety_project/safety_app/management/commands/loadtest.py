@@ -0,0 +1,128 @@
+import json
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from safety_app import loadgen
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _raise_open_file_limit():
+    """Each virtual user holds a socket; lift the soft limit to the hard one where there is one."""
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+class Command(BaseCommand):
+    help = 'Simulate mobile clients against a running server and report per-endpoint latency and errors.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000/api', help='API root of the server under test.')
+        parser.add_argument('--users', type=int, nargs='+', default=[10],
+                            help='Concurrent users; several values run one stage each, in order.')
+        parser.add_argument('--duration', type=float, default=60.0, help='Measured seconds per stage.')
+        parser.add_argument('--ramp-up', type=float, default=10.0, help='Seconds over which users are started.')
+        parser.add_argument('--location-interval', type=float, default=loadgen.DEFAULT_INTERVALS['location'])
+        parser.add_argument('--alerts-interval', type=float, default=loadgen.DEFAULT_INTERVALS['alerts'])
+        parser.add_argument('--journey-interval', type=float, default=loadgen.DEFAULT_INTERVALS['journey'])
+        parser.add_argument('--voice-interval', type=float, default=loadgen.DEFAULT_INTERVALS['voice'])
+        parser.add_argument('--sos-per-hour', type=float, default=loadgen.DEFAULT_SOS_PER_HOUR,
+                            help='Average SOS triggers per user per hour.')
+        parser.add_argument('--user-prefix', default='loadtest-', help='Usernames are this prefix plus an index.')
+        parser.add_argument('--password', default='Load-test-pass-1')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--label', default='', help='Free-form build label stored in the results.')
+        parser.add_argument('--server-processes', type=int, default=1,
+                            help='Worker processes serving the run, so capacity is reported per process.')
+        parser.add_argument('--output', default='loadtest-results.json', help='Where to write the JSON results.')
+        parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CANDIDATE'),
+                            help='Compare two results files (e.g. WSGI and ASGI) instead of running.')
+        parser.add_argument('--slo-ms', type=float, default=1000.0,
+                            help='p95 every endpoint must stay under for a stage to count as sustained.')
+        parser.add_argument('--max-error-rate', type=float, default=0.01)
+
+    def compare(self, baseline_path, candidate_path, slo_ms, max_error_rate):
+        runs = []
+        for path in (baseline_path, candidate_path):
+            try:
+                with open(path) as f:
+                    runs.append(json.load(f))
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'Cannot read {path}: {exc}')
+        labels = [run['label'] or path for run, path in zip(runs, (baseline_path, candidate_path))]
+        stages = [{stage['users']: stage for stage in run['stages']} for run in runs]
+        for users in sorted(set(stages[0]) | set(stages[1])):
+            line = f'{users:>6} users'
+            for label, by_users in zip(labels, stages):
+                stage = by_users.get(users)
+                if stage is None:
+                    line += f'  | {label}: not run'
+                    continue
+                worst_p95 = max((row['p95_ms'] for row in stage['endpoints'].values()), default=0)
+                line += (f"  | {label}: {stage['throughput_rps']:>8} req/s, worst p95 {worst_p95:>8} ms, "
+                         f"errors {stage['error_rate']:.2%}")
+            self.stdout.write(line)
+        for label, run in zip(labels, runs):
+            self.stdout.write(f'{label}: {loadgen.capacity(run, slo_ms, max_error_rate):g} users per process '
+                              f'within p95 {slo_ms:g} ms and {max_error_rate:.0%} errors')
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            self.compare(*options['compare'], options['slo_ms'], options['max_error_rate'])
+            return
+        _raise_open_file_limit()
+        intervals = {name: options[f'{name}_interval'] for name in loadgen.DEFAULT_INTERVALS}
+        results = {
+            'label': options['label'],
+            'git_revision': _git_revision(),
+            'python': platform.python_version(),
+            'base_url': options['base_url'],
+            'server_processes': options['server_processes'],
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'intervals_s': intervals,
+            'sos_per_hour': options['sos_per_hour'],
+            'stages': [],
+        }
+        for users in options['users']:
+            self.stdout.write(f'{users} users: ramping up over {options["ramp_up"]}s, '
+                              f'measuring for {options["duration"]}s...')
+            stage = loadgen.run_stage(
+                users, options['duration'],
+                ramp_up=options['ramp_up'],
+                base_url=options['base_url'],
+                password=options['password'],
+                user_prefix=options['user_prefix'],
+                intervals=intervals,
+                sos_per_hour=options['sos_per_hour'],
+                seed=options['seed'],
+            )
+            results['stages'].append(stage)
+            self.stdout.write(
+                f"  {stage['throughput_rps']} req/s, {stage['requests']} requests, "
+                f"error rate {stage['error_rate']:.2%}"
+            )
+            for endpoint, row in stage['endpoints'].items():
+                self.stdout.write(
+                    f"  {endpoint:<16} p50 {row['p50_ms']:>7} ms  p95 {row['p95_ms']:>7} ms  "
+                    f"p99 {row['p99_ms']:>7} ms  errors {row['errors']}"
+                )
+            for error in stage['sign_in_errors']:
+                self.stderr.write(f'  {error}')
+
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from safety_app import retention
+
+
+class Command(BaseCommand):
+    help = 'Move SOS logs, journeys and incidents past their retention into the compressed archive.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Rows per delete transaction (default: RETENTION_BATCH_SIZE).')
+        parser.add_argument('--model', choices=sorted(retention.POLICIES), default=None,
+                            help='Only purge this model.')
+
+    def handle(self, *args, **options):
+        days = getattr(settings, 'RETENTION_DAYS', {})
+        name = options['model']
+        if name is None:
+            moved = retention.purge_all(batch_size=options['batch_size'])
+        elif days.get(name) is None:
+            raise CommandError(f'RETENTION_DAYS sets no retention for {name}')
+        else:
+            moved = {name: retention.purge(retention.POLICIES[name], days[name], batch_size=options['batch_size'])}
+        for name, count in sorted(moved.items()):
+            self.stdout.write(f'{name}: archived {count} rows older than {days[name]} days')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from safety_app.journeys import JourneyScheduler
+
+
+class Command(BaseCommand):
+    help = 'Expire overdue Safe Walk journeys and fire their auto_journey SOS until interrupted.'
+
+    def handle(self, *args, **options):
+        scheduler = JourneyScheduler()
+        self.stdout.write(f'Journey scheduler running (grace {scheduler.grace}s, resync {scheduler.resync}s).')
+        try:
+            scheduler.run_forever()
+        except KeyboardInterrupt:
+            scheduler.stop()
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from safety_app.outbox import Dispatcher
+
+
+class Command(BaseCommand):
+    help = 'Drain the notification outbox until interrupted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Concurrent senders (default: OUTBOX_WORKERS).')
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds between scans for due rows.')
+
+    def handle(self, *args, **options):
+        dispatcher = Dispatcher(workers=options['workers'], poll_interval=options['poll'])
+        self.stdout.write(f'Outbox dispatcher running with {dispatcher.workers} workers.')
+        try:
+            dispatcher.run_forever()
+        except KeyboardInterrupt:
+            dispatcher.stop()
@@ -0,0 +1,39 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from safety_app import retention
+
+
+class Command(BaseCommand):
+    help = 'Print archived rows of one model as NDJSON, filtered by user and time range.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=sorted(retention.POLICIES))
+        parser.add_argument('--user', help='Username or user id.')
+        parser.add_argument('--since', help='ISO 8601 datetime with offset (inclusive).')
+        parser.add_argument('--until', help='ISO 8601 datetime with offset (exclusive).')
+
+    def _when(self, value):
+        if value is None:
+            return None
+        when = parse_datetime(value)
+        if when is None or when.tzinfo is None:
+            raise CommandError(f'Not an ISO 8601 datetime with offset: {value}')
+        return when
+
+    def handle(self, *args, **options):
+        user_id = None
+        if options['user']:
+            if options['user'].isdigit():
+                user_id = int(options['user'])
+            else:
+                user_id = User.objects.filter(username=options['user']).values_list('id', flat=True).first()
+                if user_id is None:
+                    raise CommandError(f"No user {options['user']!r}")
+        rows = retention.search(options['model'], user_id=user_id,
+                                start=self._when(options['since']), end=self._when(options['until']))
+        for row in rows:
+            self.stdout.write(json.dumps(row))
@@ -0,0 +1,313 @@
+"""
+Prometheus metrics.
+
+Each process keeps its counters, gauges and histograms in plain dicts behind
+one uncontended lock; recording a sample never touches the disk or another
+process. A timer thread flushes the process's values at most once per
+METRICS_FLUSH_SECONDS to its own file in METRICS_DIR (written beside the
+target and os.replace()d into place). The /metrics view sums every
+process's file, so web workers, `run_outbox` and `run_journey_scheduler`
+all report through whichever worker is scraped.
+
+Files of exited processes are kept so counters stay monotonic, until they
+are older than METRICS_RETENTION_SECONDS; their gauges stop counting once
+they are older than GAUGE_STALE_SECONDS. Gauges that describe the database
+(active journeys, active SOS users) are read at scrape time.
+"""
+import atexit
+import bisect
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.utils.decorators import sync_and_async_middleware
+
+from .models import JourneyTracker, Profile
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+QUERY_TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+GAUGE_STALE_SECONDS = 300
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    'raksha_http_requests_total': ('counter', 'Requests served, by URL name, method and status.', None),
+    'raksha_http_request_duration_seconds': ('histogram', 'Time to produce a response, by URL name.', LATENCY_BUCKETS),
+    'raksha_http_requests_in_flight': ('gauge', 'Requests currently being handled.', None),
+    'raksha_db_queries_per_request': ('histogram', 'SQL statements issued per request, by URL name.',
+                                      QUERY_COUNT_BUCKETS),
+    'raksha_db_time_per_request_seconds': ('histogram', 'Time spent in SQL per request, by URL name.',
+                                           QUERY_TIME_BUCKETS),
+    'raksha_sos_events_total': ('counter', 'SOS log entries committed, by action.', None),
+    'raksha_notifications_total': ('counter', 'Outbox delivery attempts, by channel and outcome.', None),
+    'raksha_location_batch_fixes': ('histogram', 'Location fixes committed per writer batch.', BATCH_SIZE_BUCKETS),
+    'raksha_active_journeys': ('gauge', 'Safe Walk journeys currently active.', None),
+    'raksha_active_sos_users': ('gauge', 'Users with a live SOS.', None),
+}
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+# (name, labels) -> [per-bucket counts..., +Inf count, sum]
+_histograms = {}
+_flush_timer = None
+_process_file = None
+
+
+def metrics_dir():
+    return str(getattr(settings, 'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'raksha_metrics')))
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    with _lock:
+        key = _key(name, labels)
+        _counters[key] = _counters.get(key, 0) + value
+    _schedule_flush()
+
+
+def add_gauge(name, value, **labels):
+    with _lock:
+        key = _key(name, labels)
+        _gauges[key] = _gauges.get(key, 0) + value
+    _schedule_flush()
+
+
+def observe(name, value, **labels):
+    buckets = METRICS[name][2]
+    with _lock:
+        key = _key(name, labels)
+        row = _histograms.get(key)
+        if row is None:
+            row = _histograms[key] = [0] * (len(buckets) + 2)
+        row[bisect.bisect_left(buckets, value)] += 1
+        row[-1] += value
+    _schedule_flush()
+
+
+# ─── Per-process files ───────────────────────────────────────────────────────
+
+def _schedule_flush():
+    global _flush_timer
+    if _flush_timer is not None:
+        return
+    with _lock:
+        if _flush_timer is not None:
+            return
+        _flush_timer = threading.Timer(getattr(settings, 'METRICS_FLUSH_SECONDS', 1.0), flush)
+        _flush_timer.daemon = True
+        _flush_timer.start()
+
+
+def _snapshot():
+    return {
+        'counters': [[name, dict(labels), value] for (name, labels), value in _counters.items()],
+        'gauges': [[name, dict(labels), value] for (name, labels), value in _gauges.items()],
+        'histograms': [[name, dict(labels), list(row)] for (name, labels), row in _histograms.items()],
+    }
+
+
+def flush():
+    """Write this process's current values to its file in METRICS_DIR."""
+    global _flush_timer, _process_file
+    with _lock:
+        _flush_timer = None
+        data = _snapshot()
+        if _process_file is None:
+            # Fixed for the life of the process, and unique to it so a
+            # recycled pid never overwrites an exited process's counters.
+            _process_file = os.path.join(metrics_dir(), f'{os.getpid()}-{uuid.uuid4().hex[:8]}.json')
+        path = _process_file
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix='.metrics-', dir=directory)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+    except OSError:
+        logger.warning('Could not flush metrics to %s', directory, exc_info=True)
+
+
+atexit.register(flush)
+
+
+def _read_all():
+    """Every process's values, summed: (counters, gauges, histograms) keyed like the in-process dicts."""
+    counters, gauges, histograms = {}, {}, {}
+    directory = metrics_dir()
+    now = time.time()
+    retention = getattr(settings, 'METRICS_RETENTION_SECONDS', 7 * 24 * 3600)
+    try:
+        names = [name for name in os.listdir(directory) if name.endswith('.json')]
+    except FileNotFoundError:
+        names = []
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            age = now - os.stat(path).st_mtime
+            if age > retention:
+                os.unlink(path)
+                continue
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for metric, labels, value in data['counters']:
+            key = _key(metric, labels)
+            counters[key] = counters.get(key, 0) + value
+        if age <= GAUGE_STALE_SECONDS:
+            for metric, labels, value in data['gauges']:
+                key = _key(metric, labels)
+                gauges[key] = gauges.get(key, 0) + value
+        for metric, labels, row in data['histograms']:
+            key = _key(metric, labels)
+            if key in histograms and len(histograms[key]) == len(row):
+                histograms[key] = [a + b for a, b in zip(histograms[key], row)]
+            else:
+                histograms[key] = row
+    return counters, gauges, histograms
+
+
+# ─── Exposition ──────────────────────────────────────────────────────────────
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, extra=()):
+    pairs = [f'{k}="{_escape(v)}"' for k, v in list(labels) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def database_gauges():
+    return {
+        _key('raksha_active_journeys', {}): JourneyTracker.objects.filter(status='active').count(),
+        _key('raksha_active_sos_users', {}): Profile.objects.filter(is_sos_active=True).count(),
+    }
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    flush()
+    counters, gauges, histograms = _read_all()
+    gauges.update(database_gauges())
+    series = {**counters, **gauges}
+
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'histogram':
+            for (metric, labels), row in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(buckets) + ['+Inf'], row[:-1]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(labels, [("le", bound)])} {cumulative}')
+                lines.append(f'{name}_sum{_labels(labels)} {_number(row[-1])}')
+                lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+        else:
+            for (metric, labels), value in sorted(series.items()):
+                if metric == name:
+                    lines.append(f'{name}{_labels(labels)} {_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+# ─── Request middleware ──────────────────────────────────────────────────────
+
+class QueryTimer:
+    """execute_wrapper that counts statements and the time spent in them."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+def _record(request, status, elapsed, queries):
+    match = getattr(request, 'resolver_match', None)
+    # Raw paths would make one series per URL; unresolved requests share one.
+    view = match.view_name if match else 'unresolved'
+    inc('raksha_http_requests_total', view=view, method=request.method, status=str(status))
+    observe('raksha_http_request_duration_seconds', elapsed, view=view)
+    observe('raksha_db_queries_per_request', queries.count, view=view)
+    observe('raksha_db_time_per_request_seconds', queries.seconds, view=view)
+
+
+def _time_queries(queries):
+    """Wrap this thread's connections with ``queries``; close the returned stack to unwrap."""
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(queries))
+    return stack
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """
+    Latency, status, in-flight count and SQL count and time for every request.
+    An async view's ORM calls run on its request's thread-sensitive thread,
+    so that thread's connections are the ones wrapped.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            add_gauge('raksha_http_requests_in_flight', 1)
+            started = time.perf_counter()
+            status = 500
+            queries = QueryTimer()
+            try:
+                stack = await sync_to_async(_time_queries)(queries)
+                try:
+                    response = await get_response(request)
+                finally:
+                    await sync_to_async(stack.close)()
+                status = response.status_code
+                return response
+            finally:
+                add_gauge('raksha_http_requests_in_flight', -1)
+                _record(request, status, time.perf_counter() - started, queries)
+
+        return middleware
+
+    def middleware(request):
+        add_gauge('raksha_http_requests_in_flight', 1)
+        started = time.perf_counter()
+        status = 500
+        queries = QueryTimer()
+        try:
+            with _time_queries(queries):
+                response = get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            add_gauge('raksha_http_requests_in_flight', -1)
+            _record(request, status, time.perf_counter() - started, queries)
+
+    return middleware
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:29
+
+from django.db import migrations, models
+
+from safety_app import geohash
+
+
+def backfill_geohash(apps, schema_editor):
+    UserLocation = apps.get_model("safety_app", "UserLocation")
+    located = UserLocation.objects.filter(
+        latitude__isnull=False, longitude__isnull=False
+    )
+    for loc in located.iterator():
+        loc.geohash = geohash.encode(loc.latitude, loc.longitude)
+        loc.save(update_fields=["geohash"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("safety_app", "0004_incidentreport_journeytracker_soslog"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="userlocation",
+            name="geohash",
+            field=models.CharField(blank=True, db_index=True, max_length=12),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
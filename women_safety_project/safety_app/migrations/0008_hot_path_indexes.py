@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("safety_app", "0007_location_history"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="userlocation",
+            name="geohash",
+            field=models.CharField(blank=True, max_length=12),
+        ),
+        migrations.AddIndex(
+            model_name="incidentreport",
+            index=models.Index(
+                fields=["-reported_at", "-id"], name="incident_recent_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="journeytracker",
+            index=models.Index(
+                condition=models.Q(("status", "active")),
+                fields=["user", "-started_at"],
+                name="journey_active_user_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="profile",
+            index=models.Index(
+                condition=models.Q(("is_sos_active", True)),
+                fields=["user"],
+                name="profile_sos_active_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="soslog",
+            index=models.Index(
+                fields=["user", "-timestamp", "-id"], name="soslog_user_time_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="userlocation",
+            index=models.Index(
+                fields=["geohash", "last_updated"], name="userlocation_cell_time_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("safety_app", "0008_hot_path_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="journeytracker",
+            name="destination_lat",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="journeytracker",
+            name="destination_lon",
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
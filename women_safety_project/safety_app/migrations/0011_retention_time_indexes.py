@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("safety_app", "0010_region_shard_user_keys"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="journeytracker",
+            index=models.Index(fields=["started_at", "id"], name="journey_started_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="soslog",
+            index=models.Index(fields=["timestamp", "id"], name="soslog_time_idx"),
+        ),
+    ]
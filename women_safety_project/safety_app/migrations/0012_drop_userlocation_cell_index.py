@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:44
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("safety_app", "0011_retention_time_indexes"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="userlocation",
+            name="userlocation_cell_time_idx",
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:57
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("safety_app", "0013_trustedcontact_account"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="userlocation",
+            name="geohash",
+        ),
+    ]
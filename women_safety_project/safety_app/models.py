@@ -1,5 +1,8 @@
+from datetime import timedelta
+
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -8,6 +11,11 @@ class TrustedContact(models.Model):
     name = models.CharField(max_length=100)
     email = models.EmailField()
     phone_number = models.CharField(max_length=20)
+    # The contact's own Raksha account, if the user named one. Trails are only
+    # shared with this account -- an email address alone proves nothing.
+    account = models.ForeignKey(
+        User, null=True, blank=True, on_delete=models.SET_NULL, related_name='contact_of'
+    )
 
     def __str__(self):
         return self.name
@@ -19,11 +27,18 @@ class Profile(models.Model):
     is_sos_active = models.BooleanField(default=False)
     phone = models.CharField(max_length=15, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # Only a handful of users have a live SOS at any moment.
+            models.Index(fields=['user'], condition=models.Q(is_sos_active=True), name='profile_sos_active_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username}'s Profile"
 
 class UserLocation(models.Model):
-    user = models.OneToOneField(User, on_delete=models.CASCADE)
+    # Sharded by region (safety_app.regions): the user row may be in another database.
+    user = models.OneToOneField(User, on_delete=models.CASCADE, db_constraint=False)
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
     last_updated = models.DateTimeField(auto_now=True)
@@ -32,6 +47,40 @@ class UserLocation(models.Model):
         return f"{self.user.username}'s Location"
 
 
+class LocationPoint(models.Model):
+    """Append-only raw GPS fix; packed into a LocationTrail once its day is compacted."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='location_points', db_constraint=False)
+    recorded_at = models.DateTimeField()
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+
+    class Meta:
+        ordering = ['recorded_at']
+        indexes = [
+            models.Index(fields=['user', 'recorded_at'], name='locationpoint_user_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} @ {self.recorded_at:%Y-%m-%d %H:%M:%S}"
+
+
+class LocationTrail(models.Model):
+    """One user's simplified track for one UTC day, packed by safety_app.history."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='location_trails', db_constraint=False)
+    day = models.DateField()
+    points = models.BinaryField()
+    point_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['day']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='unique_trail_per_user_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}'s trail for {self.day}"
+
+
 class SOSLog(models.Model):
     ACTION_CHOICES = [
         ('triggered', 'SOS Triggered'),
@@ -51,6 +100,11 @@ class SOSLog(models.Model):
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['user', '-timestamp', '-id'], name='soslog_user_time_idx'),
+            # Retention purges oldest-first across all users.
+            models.Index(fields=['timestamp', 'id'], name='soslog_time_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} — {self.action} @ {self.timestamp:%Y-%m-%d %H:%M}"
@@ -65,16 +119,31 @@ class JourneyTracker(models.Model):
     ]
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='journeys')
     destination = models.CharField(max_length=200)
+    # Set when the destination was picked from place search.
+    destination_lat = models.FloatField(null=True, blank=True)
+    destination_lon = models.FloatField(null=True, blank=True)
     eta_minutes = models.PositiveIntegerField()
     started_at = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='active')
 
     class Meta:
         ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['user', '-started_at'], condition=models.Q(status='active'),
+                         name='journey_active_user_idx'),
+            models.Index(fields=['started_at', 'id'], name='journey_started_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} → {self.destination} ({self.status})"
 
+    @property
+    def deadline(self):
+        return self.started_at + timedelta(minutes=self.eta_minutes)
+
+    def remaining_seconds(self, now=None):
+        return (self.deadline - (now or timezone.now())).total_seconds()
+
 
 class IncidentReport(models.Model):
     SEVERITY_CHOICES = [
@@ -82,7 +151,7 @@ class IncidentReport(models.Model):
         ('medium', 'Medium — Harassment / Threat'),
         ('high', 'High — Physical danger'),
     ]
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='incident_reports')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='incident_reports', db_constraint=False)
     latitude = models.FloatField()
     longitude = models.FloatField()
     description = models.TextField(max_length=500)
@@ -91,6 +160,54 @@ class IncidentReport(models.Model):
 
     class Meta:
         ordering = ['-reported_at']
+        indexes = [
+            models.Index(fields=['-reported_at', '-id'], name='incident_recent_idx'),
+        ]
 
     def __str__(self):
         return f"{self.severity.upper()} incident by {self.user.username} @ {self.reported_at:%Y-%m-%d %H:%M}"
+
+
+class Notification(models.Model):
+    """Outbox row: one message to one trusted contact, drained by safety_app.outbox."""
+    PRIORITY_DURESS = 0
+    PRIORITY_SOS = 1
+    PRIORITY_SAFE = 2
+    PRIORITY_CHOICES = [
+        (PRIORITY_DURESS, 'Duress'),
+        (PRIORITY_SOS, 'SOS'),
+        (PRIORITY_SAFE, 'Safe update'),
+    ]
+    CHANNEL_CHOICES = [
+        ('email', 'Email'),
+        ('sms', 'SMS'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
+    sos_log = models.ForeignKey(SOSLog, on_delete=models.SET_NULL, null=True, blank=True, related_name='notifications')
+    priority = models.PositiveSmallIntegerField(choices=PRIORITY_CHOICES)
+    channel = models.CharField(max_length=10, choices=CHANNEL_CHOICES)
+    recipient = models.CharField(max_length=254)
+    recipient_name = models.CharField(max_length=100, blank=True)
+    subject = models.CharField(max_length=200, blank=True)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.CharField(max_length=200, blank=True)
+
+    class Meta:
+        ordering = ['priority', 'next_attempt_at']
+        indexes = [
+            models.Index(fields=['status', 'priority', 'next_attempt_at'], name='notification_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_channel_display()} to {self.recipient} ({self.status})"
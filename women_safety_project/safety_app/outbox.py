@@ -0,0 +1,195 @@
+"""
+Durable notification outbox.
+
+SOS views write Notification rows in the same transaction as their SOSLog
+entry and return immediately. A Dispatcher drains the table on a thread
+pool: rows are claimed strictly by priority (duress, then SOS, then "safe"
+updates) and only as many as there are idle workers, so an urgent message
+never waits behind a backlog of low-priority ones. Failed sends are retried
+with exponential backoff until OUTBOX_MAX_ATTEMPTS.
+
+Run one dispatcher per deployment with ``manage.py run_outbox``; it also
+sends rows left by a crash. OUTBOX_AUTOSTART (off by default) starts one in
+every process that loads the app instead, which suits a single development
+server (see SafetyAppConfig.ready). Claims are conditional updates, so two
+dispatchers never hold the same row, but each one adds a pool of threads
+polling the table.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import metrics
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+# A claimed row whose worker died is picked up again after this long.
+CLAIM_LEASE = timedelta(seconds=60)
+
+
+def enqueue(user, contacts, priority, subject, body, channels=('email', 'sms'), sos_log=None):
+    """Queue one message per contact and channel; dispatch starts after commit."""
+    rows = []
+    for contact in contacts:
+        for channel in channels:
+            recipient = contact.email if channel == 'email' else contact.phone_number
+            if not recipient:
+                continue
+            rows.append(Notification(
+                user=user,
+                sos_log=sos_log,
+                priority=priority,
+                channel=channel,
+                recipient=recipient,
+                recipient_name=contact.name,
+                subject=subject,
+                body=body,
+            ))
+    Notification.objects.bulk_create(rows)
+    if rows:
+        transaction.on_commit(wake)
+    return len(rows)
+
+
+def send_sms(notification):
+    """Mock SMS gateway."""
+    print(f"📡 [SMS GATEWAY]: Sending to +{notification.recipient} ({notification.recipient_name})...")
+    time.sleep(0.3)
+    print(f"✅  SMS DELIVERED to {notification.recipient_name}")
+
+
+def deliver(notification):
+    if notification.channel == 'email':
+        send_mail(notification.subject, notification.body, settings.DEFAULT_FROM_EMAIL, [notification.recipient])
+    else:
+        send_sms(notification)
+
+
+def backoff(attempts):
+    base = getattr(settings, 'OUTBOX_BACKOFF_SECONDS', 5)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), 3600))
+
+
+class Dispatcher:
+    """Claims due outbox rows in priority order and sends them on a worker pool."""
+
+    def __init__(self, workers=None, poll_interval=5.0):
+        self.workers = workers or getattr(settings, 'OUTBOX_WORKERS', 4)
+        self.max_attempts = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 5)
+        self.poll_interval = poll_interval
+        self._idle = threading.Semaphore(self.workers)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._pool = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Run the claim loop on a daemon thread (idempotent)."""
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run_forever, name='outbox-dispatcher', daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def run_forever(self):
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='outbox')
+        try:
+            while not self._stop.is_set():
+                self._wake.clear()
+                try:
+                    self.dispatch_due()
+                except Exception:
+                    # e.g. "database is locked"; the rows are still there next pass.
+                    logger.exception('Outbox scan failed')
+                finally:
+                    close_old_connections()
+                self._wake.wait(self.poll_interval)
+        finally:
+            self._pool.shutdown(wait=True)
+
+    def dispatch_due(self):
+        """Hand due rows to idle workers, most urgent first. Returns the number dispatched."""
+        dispatched = 0
+        while self._idle.acquire(blocking=False):
+            notification = self.claim_next()
+            if notification is None:
+                self._idle.release()
+                break
+            self._pool.submit(self._run, notification)
+            dispatched += 1
+        return dispatched
+
+    def claim_next(self):
+        """Atomically move the most urgent due row to 'sending', or return None."""
+        now = timezone.now()
+        due = Notification.objects.filter(
+            Q(status='pending') | Q(status='sending'),
+            next_attempt_at__lte=now,
+        ).order_by('priority', 'next_attempt_at', 'id')
+        for notification in due[:self.workers]:
+            claimed = Notification.objects.filter(
+                id=notification.id,
+                status=notification.status,
+                attempts=notification.attempts,
+            ).update(status='sending', attempts=F('attempts') + 1, next_attempt_at=now + CLAIM_LEASE)
+            if claimed:
+                notification.status = 'sending'
+                notification.attempts += 1
+                return notification
+        return None
+
+    def send(self, notification):
+        """Deliver one claimed row and record the outcome."""
+        try:
+            deliver(notification)
+        except Exception as exc:
+            failed = notification.attempts >= self.max_attempts
+            Notification.objects.filter(id=notification.id).update(
+                status='failed' if failed else 'pending',
+                next_attempt_at=timezone.now() + backoff(notification.attempts),
+                last_error=str(exc)[:200],
+            )
+            metrics.inc('raksha_notifications_total', channel=notification.channel,
+                        outcome='failed' if failed else 'retry')
+            return False
+        Notification.objects.filter(id=notification.id).update(status='sent', sent_at=timezone.now())
+        metrics.inc('raksha_notifications_total', channel=notification.channel, outcome='sent')
+        return True
+
+    def _run(self, notification):
+        try:
+            self.send(notification)
+        except Exception:
+            # Outcome not recorded; the claim lease expires and the row is retried.
+            logger.exception('Outbox delivery bookkeeping failed for %s', notification.id)
+        finally:
+            close_old_connections()
+            self._idle.release()
+            # A worker is free again; look for the next due row.
+            self._wake.set()
+
+
+dispatcher = Dispatcher()
+
+
+def wake():
+    """Prod the in-process dispatcher, starting it first if OUTBOX_AUTOSTART is on."""
+    if getattr(settings, 'OUTBOX_AUTOSTART', False):
+        dispatcher.start()
+    dispatcher.wake()
@@ -0,0 +1,112 @@
+"""
+Keyset (cursor) pagination.
+
+Each page is read with ``WHERE (key, id) < (last key, last id) ORDER BY
+key, id LIMIT n + 1``, so a page costs the same however deep into the
+history it is and nothing beyond it is loaded. The cursor is the last
+row's (key, id), base64-encoded; clients pass it back unchanged.
+
+A page spread over several databases (region shards) reads n + 1 rows from
+each and merges them, which keeps the same order and cursor.
+"""
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+
+
+class Page:
+    def __init__(self, items, next_cursor, next_url=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.next_url = next_url
+
+
+def _key_fields(ordering):
+    field = ordering.lstrip('-')
+    # id breaks ties so rows sharing a timestamp are neither skipped nor repeated.
+    return [field] if field == 'id' else [field, 'id']
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, model, fields):
+    """Decode and type-check a cursor against the key fields. Raises ValueError."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError('Malformed cursor')
+    if not isinstance(values, list) or len(values) != len(fields):
+        raise ValueError('Malformed cursor')
+    try:
+        return [model._meta.get_field(f).to_python(v) for f, v in zip(fields, values)]
+    except (ValidationError, TypeError):
+        raise ValueError('Malformed cursor')
+
+
+def _json_value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def _after(fields, values, descending):
+    op = 'lt' if descending else 'gt'
+    *ties, last = fields
+    condition = Q(**{f'{last}__{op}': values[-1]})
+    for field, value in reversed(list(zip(ties, values))):
+        condition = Q(**{f'{field}__{op}': value}) | (Q(**{field: value}) & condition)
+    return condition
+
+
+def page_size_from(value, default=DEFAULT_PAGE_SIZE):
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return min(max(size, 1), MAX_PAGE_SIZE)
+
+
+def paginate(queryset, ordering, cursor=None, page_size=DEFAULT_PAGE_SIZE, using=None):
+    """
+    One page of queryset ordered by ``ordering`` (e.g. '-timestamp'), merged
+    across the ``using`` aliases when given. Raises ValueError on a bad cursor.
+    """
+    descending = ordering.startswith('-')
+    fields = _key_fields(ordering)
+    queryset = queryset.order_by(*[('-' if descending else '') + f for f in fields])
+    if cursor:
+        queryset = queryset.filter(_after(fields, decode_cursor(cursor, queryset.model, fields), descending))
+
+    if using is None:
+        rows = list(queryset[:page_size + 1])
+    else:
+        rows = [row for alias in using for row in queryset.using(alias)[:page_size + 1]]
+        rows.sort(key=lambda row: [getattr(row, f) for f in fields], reverse=descending)
+        rows = rows[:page_size + 1]
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor([_json_value(getattr(last, f)) for f in fields])
+    return Page(rows, next_cursor)
+
+
+def paginate_request(request, queryset, ordering, using=None):
+    """paginate() driven by ?cursor= and ?page_size=, with a link to the next page."""
+    page = paginate(
+        queryset, ordering,
+        cursor=request.GET.get('cursor'),
+        page_size=page_size_from(request.GET.get('page_size')),
+        using=using,
+    )
+    if page.next_cursor:
+        params = request.GET.copy()
+        params['cursor'] = page.next_cursor
+        page.next_url = request.build_absolute_uri('?' + params.urlencode())
+    return page
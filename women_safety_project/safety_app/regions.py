@@ -0,0 +1,201 @@
+"""
+Region shards.
+
+With REGION_SHARDS set, location data is split across one database per
+region instead of living in ``default``: UserLocation, IncidentReport and
+the location history (LocationPoint, LocationTrail). A row belongs to the
+shard of the longest geohash prefix in REGION_SHARDS that its coordinates
+fall in, and to ``default`` when none matches::
+
+    REGION_SHARDS = {'tun': 'kolkata', 'ttn': 'delhi'}
+
+Every shard is an ordinary DATABASES alias; ``migrate --database=<alias>``
+creates only the sharded tables there (RegionRouter.allow_migrate). Users,
+profiles, contacts, SOS logs and journeys stay in ``default``, so the
+sharded tables' user foreign keys are not enforced by the database.
+
+Queries that know where they are (a fix being written, incidents around a
+point or in a viewport) go to the shards covering that area, normally one.
+The rest fan out: a user's own location is looked up in the shard they were
+last seen in first, and their trail is read from every shard. SQLite admits
+one writer per database file, so each shard brings its own write lock.
+With REGION_SHARDS empty everything is in ``default`` and nothing fans out.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+from . import geodesy, geohash
+
+SHARDED_MODELS = {
+    'safety_app.userlocation',
+    'safety_app.incidentreport',
+    'safety_app.locationpoint',
+    'safety_app.locationtrail',
+}
+# Above this many covering cells a box is treated as touching every shard.
+MAX_BOX_CELLS = 4096
+
+
+def shard_map():
+    return getattr(settings, 'REGION_SHARDS', None) or {}
+
+
+def all_shards():
+    """Every alias holding sharded rows, ``default`` first."""
+    return list(dict.fromkeys([DEFAULT_DB_ALIAS, *shard_map().values()]))
+
+
+def is_sharded(model):
+    return model._meta.label_lower in SHARDED_MODELS
+
+
+def _precision():
+    return max(len(prefix) for prefix in shard_map())
+
+
+def shard_for_cell(cell):
+    """The alias owning a geohash cell at least as long as every prefix."""
+    shards = shard_map()
+    for length in range(min(len(cell), _precision()), 0, -1):
+        if cell[:length] in shards:
+            return shards[cell[:length]]
+    return DEFAULT_DB_ALIAS
+
+
+def shard_for(lat, lon):
+    """The alias that stores a row at (lat, lon)."""
+    if not shard_map() or lat is None or lon is None:
+        return DEFAULT_DB_ALIAS
+    return shard_for_cell(geohash.encode(lat, lon, _precision()))
+
+
+def shards_for_box(south, west, north, east):
+    """Aliases whose regions overlap a lat/lon box; west > east crosses the antimeridian."""
+    if not shard_map():
+        return [DEFAULT_DB_ALIAS]
+    if east < west:
+        east += 360.0
+    precision = _precision()
+    lat_deg, lon_deg = geohash.cell_size(precision)
+    if ((north - south) / lat_deg + 1) * ((east - west) / lon_deg + 1) > MAX_BOX_CELLS:
+        return all_shards()
+    found = {shard_for_cell(cell) for cell in geohash.box_cells(south, west, north, east, precision)}
+    return [alias for alias in all_shards() if alias in found]
+
+
+def shards_near(lat, lon, radius_km):
+    min_lat, max_lat, min_lon, max_lon = geodesy.bounding_box(lat, lon, radius_km)
+    return shards_for_box(min_lat, min_lon, max_lat, max_lon)
+
+
+def fan_out(queryset, shards=None):
+    """Rows of ``queryset`` from each shard in turn (every shard by default)."""
+    for alias in shards or all_shards():
+        yield from queryset.using(alias)
+
+
+def group_by_shard(rows):
+    """{alias: [rows]} for model instances with latitude/longitude."""
+    groups = {}
+    for row in rows:
+        groups.setdefault(shard_for(row.latitude, row.longitude), []).append(row)
+    return groups
+
+
+# ─── Users' current shard ────────────────────────────────────────────────────
+
+def _hint_key(user_id):
+    return f'region:{user_id}'
+
+
+def remember(user_id, alias):
+    """Note the shard now holding the user's location (a hint; lookups verify it)."""
+    if shard_map():
+        caches['user_state'].set(_hint_key(user_id), alias, None)
+
+
+def user_location(user_id):
+    """The user's UserLocation from whichever shard holds it, or None."""
+    from .models import UserLocation
+
+    shards = all_shards()
+    hint = caches['user_state'].get(_hint_key(user_id)) if len(shards) > 1 else None
+    if hint in shards:
+        shards.remove(hint)
+        shards.insert(0, hint)
+    for alias in shards:
+        try:
+            location = UserLocation.objects.using(alias).get(user_id=user_id)
+        except UserLocation.DoesNotExist:
+            continue
+        if alias != hint:
+            remember(user_id, alias)
+        return location
+    return None
+
+
+async def auser_location(user_id):
+    """user_location() for async views."""
+    from .models import UserLocation
+
+    shards = all_shards()
+    hint = await caches['user_state'].aget(_hint_key(user_id)) if len(shards) > 1 else None
+    if hint in shards:
+        shards.remove(hint)
+        shards.insert(0, hint)
+    for alias in shards:
+        try:
+            location = await UserLocation.objects.using(alias).aget(user_id=user_id)
+        except UserLocation.DoesNotExist:
+            continue
+        if alias != hint and shard_map():
+            await caches['user_state'].aset(_hint_key(user_id), alias, None)
+        return location
+    return None
+
+
+def forget_elsewhere(model, user_id, alias):
+    """Delete the user's ``model`` rows from every shard but ``alias``."""
+    for other in all_shards():
+        if other != alias:
+            model.objects.using(other).filter(user_id=user_id).delete()
+
+
+# ─── Router ──────────────────────────────────────────────────────────────────
+
+class RegionRouter:
+    """
+    Sends sharded models to the shard of their coordinates and everything
+    else to ``default``. Queries with no instance to go by use ``default``
+    unless they pick a shard with .using().
+    """
+
+    def db_for_read(self, model, **hints):
+        if not is_sharded(model):
+            # Never follow a sharded instance's relation (e.g. location.user) into its shard.
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if instance is not None and is_sharded(instance) and instance._state.db:
+            return instance._state.db
+        return None
+
+    def db_for_write(self, model, **hints):
+        if not is_sharded(model):
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if instance is None or not is_sharded(instance):
+            return None
+        if instance._state.db:
+            return instance._state.db
+        return shard_for(getattr(instance, 'latitude', None), getattr(instance, 'longitude', None))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if is_sharded(obj1) or is_sharded(obj2):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == DEFAULT_DB_ALIAS:
+            return None
+        return f'{app_label}.{model_name}' in SHARDED_MODELS
@@ -0,0 +1,143 @@
+"""
+Retention for SOS logs, journeys and incident reports.
+
+Rows older than RETENTION_DAYS[model] are appended to a cold archive and
+then deleted, so the tables the app queries only hold the live window.
+
+The archive is append-only gzip NDJSON, one file per model and UTC month
+(``<dir>/<model>/<YYYY-MM>.ndjson.gz``; rows from a region shard go to
+``<YYYY-MM>.<alias>.ndjson.gz``). Each batch is written as its own gzip
+member, synced to disk, and only then deleted, so a crash can repeat rows
+in the archive but never lose them. search() drops the repeats.
+
+Batches are RETENTION_BATCH_SIZE rows, each deleted in its own short
+transaction with a pause between, so the SQLite write lock is only ever
+held for one batch and request writers get in between.
+"""
+import gzip
+import json
+import os
+import time
+from datetime import timedelta, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import regions
+from .models import IncidentReport, JourneyTracker, SOSLog
+
+
+class Policy:
+    def __init__(self, model, time_field, keep=None):
+        self.model = model
+        self.time_field = time_field
+        # Rows never purged however old, e.g. a journey still in progress.
+        self.keep = keep
+        self.fields = [field.attname for field in model._meta.concrete_fields]
+
+    @property
+    def name(self):
+        return self.model._meta.model_name
+
+    def expired(self, cutoff):
+        queryset = self.model.objects.filter(**{f'{self.time_field}__lt': cutoff})
+        return queryset.exclude(self.keep) if self.keep is not None else queryset
+
+
+POLICIES = {policy.name: policy for policy in [
+    Policy(SOSLog, 'timestamp'),
+    Policy(JourneyTracker, 'started_at', keep=Q(status='active')),
+    Policy(IncidentReport, 'reported_at'),
+]}
+
+
+def archive_dir():
+    return Path(getattr(settings, 'RETENTION_ARCHIVE_DIR', Path(settings.BASE_DIR) / 'archive'))
+
+
+def _month(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y-%m')
+
+
+def archive_path(policy, month, alias=DEFAULT_DB_ALIAS):
+    suffix = '' if alias == DEFAULT_DB_ALIAS else f'.{alias}'
+    return archive_dir() / policy.name / f'{month}{suffix}.ndjson.gz'
+
+
+def append(policy, rows, alias=DEFAULT_DB_ALIAS):
+    """Append value dicts to their months' archives, durably."""
+    by_month = {}
+    for row in rows:
+        by_month.setdefault(_month(row[policy.time_field]), []).append(row)
+    for month, month_rows in by_month.items():
+        path = archive_path(policy, month, alias)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'ab') as f:
+            with gzip.GzipFile(fileobj=f, mode='wb') as gz:
+                for row in month_rows:
+                    gz.write((json.dumps(row, cls=DjangoJSONEncoder) + '\n').encode())
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def purge(policy, days, batch_size=None, pause=None, now=None):
+    """Archive and delete ``policy``'s rows older than ``days``. Returns the number moved."""
+    if batch_size is None:
+        batch_size = getattr(settings, 'RETENTION_BATCH_SIZE', 500)
+    if pause is None:
+        pause = getattr(settings, 'RETENTION_BATCH_PAUSE_SECONDS', 0.05)
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    aliases = regions.all_shards() if regions.is_sharded(policy.model) else [DEFAULT_DB_ALIAS]
+    moved = 0
+    for alias in aliases:
+        expired = policy.expired(cutoff).using(alias).order_by(policy.time_field, 'id')
+        while True:
+            rows = list(expired.values(*policy.fields)[:batch_size])
+            if not rows:
+                break
+            append(policy, rows, alias)
+            with transaction.atomic(using=alias):
+                policy.model.objects.using(alias).filter(id__in=[row['id'] for row in rows]).delete()
+            moved += len(rows)
+            if len(rows) < batch_size:
+                break
+            time.sleep(pause)
+    return moved
+
+
+def purge_all(batch_size=None, now=None):
+    """Apply RETENTION_DAYS to every model with a policy. Returns {model name: rows moved}."""
+    retention = getattr(settings, 'RETENTION_DAYS', {})
+    return {
+        name: purge(policy, retention[name], batch_size=batch_size, now=now)
+        for name, policy in POLICIES.items() if retention.get(name) is not None
+    }
+
+
+def search(name, user_id=None, start=None, end=None):
+    """
+    Archived rows of one model (by POLICIES name) as dicts, month by month,
+    optionally only one user's and only those in [start, end).
+    """
+    policy = POLICIES[name]
+    first, last = (_month(start) if start else None), (_month(end) if end else None)
+    for path in sorted((archive_dir() / name).glob('*.ndjson.gz')):
+        month = path.name[:7]
+        if (first and month < first) or (last and month > last):
+            continue
+        seen = set()
+        with gzip.open(path, 'rt') as f:
+            for line in f:
+                row = json.loads(line)
+                if user_id is not None and row['user_id'] != user_id:
+                    continue
+                when = parse_datetime(row[policy.time_field])
+                if (start and when < start) or (end and when >= end) or row['id'] in seen:
+                    continue
+                seen.add(row['id'])
+                yield row
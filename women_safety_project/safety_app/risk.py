@@ -0,0 +1,199 @@
+"""
+Incident risk surface.
+
+Recent IncidentReport rows are turned into a severity-weighted Gaussian
+kernel density, rendered per web-mercator map tile (z/x/y, 256×256). The
+kernel is separable, so a tile is one (H×K)·(K×W) matrix product over the
+K incidents near it.
+
+Grids and their PNG renderings live in the ``risk_tiles`` cache (LocMem is
+LRU, bounded by MAX_ENTRIES). Saving or deleting an incident evicts only
+the tiles its kernel reaches, at every zoom; the cache TIMEOUT bounds how
+long other workers' copies and aged-out incidents can linger.
+"""
+import math
+import struct
+import zlib
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from . import regions
+from .models import IncidentReport
+
+TILE_SIZE = 256
+MAX_ZOOM = 19
+POINT_ZOOM = 15
+MERCATOR_RADIUS = 6378137.0
+ORIGIN_SHIFT = math.pi * MERCATOR_RADIUS
+# Beyond this many sigmas an incident contributes nothing visible.
+KERNEL_REACH = 3.0
+RISK_LEVELS = [(0.5, 'minimal'), (1.5, 'low'), (3.0, 'moderate'), (math.inf, 'high')]
+
+
+def _cache():
+    return caches['risk_tiles']
+
+
+def to_mercator(lats, lons):
+    lats = np.clip(np.asarray(lats, dtype=float), -85.05112878, 85.05112878)
+    x = MERCATOR_RADIUS * np.radians(np.asarray(lons, dtype=float))
+    y = MERCATOR_RADIUS * np.log(np.tan(np.pi / 4 + np.radians(lats) / 2))
+    return x, y
+
+
+def from_mercator(x, y):
+    lon = math.degrees(x / MERCATOR_RADIUS)
+    lat = math.degrees(2 * math.atan(math.exp(y / MERCATOR_RADIUS)) - math.pi / 2)
+    return lat, lon
+
+
+def tile_bounds(z, x, y):
+    """(min_x, min_y, max_x, max_y) of a tile in mercator metres."""
+    size = 2 * ORIGIN_SHIFT / 2 ** z
+    min_x = -ORIGIN_SHIFT + x * size
+    max_y = ORIGIN_SHIFT - y * size
+    return min_x, max_y - size, min_x + size, max_y
+
+
+def _sigma(z, lat):
+    """Kernel width in mercator metres: RISK_KERNEL_METERS, but never under a pixel."""
+    pixel = 2 * ORIGIN_SHIFT / 2 ** z / TILE_SIZE
+    ground = getattr(settings, 'RISK_KERNEL_METERS', 150) / max(math.cos(math.radians(lat)), 0.01)
+    return max(ground, pixel)
+
+
+def _weights():
+    return getattr(settings, 'RISK_SEVERITY_WEIGHTS', {'low': 1.0, 'medium': 2.0, 'high': 4.0})
+
+
+def _tile_key(z, x, y):
+    return f'grid:{z}/{x}/{y}'
+
+
+def _png_key(z, x, y):
+    return f'png:{z}/{x}/{y}'
+
+
+def compute_grid(z, x, y):
+    """Risk density for one tile as a TILE_SIZE×TILE_SIZE float32 array (row 0 is north)."""
+    min_x, min_y, max_x, max_y = tile_bounds(z, x, y)
+    centre_lat, _ = from_mercator((min_x + max_x) / 2, (min_y + max_y) / 2)
+    sigma = _sigma(z, centre_lat)
+    reach = KERNEL_REACH * sigma
+
+    south, west = from_mercator(min_x - reach, min_y - reach)
+    north, east = from_mercator(max_x + reach, max_y + reach)
+    since = timezone.now() - timedelta(days=getattr(settings, 'RISK_WINDOW_DAYS', 30))
+    rows = list(regions.fan_out(IncidentReport.objects.filter(
+        reported_at__gte=since,
+        latitude__range=(south, north),
+        longitude__range=(west, east),
+    ).values_list('latitude', 'longitude', 'severity'), regions.shards_for_box(south, west, north, east)))
+
+    grid = np.zeros((TILE_SIZE, TILE_SIZE), dtype=np.float32)
+    if not rows:
+        return grid
+    lats, lons, severities = zip(*rows)
+    weights = _weights()
+    w = np.array([weights.get(s, 1.0) for s in severities])
+    ix, iy = to_mercator(lats, lons)
+
+    res = (max_x - min_x) / TILE_SIZE
+    px = min_x + (np.arange(TILE_SIZE) + 0.5) * res
+    py = max_y - (np.arange(TILE_SIZE) + 0.5) * res
+    gx = np.exp(-((px[:, None] - ix[None, :]) ** 2) / (2 * sigma ** 2))
+    gy = np.exp(-((py[:, None] - iy[None, :]) ** 2) / (2 * sigma ** 2))
+    grid[:] = (gy * w) @ gx.T
+    return grid
+
+
+def get_grid(z, x, y):
+    key = _tile_key(z, x, y)
+    grid = _cache().get(key)
+    if grid is None:
+        grid = compute_grid(z, x, y)
+        _cache().set(key, grid)
+    return grid
+
+
+def _png(rgba):
+    h, w, _ = rgba.shape
+    # Each scanline is prefixed with filter type 0 (None).
+    raw = np.hstack([np.zeros((h, 1), dtype=np.uint8), rgba.reshape(h, w * 4)]).tobytes()
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', w, h, 8, 6, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw, 6))
+            + chunk(b'IEND', b''))
+
+
+def render_png(grid):
+    """Yellow→red ramp whose opacity rises with risk; zero risk is transparent."""
+    t = np.clip(grid / getattr(settings, 'RISK_SATURATION', 4.0), 0.0, 1.0)
+    rgba = np.empty(grid.shape + (4,), dtype=np.uint8)
+    rgba[..., 0] = 255
+    rgba[..., 1] = (221 * (1 - t)).astype(np.uint8)
+    rgba[..., 2] = (87 * (1 - t)).astype(np.uint8)
+    rgba[..., 3] = (200 * np.sqrt(t)).astype(np.uint8)
+    return _png(rgba)
+
+
+def get_png(z, x, y):
+    key = _png_key(z, x, y)
+    png = _cache().get(key)
+    if png is None:
+        png = render_png(get_grid(z, x, y))
+        _cache().set(key, png)
+    return png
+
+
+def tile_for(lat, lon, z):
+    """(x, y, column, row): the tile containing a point and the pixel within it."""
+    mx, my = to_mercator(lat, lon)
+    scale = 2 ** z * TILE_SIZE / (2 * ORIGIN_SHIFT)
+    px = int((float(mx) + ORIGIN_SHIFT) * scale)
+    py = int((ORIGIN_SHIFT - float(my)) * scale)
+    last = 2 ** z * TILE_SIZE - 1
+    px, py = min(max(px, 0), last), min(max(py, 0), last)
+    return px // TILE_SIZE, py // TILE_SIZE, px % TILE_SIZE, py % TILE_SIZE
+
+
+def risk_at(lat, lon):
+    """Risk score and level at a point, read from the POINT_ZOOM tile grid."""
+    x, y, col, row = tile_for(lat, lon, POINT_ZOOM)
+    score = float(get_grid(POINT_ZOOM, x, y)[row, col])
+    level = next(name for limit, name in RISK_LEVELS if score < limit)
+    return {'score': round(score, 3), 'level': level}
+
+
+def touched_tiles(lat, lon):
+    """Every (z, x, y) whose grid an incident at this point contributes to."""
+    mx, my = to_mercator(lat, lon)
+    mx, my = float(mx), float(my)
+    for z in range(MAX_ZOOM + 1):
+        n = 2 ** z
+        size = 2 * ORIGIN_SHIFT / n
+        # Tiles use their own centre latitude for sigma; pad by one sigma for that.
+        reach = (KERNEL_REACH + 1) * _sigma(z, lat)
+        x0 = max(int((mx - reach + ORIGIN_SHIFT) // size), 0)
+        x1 = min(int((mx + reach + ORIGIN_SHIFT) // size), n - 1)
+        y0 = max(int((ORIGIN_SHIFT - my - reach) // size), 0)
+        y1 = min(int((ORIGIN_SHIFT - my + reach) // size), n - 1)
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                yield z, x, y
+
+
+def invalidate_point(lat, lon):
+    keys = []
+    for z, x, y in touched_tiles(lat, lon):
+        keys.append(_tile_key(z, x, y))
+        keys.append(_png_key(z, x, y))
+    _cache().delete_many(keys)
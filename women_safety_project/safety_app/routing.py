@@ -0,0 +1,412 @@
+"""
+Offline pedestrian routing that steers around reported incidents.
+
+``manage.py build_walk_graph`` turns a local OpenStreetMap XML extract into
+a walking graph saved as flat arrays (ROUTING_GRAPH_PATH):
+
+- node latitude and longitude, with nodes numbered in latitude order
+- CSR adjacency: ``indptr`` and ``indices``
+- edge length in metres
+
+Each process loads the file once (and again if it is rebuilt). Every edge
+carries a risk exposure: its length times the incident density at its
+midpoint, using the same severity-weighted Gaussian kernel and window as the
+risk surface (safety_app.risk). A* minimises
+
+    length + safety * exposure
+
+with a straight-line heuristic. The hot loop reads array.array buffers
+(element access on those is far cheaper than on NumPy arrays); the per-edge
+cost for a given safety weight is computed with NumPy once and reused until
+exposure changes.
+
+Exposure stays current incrementally. Before each query, incidents with an
+id above the last one applied are added. Edits and deletions (seen by this
+process's signals) and incidents ageing out of the window are handled by a
+full rebuild, forced or every ROUTING_RISK_REBUILD_SECONDS.
+"""
+import bz2
+import gzip
+import heapq
+import math
+import os
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+from array import array
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+
+from . import geodesy, regions, risk
+from .models import IncidentReport
+
+METRES_PER_DEG = geodesy.EARTH_RADIUS_KM * 1000 * math.pi / 180
+WALKING_SPEED_MPS = 1.3
+# The planar heuristic may overshoot the haversine length by a hair; shrink it to stay admissible.
+HEURISTIC_SLACK = 0.99
+
+WALKABLE = {
+    'footway', 'pedestrian', 'path', 'steps', 'living_street', 'residential', 'service', 'unclassified',
+    'track', 'cycleway', 'road', 'tertiary', 'tertiary_link', 'secondary', 'secondary_link',
+    'primary', 'primary_link', 'trunk', 'trunk_link',
+}
+NO_ACCESS = {'no', 'private'}
+FOOT_ALLOWED = {'yes', 'designated', 'permissive'}
+
+
+def graph_path():
+    return str(getattr(settings, 'ROUTING_GRAPH_PATH',
+                       os.path.join(settings.BASE_DIR, 'data', 'walk_graph.npz')))
+
+
+# ─── Building ────────────────────────────────────────────────────────────────
+
+def _walkable(tags):
+    if tags.get('highway') not in WALKABLE:
+        return False
+    foot = tags.get('foot')
+    if foot in NO_ACCESS:
+        return False
+    return not (tags.get('access') in NO_ACCESS and foot not in FOOT_ALLOWED)
+
+
+def open_osm(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def parse_osm(source):
+    """(node ids, lats, lons, way node refs, way starts) of the walkable ways in an OSM XML stream."""
+    node_ids, lats, lons = array('q'), array('d'), array('d')
+    refs, starts = array('q'), array('q')
+    way_refs, tags = [], {}
+    for _, elem in ET.iterparse(source, events=('end',)):
+        if elem.tag == 'node':
+            node_ids.append(int(elem.get('id')))
+            lats.append(float(elem.get('lat')))
+            lons.append(float(elem.get('lon')))
+        elif elem.tag == 'nd':
+            way_refs.append(int(elem.get('ref')))
+        elif elem.tag == 'tag':
+            tags[elem.get('k')] = elem.get('v')
+        elif elem.tag == 'way':
+            if len(way_refs) > 1 and _walkable(tags):
+                starts.append(len(refs))
+                refs.extend(way_refs)
+            way_refs, tags = [], {}
+        elif elem.tag == 'relation':
+            way_refs, tags = [], {}
+        else:
+            continue
+        elem.clear()
+    return (np.frombuffer(node_ids, dtype=np.int64), np.frombuffer(lats), np.frombuffer(lons),
+            np.frombuffer(refs, dtype=np.int64), np.frombuffer(starts, dtype=np.int64))
+
+
+def build_graph(node_ids, lats, lons, refs, starts):
+    """CSR walking graph {'lat', 'lon', 'indptr', 'indices', 'length'} from parse_osm() output."""
+    order = np.argsort(node_ids)
+    node_ids, lats, lons = node_ids[order], lats[order], lons[order]
+
+    # Consecutive refs of the same way are the edges.
+    same_way = np.ones(len(refs), dtype=bool)
+    same_way[starts] = False
+    pair = same_way[1:]
+    src_ref, dst_ref = refs[:-1][pair], refs[1:][pair]
+
+    # Drop edges to nodes outside the extract.
+    pos_src = np.clip(np.searchsorted(node_ids, src_ref), 0, max(len(node_ids) - 1, 0))
+    pos_dst = np.clip(np.searchsorted(node_ids, dst_ref), 0, max(len(node_ids) - 1, 0))
+    known = (node_ids[pos_src] == src_ref) & (node_ids[pos_dst] == dst_ref) & (src_ref != dst_ref)
+    pos_src, pos_dst = pos_src[known], pos_dst[known]
+
+    # Keep only routed nodes, numbered by latitude so a latitude band is a slice.
+    used = np.unique(np.concatenate([pos_src, pos_dst]))
+    by_lat = used[np.argsort(lats[used], kind='stable')]
+    number = np.empty(len(node_ids), dtype=np.int64)
+    number[by_lat] = np.arange(len(by_lat))
+    node_lat, node_lon = lats[by_lat], lons[by_lat]
+
+    # Pedestrians walk both ways; merge edges duplicated by overlapping ways.
+    src = np.concatenate([number[pos_src], number[pos_dst]])
+    dst = np.concatenate([number[pos_dst], number[pos_src]])
+    keys = np.unique(src * len(by_lat) + dst)
+    src, dst = keys // max(len(by_lat), 1), keys % max(len(by_lat), 1)
+
+    length = geodesy.pairwise_km(node_lat[src], node_lon[src], node_lat[dst], node_lon[dst]) * 1000
+    indptr = np.zeros(len(by_lat) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=len(by_lat)), out=indptr[1:])
+    return {
+        'lat': node_lat,
+        'lon': node_lon,
+        'indptr': indptr,
+        'indices': dst.astype(np.int32),
+        'length': length.astype(np.float32),
+    }
+
+
+def save_graph(arrays, path=None):
+    path = path or graph_path()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix='.walk_graph-', suffix='.npz', dir=os.path.dirname(path) or '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def build_from_osm(osm_path, output=None):
+    """Parse an .osm / .osm.gz / .osm.bz2 extract and save its walking graph. Returns the arrays."""
+    with open_osm(osm_path) as source:
+        arrays = build_graph(*parse_osm(source))
+    save_graph(arrays, output)
+    return arrays
+
+
+# ─── Graph ───────────────────────────────────────────────────────────────────
+
+def _buffer(values, typecode, dtype):
+    buf = array(typecode)
+    buf.frombytes(np.ascontiguousarray(values, dtype=dtype).tobytes())
+    return buf
+
+
+class Graph:
+    """Walking graph with per-edge risk exposure."""
+
+    def __init__(self, lat, lon, indptr, indices, length):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.length_np = np.asarray(length, dtype=np.float64)
+        # The A* loop indexes these one element at a time, where array.array is far faster than NumPy.
+        self.indptr = _buffer(indptr, 'q', np.int64)
+        self.indptr_np = np.frombuffer(self.indptr, dtype=np.int64)
+        self.indices = _buffer(indices, 'i', np.int32)
+        self.length = _buffer(self.length_np, 'd', np.float64)
+        self.lat_buf = _buffer(self.lat, 'd', np.float64)
+        self.lon_buf = _buffer(self.lon, 'd', np.float64)
+        self.exposure = array('d', bytes(8 * len(self.length)))
+        self.exposure_np = np.frombuffer(self.exposure, dtype=np.float64)
+
+        src = np.repeat(np.arange(len(self.lat)), np.diff(np.asarray(indptr)))
+        self.mid_lat = (self.lat[src] + self.lat[np.asarray(indices)]) / 2
+        self.mid_lon = (self.lon[src] + self.lon[np.asarray(indices)]) / 2
+        self.edges_by_lat = np.argsort(self.mid_lat)
+        self.mid_lat_sorted = self.mid_lat[self.edges_by_lat]
+
+        self.last_incident_ids = {}
+        self.risk_built_at = 0.0
+        self.risk_version = 0
+        self._costs, self._costs_key = None, None
+        self.stale = True
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['lat'], data['lon'], data['indptr'], data['indices'], data['length'])
+
+    @property
+    def node_count(self):
+        return len(self.lat)
+
+    def nearest_node(self, lat, lon, max_metres):
+        """Closest node within max_metres, or None."""
+        dlat = max_metres / METRES_PER_DEG
+        lo, hi = np.searchsorted(self.lat, [lat - dlat, lat + dlat])
+        if lo == hi:
+            return None
+        dy = (self.lat[lo:hi] - lat) * METRES_PER_DEG
+        dx = (self.lon[lo:hi] - lon) * METRES_PER_DEG * math.cos(math.radians(lat))
+        d2 = dx * dx + dy * dy
+        best = int(np.argmin(d2))
+        return lo + best if d2[best] <= max_metres ** 2 else None
+
+    # Risk exposure
+
+    def add_incidents(self, lats, lons, weights, sign=1.0):
+        sigma = getattr(settings, 'RISK_KERNEL_METERS', 150)
+        reach = risk.KERNEL_REACH * sigma
+        dlat = reach / METRES_PER_DEG
+        for lat, lon, weight in zip(lats, lons, weights):
+            lo, hi = np.searchsorted(self.mid_lat_sorted, [lat - dlat, lat + dlat])
+            edges = self.edges_by_lat[lo:hi]
+            dy = (self.mid_lat[edges] - lat) * METRES_PER_DEG
+            dx = (self.mid_lon[edges] - lon) * METRES_PER_DEG * math.cos(math.radians(lat))
+            d2 = dx * dx + dy * dy
+            near = d2 <= reach ** 2
+            edges = edges[near]
+            self.exposure_np[edges] += sign * weight * np.exp(-d2[near] / (2 * sigma ** 2)) * self.length_np[edges]
+        self.risk_version += 1
+
+    def _add_shard_incidents(self, alias, **filters):
+        """Apply one shard's incidents matching ``filters``; returns the last id applied, if any."""
+        since = timezone.now() - timedelta(days=getattr(settings, 'RISK_WINDOW_DAYS', 30))
+        rows = list(IncidentReport.objects.using(alias).filter(reported_at__gte=since, **filters)
+                    .order_by('id').values_list('id', 'latitude', 'longitude', 'severity'))
+        if not rows:
+            return None
+        weights = risk._weights()
+        self.add_incidents([r[1] for r in rows], [r[2] for r in rows],
+                           [weights.get(severity, 1.0) for _, _, _, severity in rows])
+        return rows[-1][0]
+
+    def rebuild_risk(self):
+        # Ids are per database, so each region shard the graph overlaps has its own high-water mark.
+        shards = regions.shards_for_box(self.lat.min(), self.lon.min(), self.lat.max(), self.lon.max())
+        # Fix the marks first so a report arriving mid-rebuild is applied by the next refresh.
+        last_ids = {alias: IncidentReport.objects.using(alias).aggregate(last=Max('id'))['last'] or 0
+                    for alias in shards}
+        self.exposure_np[:] = 0.0
+        self.risk_version += 1
+        for alias, last_id in last_ids.items():
+            self._add_shard_incidents(alias, id__lte=last_id)
+        self.last_incident_ids = last_ids
+        self.risk_built_at = time.monotonic()
+        self.stale = False
+
+    def refresh_risk(self):
+        """Apply incidents reported since the last refresh; rebuild when stale or due."""
+        if self.stale or time.monotonic() - self.risk_built_at > getattr(settings, 'ROUTING_RISK_REBUILD_SECONDS', 3600):
+            self.rebuild_risk()
+            return
+        for alias, last_id in self.last_incident_ids.items():
+            self.last_incident_ids[alias] = self._add_shard_incidents(alias, id__gt=last_id) or last_id
+
+    # Search
+
+    def costs(self, safety):
+        """Per-edge search cost ``length + safety * exposure``, cached until exposure changes."""
+        key = (safety, self.risk_version)
+        if self._costs_key != key:
+            self._costs = _buffer(self.length_np + safety * self.exposure_np, 'd', np.float64)
+            self._costs_key = key
+        return self._costs
+
+    def astar(self, source, target, safety):
+        """(nodes, edges) of the cheapest path, or None if target is unreachable."""
+        indptr, indices, cost_of = self.indptr, self.indices, self.costs(safety)
+        lat, lon = self.lat_buf, self.lon_buf
+        t_lat, t_lon = lat[target], lon[target]
+        ky = METRES_PER_DEG * HEURISTIC_SLACK
+        kx = ky * math.cos(math.radians(t_lat))
+        sqrt, push, pop = math.sqrt, heapq.heappush, heapq.heappop
+
+        best = {source: 0.0}
+        via = {source: -1}
+        # Entries are (f, -g, node): among equal f the deepest node goes first,
+        # which stops A* from fanning out across the many equal-length
+        # alternatives of a street grid.
+        heap = [(0.0, 0.0, source)]
+        while heap:
+            _, cost, u = pop(heap)
+            cost = -cost
+            if u == target:
+                break
+            if cost > best[u]:
+                continue
+            for e in range(indptr[u], indptr[u + 1]):
+                v = indices[e]
+                new = cost + cost_of[e]
+                if new < best.get(v, math.inf):
+                    best[v] = new
+                    via[v] = e
+                    dy, dx = (lat[v] - t_lat) * ky, (lon[v] - t_lon) * kx
+                    push(heap, (new + sqrt(dx * dx + dy * dy), -new, v))
+        else:
+            return None
+
+        nodes, edges = [target], []
+        node = target
+        while via[node] != -1:
+            e = via[node]
+            edges.append(e)
+            # Edges are stored under their source; find it from the CSR offsets.
+            node = int(np.searchsorted(self.indptr_np, e, side='right')) - 1
+            nodes.append(node)
+        return nodes[::-1], edges[::-1]
+
+
+_graph = None
+_graph_identity = None
+_lock = threading.Lock()
+
+
+def get_graph():
+    """This process's graph with fresh risk, loading or reloading the file as needed. None if not built."""
+    global _graph, _graph_identity
+    path = graph_path()
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    identity = (st.st_ino, st.st_mtime_ns, st.st_size)
+    with _lock:
+        if _graph is None or identity != _graph_identity:
+            _graph, _graph_identity = Graph.load(path), identity
+        _graph.refresh_risk()
+        return _graph
+
+
+def mark_stale():
+    """An incident was edited or deleted: rebuild exposure before the next route."""
+    if _graph is not None:
+        _graph.stale = True
+
+
+# ─── Routes ──────────────────────────────────────────────────────────────────
+
+class RoutingError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def plan(start, end, safety=None):
+    """
+    Safest walking route between two (lat, lon) points. Raises RoutingError.
+
+    Returns {'distance_m', 'duration_min', 'risk': {'mean', 'peak', 'level'},
+    'safety', 'path': [[lat, lon], ...]}.
+    """
+    graph = get_graph()
+    if graph is None:
+        raise RoutingError('Routing graph not built', status=503)
+    safety = getattr(settings, 'ROUTING_DEFAULT_SAFETY', 2.0) if safety is None else safety
+    snap = getattr(settings, 'ROUTING_MAX_SNAP_METERS', 300)
+    source = graph.nearest_node(*start, snap)
+    target = graph.nearest_node(*end, snap)
+    if source is None or target is None:
+        raise RoutingError('Start or destination is too far from a walkable street')
+
+    found = graph.astar(source, target, safety)
+    if found is None:
+        raise RoutingError('No walking route between these points', status=404)
+    nodes, edges = found
+    lengths = graph.length_np[edges]
+    distance = float(lengths.sum())
+    density = graph.exposure_np[edges] / np.maximum(lengths, 1e-9)
+    mean = float(graph.exposure_np[edges].sum() / distance) if distance else 0.0
+    peak = float(density.max()) if len(edges) else 0.0
+    return {
+        'distance_m': round(distance, 1),
+        'duration_min': round(distance / WALKING_SPEED_MPS / 60, 1),
+        'risk': {
+            'mean': round(mean, 3),
+            'peak': round(peak, 3),
+            'level': next(name for limit, name in risk.RISK_LEVELS if peak < limit),
+        },
+        'safety': safety,
+        'path': [[round(float(graph.lat[n]), 6), round(float(graph.lon[n]), 6)] for n in nodes],
+    }
@@ -0,0 +1,61 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from . import metrics, regions, risk, routing, user_cache
+from .models import IncidentReport, LocationPoint, LocationTrail, Profile, SOSLog, TrustedContact, UserLocation
+
+
+@receiver(post_save, sender=IncidentReport)
+@receiver(post_delete, sender=IncidentReport)
+def invalidate_risk_tiles(sender, instance, **kwargs):
+    """Drop only the cached risk tiles this incident's kernel reaches."""
+    risk.invalidate_point(instance.latitude, instance.longitude)
+
+
+@receiver(post_save, sender=IncidentReport)
+@receiver(post_delete, sender=IncidentReport)
+def refresh_route_risk(sender, instance, created=False, **kwargs):
+    """New reports are picked up incrementally; an edit or delete needs a full rebuild."""
+    if not created:
+        routing.mark_stale()
+
+
+@receiver(post_save, sender=TrustedContact)
+@receiver(post_delete, sender=TrustedContact)
+def invalidate_cached_contacts(sender, instance, **kwargs):
+    user_cache.invalidate_contacts(instance.user_id)
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_cached_profile(sender, instance, **kwargs):
+    user_cache.invalidate_profile(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_cache.invalidate_user(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def delete_sharded_rows(sender, instance, **kwargs):
+    """The delete cascade only reaches default; clear the user's rows from the region shards too."""
+    for alias in regions.all_shards()[1:]:
+        for model in (UserLocation, IncidentReport, LocationPoint, LocationTrail):
+            model.objects.using(alias).filter(user_id=instance.pk).delete()
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_cached_token(sender, instance, **kwargs):
+    """Logging out deletes the token; stop accepting it straight away."""
+    user_cache.invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=SOSLog)
+def count_sos_event(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: metrics.inc('raksha_sos_events_total', action=instance.action))
@@ -0,0 +1,130 @@
+"""
+Host-wide snapshot of users with a live SOS.
+
+The set is tiny, so instead of joining UserLocation, Profile and User on
+every alert poll it is written to a small binary file: a header followed by
+one fixed-size record (user id, lat, lon, updated_at, username) per user.
+Writers build the file beside the target and os.replace() it into place, so
+readers never see a partial write and need no lock. Every worker mmaps the
+file through the shared page cache and only decodes it again after a
+replacement (detected with a stat).
+
+publish() rebuilds from the database. It runs after any commit that changes
+SOS state or moves a user who is in the snapshot. A snapshot older than
+SOS_SNAPSHOT_MAX_AGE_SECONDS (e.g. a publish lost to a crash or to a
+concurrent writer) is treated as stale: the reader rebuilds and republishes
+it.
+"""
+import logging
+import mmap
+import os
+import tempfile
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from . import regions
+from .models import Profile, UserLocation
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'SOS1'
+HEADER = np.dtype([('magic', 'S4'), ('count', '<u4'), ('published_at', '<f8')])
+RECORD = np.dtype([
+    ('user_id', '<i8'),
+    ('lat', '<f8'),
+    ('lon', '<f8'),
+    ('updated_at', '<f8'),
+    ('username', '<U150'),
+])
+EMPTY = np.empty(0, dtype=RECORD)
+
+# (file identity, published_at, records) of the last snapshot this process read.
+_loaded = (None, 0.0, EMPTY)
+
+
+def snapshot_path():
+    return str(getattr(settings, 'SOS_SNAPSHOT_PATH',
+                       os.path.join(tempfile.gettempdir(), 'raksha_sos_snapshot.bin')))
+
+
+def _identity(st):
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def read():
+    """(published_at, records) of the snapshot on disk; (0.0, EMPTY) if there is none."""
+    global _loaded
+    path = snapshot_path()
+    try:
+        identity = _identity(os.stat(path))
+    except FileNotFoundError:
+        return 0.0, EMPTY
+    if identity == _loaded[0]:
+        return _loaded[1], _loaded[2]
+
+    try:
+        with open(path, 'rb') as f:
+            identity = _identity(os.fstat(f.fileno()))
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                header = np.frombuffer(mm, dtype=HEADER, count=1).copy()[0]
+                if header['magic'] != MAGIC:
+                    return 0.0, EMPTY
+                records = np.frombuffer(mm, dtype=RECORD, count=int(header['count']),
+                                        offset=HEADER.itemsize).copy()
+    except (OSError, ValueError):
+        # Replaced or truncated under us; treat as stale and rebuild.
+        return 0.0, EMPTY
+    _loaded = (identity, float(header['published_at']), records)
+    return _loaded[1], _loaded[2]
+
+
+def publish():
+    """Rebuild the snapshot from the database and swap it into place. Returns the records."""
+    # Profiles and locations can live in different databases (safety_app.regions).
+    usernames = dict(Profile.objects.filter(is_sos_active=True).values_list('user_id', 'user__username'))
+    rows = regions.fan_out(UserLocation.objects.filter(
+        user_id__in=usernames,
+        latitude__isnull=False,
+        longitude__isnull=False,
+    ).values_list('user_id', 'latitude', 'longitude', 'last_updated')) if usernames else []
+    records = np.array(
+        [(user_id, lat, lon, updated.timestamp(), usernames[user_id]) for user_id, lat, lon, updated in rows],
+        dtype=RECORD,
+    )
+    header = np.array([(MAGIC, len(records), time.time())], dtype=HEADER)
+
+    path = snapshot_path()
+    fd, tmp = tempfile.mkstemp(prefix='.sos_snapshot-', dir=os.path.dirname(path) or '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header.tobytes())
+            f.write(records.tobytes())
+        os.replace(tmp, path)
+    except OSError:
+        # e.g. Windows refusing to replace a file another process has open;
+        # readers keep the old snapshot until it goes stale.
+        logger.warning('Could not publish SOS snapshot to %s', path, exc_info=True)
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+    return records
+
+
+def current():
+    """Records of every user with a live SOS, rebuilt from the database if stale."""
+    published_at, records = read()
+    if time.time() - published_at > getattr(settings, 'SOS_SNAPSHOT_MAX_AGE_SECONDS', 30):
+        records = publish()
+    return records
+
+
+def contains(user_id):
+    """Whether the user is in the snapshot as last read (no database access)."""
+    _, records = read()
+    return bool((records['user_id'] == user_id).any())
+
+
+def publish_on_commit(using=None):
+    transaction.on_commit(publish, using=using)
@@ -1,3 +1,1651 @@
-from django.test import TestCase
+"""
+Tests for safety_app and api.
 
-# Create your tests here.
+The view tests (QueryBudgetTestCase) are query budgets: each request is run
+once and must issue exactly its budgeted number of SQL statements; every
+statement is then EXPLAINed and must not fall back to a full table scan. An
+N+1 or a dropped index therefore fails here instead of surfacing under
+production load. When a change legitimately alters a budget, update the
+number alongside it.
+
+The other test cases cover one module each (caches, outbox, scheduler,
+location writer, shards, geodesy and so on). Those that need users and
+their data build on SafetyTestCase's fixture.
+"""
+import asyncio
+import gzip
+import io
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures import Future
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection, connections, router
+from django.test import AsyncClient, Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from . import (alerts, geocoder, geodesy, geohash, history, journeys, loadgen, location_writer, metrics,
+               outbox, pagination, regions, retention, risk, routing, sos_snapshot, user_cache, views, voice)
+from .models import (IncidentReport, JourneyTracker, LocationPoint, LocationTrail, Notification, Profile, SOSLog,
+                     TrustedContact, UserLocation)
+
+EXPLAINABLE = ('SELECT', 'UPDATE', 'DELETE')
+# A SCAN step reads a whole table or index, which is only fine when the index
+# is partial (it holds just the rows the query wants).
+PARTIAL_INDEXES = {
+    index.name
+    for model in apps.get_app_config('safety_app').get_models()
+    for index in model._meta.indexes if index.condition is not None
+}
+# Django's UserCreationForm checks usernames case-insensitively, which walks
+# auth_user's username index once per sign-up.
+ALLOWED_SCANS = {'SCAN auth_user USING COVERING INDEX sqlite_autoindex_auth_user_1'}
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def full_scans(sql):
+    return [
+        step for step in explain(sql)
+        if step.startswith('SCAN ') and step not in ALLOWED_SCANS
+        and not any(step.endswith(f'INDEX {name}') for name in PARTIAL_INDEXES)
+    ]
+
+
+SNAPSHOT_DIR = tempfile.mkdtemp(prefix='raksha-tests-')
+RATE = 16000
+
+
+def tone(f0, seconds=2.0, amplitude=0.05):
+    """A harmonic-rich voiced tone over faint noise, as float samples."""
+    t = np.arange(int(seconds * RATE)) / RATE
+    voiced = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 6)) * amplitude
+    return (voiced + np.random.default_rng(0).normal(0, 0.003, len(t))).astype(np.float32)
+
+
+def pcm16(samples):
+    return (np.clip(samples, -1, 1) * 32767).astype('<i2').tobytes()
+
+
+def wav_file(samples):
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(RATE)
+        w.writeframes(pcm16(samples))
+    buf.seek(0)
+    buf.name = 'chunk.wav'
+    return buf
+
+
+GRID_ORIGIN = (22.56, 88.35)
+GRID_STEP = 0.0005
+GRID_SIZE = 21
+WALK_GRAPH = os.path.join(SNAPSHOT_DIR, 'walk_graph.npz')
+
+
+def grid_osm():
+    """OSM XML for a GRID_SIZE² street grid, plus ways a pedestrian may not use."""
+    lat0, lon0 = GRID_ORIGIN
+    n = GRID_SIZE
+    parts = ['<osm version="0.6">']
+    for r in range(n):
+        for c in range(n):
+            parts.append(f'<node id="{r * n + c + 1}" lat="{lat0 + r * GRID_STEP}" lon="{lon0 + c * GRID_STEP}"/>')
+    ways = [[r * n + c + 1 for c in range(n)] for r in range(n)] + [[r * n + c + 1 for r in range(n)] for c in range(n)]
+    for i, refs in enumerate(ways):
+        nds = ''.join(f'<nd ref="{ref}"/>' for ref in refs)
+        parts.append(f'<way id="{i + 1}">{nds}<tag k="highway" v="residential"/></way>')
+    # A diagonal shortcut across the whole grid that walkers can't take.
+    shortcut = ''.join(f'<nd ref="{ref}"/>' for ref in (1, n * n))
+    parts.append(f'<way id="9001">{shortcut}<tag k="highway" v="motorway"/></way>')
+    parts.append(f'<way id="9002">{shortcut}<tag k="highway" v="footway"/><tag k="access" v="private"/></way>')
+    parts.append('</osm>')
+    return '\n'.join(parts).encode()
+
+
+def grid_point(row, col):
+    return GRID_ORIGIN[0] + row * GRID_STEP, GRID_ORIGIN[1] + col * GRID_STEP
+
+
+PLACES = os.path.join(SNAPSHOT_DIR, 'places.npz')
+# Two Park Streets: the user (at 22.5726, 88.3639) is next to the first.
+PLACES_CSV = """name,latitude,longitude,kind
+Park Street,22.5530,88.3520,street
+Park Street,23.2000,88.9000,street
+Park Circus,22.5390,88.3660,suburb
+Parkview Hospital,22.6500,88.4500,hospital
+Salt Lake Stadium,22.5690,88.4090,stadium
+Café Coffee Day,22.5740,88.3640,cafe
+"""
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    SOS_SNAPSHOT_PATH=os.path.join(SNAPSHOT_DIR, 'sos_snapshot.bin'),
+    METRICS_DIR=os.path.join(SNAPSHOT_DIR, 'metrics'),
+    OUTBOX_AUTOSTART=False,
+    JOURNEY_SCHEDULER_AUTOSTART=False,
+    VOICE_WORKERS=0,
+    ROUTING_GRAPH_PATH=WALK_GRAPH,
+    GEOCODER_INDEX_PATH=PLACES,
+)
+class SafetyTestCase(TestCase):
+    """asha (three contacts, 30 SOS logs and incidents) and bina, a neighbour with a live SOS."""
+
+    @classmethod
+    def setUpTestData(cls):
+        if not os.path.exists(WALK_GRAPH):
+            routing.save_graph(routing.build_graph(*routing.parse_osm(io.BytesIO(grid_osm()))), WALK_GRAPH)
+        if not os.path.exists(PLACES):
+            geocoder.save_index(geocoder.build_index(geocoder.places_from_csv(PLACES_CSV)), PLACES)
+        cls.user = User.objects.create_user('asha', password='pw-asha-123')
+        Profile.objects.create(user=cls.user, real_pin='1234', duress_pin='9999')
+        UserLocation.objects.create(user=cls.user, latitude=22.5726, longitude=88.3639)
+        cls.contacts = [
+            TrustedContact.objects.create(user=cls.user, name=f'Contact {i}', email=f'c{i}@example.com',
+                                          phone_number=f'90000000{i}')
+            for i in range(3)
+        ]
+        SOSLog.objects.bulk_create([SOSLog(user=cls.user, action='auto_shake') for _ in range(30)])
+        IncidentReport.objects.bulk_create([
+            IncidentReport(user=cls.user, latitude=22.57 + i * 0.001, longitude=88.36, description='Followed',
+                           severity='medium')
+            for i in range(30)
+        ])
+
+        # A neighbour with a live SOS, so the alert queries have work to do.
+        cls.neighbour = User.objects.create_user('bina', password='pw-bina-123')
+        Profile.objects.create(user=cls.neighbour, is_sos_active=True)
+        UserLocation.objects.create(user=cls.neighbour, latitude=22.575, longitude=88.365)
+
+        cls.token = Token.objects.create(user=cls.user)
+        # Last seen a few minutes ago, so the fixes the tests post are newer.
+        UserLocation.objects.update(last_updated=timezone.now() - timedelta(minutes=5))
+
+    def setUp(self):
+        caches['risk_tiles'].clear()
+        # LocMem outlives each test's rolled-back transaction.
+        caches['user_state'].clear()
+        # Alert polls read the snapshot; the stale-snapshot rebuild is tested separately.
+        sos_snapshot.publish()
+        # Route exposure was built from rows the last test rolled back.
+        routing.mark_stale()
+
+    def start_journey(self, eta_minutes=30):
+        return JourneyTracker.objects.create(user=self.user, destination='Home', eta_minutes=eta_minutes)
+
+
+class QueryBudgetTestCase(SafetyTestCase):
+
+    def assertBudget(self, budget, method, url, **kwargs):
+        """Issue one request, pin its query count and check each statement's plan."""
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, **kwargs)
+            if response.streaming:
+                # A streamed body is read from the database as it is sent.
+                response.streamed = b''.join(response.streaming_content)
+        statements = [q['sql'] for q in ctx.captured_queries]
+        self.assertEqual(len(statements), budget, f'{method.upper()} {url}:\n' + '\n'.join(statements))
+        if connection.vendor == 'sqlite':
+            for sql in statements:
+                if sql.lstrip().upper().startswith(EXPLAINABLE):
+                    self.assertEqual(full_scans(sql), [], f'Full scan in {method.upper()} {url}:\n{sql}')
+        return response
+
+
+class WebViewBudgetTests(QueryBudgetTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        # Budgets are for a warm user cache, as on a poller's every request.
+        user_cache.user_for(self.user.id)
+
+    def test_register(self):
+        self.client.logout()
+        self.assertBudget(0, 'get', reverse('register'))
+        self.assertBudget(13, 'post', reverse('register'), data={
+            'username': 'chitra', 'password1': 'a-Long-pass-123', 'password2': 'a-Long-pass-123',
+        })
+
+    def test_login_logout(self):
+        self.client.logout()
+        self.assertBudget(0, 'get', reverse('login'))
+        self.assertBudget(9, 'post', reverse('login'), data={'username': 'asha', 'password': 'pw-asha-123'})
+        self.assertBudget(3, 'get', reverse('logout'))
+
+    def test_home(self):
+        self.start_journey()
+        self.assertBudget(1, 'get', reverse('home'))
+
+    def test_profile_settings(self):
+        self.assertBudget(1, 'get', reverse('profile_settings'))
+        self.assertBudget(1, 'post', reverse('profile_settings'), data={'real_pin': '4321', 'duress_pin': '8888'})
+
+    def test_trusted_contacts(self):
+        self.assertBudget(1, 'get', reverse('trusted_contacts'))
+        self.assertBudget(1, 'post', reverse('add_trusted_contact'), data={
+            'name': 'New', 'email': 'new@example.com', 'phone_number': '911',
+        })
+        self.assertBudget(2, 'post', reverse('add_trusted_contact'), data={
+            'name': 'Bina', 'email': 'bina@example.com', 'phone_number': '912', 'account': 'bina',
+        })
+        self.assertEqual(TrustedContact.objects.get(name='Bina').account, self.neighbour)
+        response = self.client.post(reverse('add_trusted_contact'), data={
+            'name': 'Ghost', 'email': 'ghost@example.com', 'phone_number': '913', 'account': 'ghost',
+        })
+        self.assertContains(response, 'No Raksha account is called')
+        self.assertFalse(TrustedContact.objects.filter(name='Ghost').exists())
+        self.assertBudget(3, 'post', reverse('delete_trusted_contact', args=[self.contacts[0].id]))
+
+    def test_sos_and_deactivate(self):
+        self.assertBudget(9, 'post', reverse('sos'), data={'lat': '22.57', 'lon': '88.36'})
+        self.assertBudget(9, 'post', reverse('deactivate_sos'), data={'pin': '1234'})
+        self.assertBudget(4, 'post', reverse('deactivate_sos'), data={'pin': '9999'})
+
+    def test_sos_history(self):
+        response = self.assertBudget(1, 'get', reverse('sos_history'))
+        self.assertBudget(1, 'get', reverse('sos_history') + '?cursor=' + response.context['next_cursor'])
+
+    def test_location_and_alerts(self):
+        # UPDATE location + INSERT history point, committed together (SAVEPOINT/RELEASE here).
+        self.assertBudget(4, 'post', reverse('update_location'), data={'lat': '22.5730', 'lon': '88.3640'})
+        self.assertBudget(1, 'get', reverse('check_alerts'))
+        self.assertBudget(0, 'get', reverse('alert_stream'))
+
+    def test_analyze_voice(self):
+        self.assertBudget(0, 'post', reverse('analyze_voice'), data=pcm16(tone(700, amplitude=0.4)),
+                          content_type='audio/l16; rate=16000')
+
+    def test_safe_route(self):
+        self.assertBudget(0, 'get', reverse('safe_route'))
+        route = reverse('route_plan') + '?from=22.5601,88.3501&to=22.5649,88.3599'
+        self.assertBudget(2, 'get', route)
+        self.assertBudget(1, 'get', route)
+        self.assertBudget(1, 'get', reverse('geocode') + '?q=park')
+        self.assertBudget(0, 'get', reverse('geocode') + '?q=park&lat=22.57&lon=88.36')
+
+    def test_safe_walk(self):
+        self.assertBudget(1, 'get', reverse('safe_walk'))
+        self.assertBudget(2, 'post', reverse('safe_walk'), data={'destination': 'Home', 'eta_minutes': '20'})
+        self.assertBudget(1, 'get', reverse('check_journey'))
+        self.assertBudget(2, 'post', reverse('arrive_safe'))
+
+    def test_incidents(self):
+        self.assertBudget(0, 'get', reverse('incident_report'))
+        self.assertBudget(1, 'post', reverse('incident_report'), data={
+            'latitude': '22.58', 'longitude': '88.37', 'description': 'Poorly lit', 'severity': 'low',
+        })
+        self.assertBudget(0, 'get', reverse('incident_success'))
+        self.assertBudget(1, 'get', reverse('get_incidents') + '?lat=22.57&lon=88.36&radius_km=2')
+        self.assertBudget(1, 'get', reverse('incidents_viewport') + '?bbox=88.35,22.56,88.40,22.62&zoom=16')
+        self.assertBudget(1, 'get', reverse('incidents_viewport') + '?bbox=88.0,22.0,89.0,23.0&zoom=11')
+
+    def test_risk(self):
+        self.assertBudget(1, 'get', reverse('risk_tile', args=[15, 24429, 14217]))
+        self.assertBudget(0, 'get', reverse('risk_tile', args=[15, 24429, 14217]))
+        self.assertBudget(1, 'get', reverse('risk_point') + '?lat=22.57&lon=88.36')
+
+
+class ApiViewBudgetTests(QueryBudgetTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.auth = {'HTTP_AUTHORIZATION': f'Token {self.token.key}'}
+        user_cache.user_for(user_cache.token_user_id(self.token.key))
+
+    def test_register_login_logout(self):
+        self.assertBudget(8, 'post', reverse('api_register'), data={
+            'username': 'devi', 'password': 'a-Long-pass-123', 'password2': 'a-Long-pass-123',
+        })
+        self.assertBudget(2, 'post', reverse('api_login'), data={'username': 'asha', 'password': 'pw-asha-123'})
+        self.assertBudget(2, 'post', reverse('api_logout'), **self.auth)
+
+    def test_profile(self):
+        self.assertBudget(1, 'get', reverse('api_profile'), **self.auth)
+        self.assertBudget(1, 'patch', reverse('api_profile'), data={'real_pin': '4321', 'duress_pin': '8888'},
+                          content_type='application/json', **self.auth)
+
+    def test_contacts(self):
+        self.assertBudget(1, 'get', reverse('api_contacts'), **self.auth)
+        self.assertBudget(1, 'post', reverse('api_contacts'), data={
+            'name': 'New', 'email': 'new@example.com', 'phone_number': '911',
+        }, **self.auth)
+        self.assertBudget(2, 'delete', reverse('api_contact_delete', args=[self.contacts[0].id]), **self.auth)
+
+    def test_contacts_bulk_import_and_export(self):
+        contacts = [{'name': f'Staff {i}', 'email': f'staff{i}@example.com', 'phone_number': f'+91 98{i:08d}'}
+                    for i in range(500)]
+        # Already a contact (emails compare case-insensitively), and a repeat within the batch.
+        contacts += [{'name': 'Again', 'email': 'C1@example.com', 'phone_number': '1'},
+                     {'name': 'Twice', 'email': 'twice@example.com', 'phone_number': '+91-98-00000000'}]
+        # SAVEPOINT, existing contacts, three INSERTs (SQLite's 999-parameter limit), RELEASE.
+        response = self.assertBudget(6, 'post', reverse('api_contacts_import'), data=contacts,
+                                     content_type='application/json', **self.auth)
+        self.assertEqual(response.json(), {'created': 500, 'skipped': 2})
+        self.assertEqual(len(user_cache.contacts_for(self.user)), 503)
+
+        response = self.assertBudget(1, 'get', reverse('api_contacts_export', args=['csv']), **self.auth)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        lines = response.streamed.decode().splitlines()
+        self.assertEqual((lines[0], lines[-1]), ('name,email,phone_number', 'Staff 499,staff499@example.com,+91 9800000499'))
+        self.assertEqual(len(lines), 504)
+        # The export imports back as all duplicates.
+        response = self.client.post(reverse('api_contacts_import'), data=response.streamed, content_type='text/csv',
+                                    **self.auth)
+        self.assertEqual(response.json(), {'created': 0, 'skipped': 503})
+
+        response = self.assertBudget(1, 'get', reverse('api_contacts_export', args=['ndjson']), **self.auth)
+        first = json.loads(response.streamed.decode().splitlines()[0])
+        self.assertEqual(first, {'name': 'Contact 0', 'email': 'c0@example.com', 'phone_number': '900000000'})
+        self.assertEqual(self.client.get(reverse('api_contacts_export', args=['xml']), **self.auth).status_code, 404)
+
+    def test_sos_and_incident_exports(self):
+        duress = SOSLog.objects.create(user=self.user, action='duress')
+        SOSLog.objects.create(user=self.neighbour, action='triggered')
+        IncidentReport.objects.create(user=self.neighbour, latitude=22.6, longitude=88.4, description='Groped',
+                                      severity='high')
+
+        # Without staff rights only the caller's own rows, oldest first.
+        response = self.assertBudget(1, 'get', reverse('api_sos_history_export', args=['ndjson']), **self.auth)
+        rows = [json.loads(line) for line in response.streamed.decode().splitlines()]
+        self.assertEqual(len(rows), 31)
+        self.assertEqual((rows[-1]['id'], rows[-1]['action'], rows[-1]['user_id']), (duress.id, 'duress', self.user.id))
+        response = self.assertBudget(1, 'get', reverse('api_sos_history_export', args=['csv']),
+                                     data={'action': 'duress', 'start': duress.timestamp.isoformat()}, **self.auth)
+        lines = response.streamed.decode().splitlines()
+        self.assertEqual(lines[0], 'id,user_id,action,latitude,longitude,timestamp,notes')
+        self.assertEqual(len(lines), 2)
+        response = self.assertBudget(1, 'get', reverse('api_incidents_export', args=['csv']),
+                                     data={'severity': 'medium'}, **self.auth)
+        self.assertEqual(len(response.streamed.decode().splitlines()), 31)
+
+        for params in ({'action': 'waved'}, {'start': '2026-01-01T00:00:00'}, {'user': 'nobody'}):
+            response = self.client.get(reverse('api_sos_history_export', args=['csv']), params, **self.auth)
+            self.assertEqual(response.status_code, 400, params)
+        response = self.client.get(reverse('api_incidents_export', args=['csv']), {'user': 'bina'}, **self.auth)
+        self.assertEqual(response.status_code, 403)
+
+        # Investigators (staff) can export anyone's records.
+        staff = User.objects.create_user('dipa', password='pw-dipa-123', is_staff=True)
+        staff_auth = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=staff).key}'}
+        user_cache.user_for(user_cache.token_user_id(staff_auth['HTTP_AUTHORIZATION'][6:]))
+        response = self.assertBudget(2, 'get', reverse('api_incidents_export', args=['ndjson']),
+                                     data={'user': 'bina'}, **staff_auth)
+        self.assertEqual([json.loads(line)['description'] for line in response.streamed.decode().splitlines()],
+                         ['Groped'])
+        # Unfiltered, an export walks the whole table in time order.
+        response = self.client.get(reverse('api_sos_history_export', args=['csv']), **staff_auth)
+        self.assertEqual(len(b''.join(response.streaming_content).decode().splitlines()), 33)
+
+    def test_contacts_bulk_import_is_all_or_nothing(self):
+        response = self.client.post(reverse('api_contacts_import'), data=[
+            {'name': 'Good', 'email': 'good@example.com', 'phone_number': '1'},
+            {'name': 'Bad', 'email': 'not-an-email', 'phone_number': '2'},
+        ], content_type='application/json', **self.auth)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.json()), ['1'])
+        self.assertFalse(TrustedContact.objects.filter(name='Good').exists())
+        upload = io.BytesIO(b'name,email,phone_number\nFile,file@example.com,5\n')
+        upload.name = 'contacts.csv'
+        response = self.client.post(reverse('api_contacts_import'), {'file': upload}, **self.auth)
+        self.assertEqual(response.json(), {'created': 1, 'skipped': 0})
+
+    def test_sos(self):
+        self.assertBudget(6, 'post', reverse('api_sos_trigger'), data={'lat': 22.57, 'lon': 88.36}, **self.auth)
+        self.assertBudget(1, 'get', reverse('api_sos_status'), **self.auth)
+        self.assertBudget(5, 'post', reverse('api_sos_deactivate'), data={'pin': '1234'}, **self.auth)
+        self.assertBudget(4, 'post', reverse('api_sos_deactivate'), data={'pin': '9999'}, **self.auth)
+        self.assertBudget(1, 'get', reverse('api_sos_history'), **self.auth)
+
+    def test_sos_with_warm_user_cache_only_writes(self):
+        user_cache.profile_for(self.user)
+        user_cache.contacts_for(self.user)
+        response = self.assertBudget(5, 'post', reverse('api_sos_trigger'), data={'lat': 22.57, 'lon': 88.36},
+                                     **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertBudget(0, 'get', reverse('api_sos_status'), **self.auth)
+        self.assertTrue(response.wsgi_request.user.profile.is_sos_active)
+
+    def test_location(self):
+        response = self.client.post(reverse('api_update_location'), data=[22.5, 88.3],
+                                    content_type='application/json', **self.auth)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_update_location'), **self.auth).status_code, 405)
+        now = timezone.now()
+        fixes = [{'lat': 22.57 + i * 1e-4, 'lon': 88.36, 'ts': (now - timedelta(seconds=60 - i)).isoformat()}
+                 for i in range(50)]
+        self.assertBudget(4, 'post', reverse('api_update_location_batch'), data={'fixes': fixes},
+                          content_type='application/json', **self.auth)
+        self.assertBudget(4, 'post', reverse('api_update_location'), data={'lat': 22.573, 'lon': 88.364},
+                          **self.auth)
+        self.assertBudget(4, 'post', reverse('api_update_location'), data={'lat': 22.574, 'lon': 88.365},
+                          content_type='application/json', **self.auth)
+        start = (now - timedelta(hours=1)).isoformat()
+        self.assertBudget(3, 'get', reverse('api_location_trail', args=[self.user.id]),
+                          data={'start': start, 'end': now.isoformat()}, **self.auth)
+        self.assertBudget(1, 'get', reverse('api_check_alerts'), **self.auth)
+        self.assertBudget(0, 'get', reverse('api_alert_stream'), **self.auth)
+
+    def test_trail_access(self):
+        def trail_status(viewer, target, **params):
+            self.client.force_login(viewer)
+            return self.client.get(reverse('api_location_trail', args=[target.id]), params).status_code
+
+        friend = User.objects.create_user('chitra', password='pw-chitra-123', email='c0@example.com')
+        # Has c0's email too, but asha never named this account.
+        lookalike = User.objects.create_user('chitra2', password='pw-chitra-123', email='c0@example.com')
+        staff = User.objects.create_user('dipa', password='pw-dipa-123', is_staff=True)
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('api_contacts'), {
+            'name': 'Chitra', 'email': 'c0@example.com', 'phone_number': '912', 'account': 'chitra',
+        })
+        self.assertEqual(response.json()['account'], 'chitra')
+        response = self.client.post(reverse('api_contacts'), {
+            'name': 'Nobody', 'email': 'n@example.com', 'phone_number': '913', 'account': 'no-such-user',
+        })
+        self.assertEqual(response.status_code, 400)
+
+        # No SOS and no journey: nobody else sees the trail.
+        self.assertEqual(trail_status(self.user, self.user), 200)
+        for viewer in (friend, staff):
+            self.assertEqual(trail_status(viewer, self.user), 404, viewer)
+        journey = self.start_journey()
+        self.assertEqual(trail_status(friend, self.user), 200)
+        self.assertEqual(trail_status(lookalike, self.user), 404)
+        self.assertEqual(trail_status(self.neighbour, self.user), 404)
+        journey.status = 'completed'
+        journey.save()
+        self.assertEqual(trail_status(friend, self.user), 404)
+        Profile.objects.filter(user=self.user).update(is_sos_active=True)
+        caches['user_state'].clear()
+        self.assertEqual(trail_status(friend, self.user), 200)
+        self.assertEqual(trail_status(lookalike, self.user), 404)
+        # bina's SOS is live too, but chitra is not her contact.
+        self.assertEqual(trail_status(friend, self.neighbour), 404)
+        self.assertEqual(trail_status(staff, self.neighbour), 200)
+
+        now = timezone.now()
+        self.assertEqual(trail_status(friend, self.user, start=(now - timedelta(days=8)).isoformat(),
+                                      end=now.isoformat()), 400)
+        self.assertEqual(trail_status(friend, self.user, start='2026-01-01T00:00:00',
+                                      end='2026-01-01T06:00:00'), 400)
+        self.assertEqual(trail_status(friend, self.user, start=now.isoformat(),
+                                      end=(now - timedelta(hours=1)).isoformat()), 400)
+
+    def test_analyze_voice(self):
+        self.assertBudget(0, 'post', reverse('api_analyze_voice'), data={'audio': wav_file(tone(700))},
+                          format='multipart', **self.auth)
+
+    def test_async_views_accept_the_session(self):
+        self.client.force_login(self.user)
+        response = self.assertBudget(2, 'get', reverse('api_sos_status'))
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post(reverse('api_update_location'), data={'lat': 22.573, 'lon': 88.364})
+        self.assertEqual(response.status_code, 200)
+        # Like SessionAuthentication, a session-only write needs the CSRF token.
+        browser = Client(enforce_csrf_checks=True)
+        browser.force_login(self.user)
+        self.assertEqual(browser.get(reverse('api_check_alerts')).status_code, 200)
+        self.assertEqual(browser.post(reverse('api_update_location'), data={'lat': 22.5, 'lon': 88.3}).status_code,
+                         403)
+        self.assertEqual(browser.post(reverse('api_update_location'), data={'lat': 22.5, 'lon': 88.3},
+                                      **self.auth).status_code, 200)
+
+    def test_journey(self):
+        self.assertBudget(2, 'post', reverse('api_journey'), data={'destination': 'Home', 'eta_minutes': 20},
+                          **self.auth)
+        self.assertBudget(1, 'get', reverse('api_journey'), **self.auth)
+        self.assertBudget(2, 'post', reverse('api_journey_arrive'), **self.auth)
+        self.start_journey()
+        self.assertBudget(1, 'post', reverse('api_journey_cancel'), **self.auth)
+
+    def test_incidents(self):
+        self.assertBudget(1, 'get', reverse('api_incidents'), **self.auth)
+        self.assertBudget(1, 'get', reverse('api_incidents') + '?lat=22.57&lon=88.36&radius_km=2', **self.auth)
+        self.assertBudget(1, 'post', reverse('api_incidents'), data={
+            'latitude': 22.58, 'longitude': 88.37, 'description': 'Poorly lit', 'severity': 'low',
+        }, **self.auth)
+        self.assertBudget(1, 'get', reverse('api_incidents_viewport') + '?bbox=88.35,22.56,88.40,22.62&zoom=16',
+                          **self.auth)
+
+    def test_risk(self):
+        self.assertBudget(1, 'get', reverse('api_risk_tile', args=[15, 24429, 14217]), **self.auth)
+        self.assertBudget(1, 'get', reverse('api_risk_point') + '?lat=22.57&lon=88.36', **self.auth)
+
+    def test_route(self):
+        route = reverse('api_route') + '?from=22.5601,88.3501&to=22.5649,88.3599'
+        self.assertBudget(2, 'get', route, **self.auth)
+        self.assertBudget(1, 'get', route, **self.auth)
+
+    def test_geocode(self):
+        self.assertBudget(1, 'get', reverse('api_geocode') + '?q=park', **self.auth)
+        self.assertBudget(0, 'get', reverse('api_geocode') + '?q=park&lat=22.57&lon=88.36', **self.auth)
+
+
+class SOSSnapshotTests(QueryBudgetTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def alerts(self):
+        return [alert['username'] for alert in self.client.get(reverse('check_alerts')).json()['alerts']]
+
+    def test_alerts_answer_from_snapshot(self):
+        self.assertEqual(self.alerts(), ['bina'])
+        # Not yet republished, so the poll still reads the published state.
+        Profile.objects.filter(user=self.neighbour).update(is_sos_active=False)
+        self.assertEqual(self.alerts(), ['bina'])
+
+    @override_settings(SOS_SNAPSHOT_MAX_AGE_SECONDS=0)
+    def test_stale_snapshot_is_rebuilt_from_db(self):
+        Profile.objects.filter(user=self.neighbour).update(is_sos_active=False)
+        self.assertBudget(3, 'get', reverse('check_alerts'))
+        self.assertEqual(self.alerts(), [])
+
+    def test_sos_state_change_republishes_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('deactivate_sos'), data={'pin': '1234'})
+            self.client.force_login(self.neighbour)
+            self.client.post(reverse('deactivate_sos'), data={'pin': '1234'})
+        self.client.force_login(self.user)
+        self.assertEqual(self.alerts(), [])
+
+    def test_moving_sos_user_republishes_on_commit(self):
+        self.client.force_login(self.neighbour)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('update_location'), data={'lat': '23.5', 'lon': '88.0'})
+        self.client.force_login(self.user)
+        self.assertEqual(self.alerts(), [])
+
+
+class UserCacheTests(SafetyTestCase):
+
+    def test_contact_changes_invalidate_cache(self):
+        self.assertEqual(len(user_cache.contacts_for(self.user)), 3)
+        self.contacts[0].delete()
+        TrustedContact.objects.create(user=self.user, name='New', email='new@example.com', phone_number='911')
+        self.assertEqual([c.name for c in user_cache.contacts_for(self.user)], ['Contact 1', 'Contact 2', 'New'])
+
+    def test_profile_save_invalidates_cache(self):
+        profile = user_cache.profile_for(self.user)
+        profile.real_pin = '2468'
+        profile.save()
+        self.assertEqual(user_cache.profile_for(self.user).real_pin, '2468')
+
+    def test_set_sos_active_keeps_cached_profile_in_step(self):
+        user_cache.profile_for(self.user)
+        with self.assertNumQueries(1):
+            user_cache.set_sos_active(self.user, True)
+        with self.assertNumQueries(0):
+            self.assertTrue(user_cache.profile_for(self.user).is_sos_active)
+        self.assertTrue(Profile.objects.get(user=self.user).is_sos_active)
+
+    def test_pin_change_keeps_sos_set_elsewhere(self):
+        self.client.force_login(self.user)
+        auth = {'HTTP_AUTHORIZATION': f'Token {self.token.key}'}
+        for url, method, pin, kwargs in [
+            (reverse('api_profile'), 'patch', '4321', {'content_type': 'application/json', **auth}),
+            (reverse('profile_settings'), 'post', '5678', {}),
+        ]:
+            Profile.objects.filter(user=self.user).update(is_sos_active=False)
+            user_cache.profile_for(self.user)
+            # Another process raises the SOS; this one's cached profile still says off.
+            Profile.objects.filter(user=self.user).update(is_sos_active=True)
+            getattr(self.client, method)(url, data={'real_pin': pin, 'duress_pin': '8888'}, **kwargs)
+            profile = Profile.objects.get(user=self.user)
+            self.assertEqual((profile.real_pin, profile.is_sos_active), (pin, True))
+
+    def test_logout_revokes_cached_token(self):
+        auth = {'HTTP_AUTHORIZATION': f'Token {self.token.key}'}
+        self.assertEqual(self.client.get(reverse('api_sos_status'), **auth).status_code, 200)
+        self.client.post(reverse('api_logout'), **auth)
+        self.assertEqual(self.client.get(reverse('api_sos_status'), **auth).status_code, 401)
+
+    @override_settings(USER_CACHE_AUTH_SECONDS=10)
+    def test_token_revoked_elsewhere_expires_within_the_auth_window(self):
+        auth = {'HTTP_AUTHORIZATION': f'Token {self.token.key}'}
+        self.assertEqual(self.client.get(reverse('api_sos_status'), **auth).status_code, 200)
+        # Logged out on another worker: the row is gone, this worker's entry is not.
+        Token.objects.filter(key=self.token.key)._raw_delete('default')
+        self.assertEqual(self.client.get(reverse('api_sos_status'), **auth).status_code, 200)
+        later = time.time() + 11
+        with mock.patch.object(time, 'time', return_value=later):
+            self.assertEqual(self.client.get(reverse('api_sos_status'), **auth).status_code, 401)
+
+    def test_deactivated_user_loses_session(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('home')).status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('home')).status_code, 302)
+
+    def test_repeated_sos_flag_skips_session_write(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('sos'))
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(reverse('sos'))
+        self.assertFalse([q for q in ctx.captured_queries if 'django_session' in q['sql']])
+
+
+class MetricsTests(QueryBudgetTestCase):
+
+    def sample(self, text, series):
+        for line in text.splitlines():
+            if line.startswith(series + ' '):
+                return float(line.rsplit(' ', 1)[1])
+        return 0.0
+
+    def scrape(self):
+        return self.assertBudget(2, 'get', reverse('metrics')).content.decode()
+
+    def test_requests_and_sos_events_are_counted(self):
+        before = self.scrape()
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('sos'), data={'lat': '22.57', 'lon': '88.36'})
+        after = self.scrape()
+        for series in ['raksha_sos_events_total{action="triggered"}',
+                       'raksha_http_requests_total{method="POST",status="302",view="sos"}',
+                       'raksha_http_request_duration_seconds_count{view="sos"}',
+                       'raksha_db_queries_per_request_count{view="sos"}']:
+            self.assertEqual(self.sample(after, series) - self.sample(before, series), 1, series)
+        self.assertEqual(self.sample(after, 'raksha_active_sos_users'), 2)
+        self.assertEqual(self.sample(after, 'raksha_http_requests_in_flight'), 1)
+
+    def test_other_processes_are_summed(self):
+        path = os.path.join(metrics.metrics_dir(), 'worker-2.json')
+        os.makedirs(metrics.metrics_dir(), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({'counters': [['raksha_notifications_total', {'channel': 'sms', 'outcome': 'sent'}, 5]],
+                       'gauges': [], 'histograms': []}, f)
+        self.addCleanup(os.unlink, path)
+        metrics.inc('raksha_notifications_total', channel='sms', outcome='sent')
+        text = self.scrape()
+        self.assertGreaterEqual(self.sample(text, 'raksha_notifications_total{channel="sms",outcome="sent"}'), 6)
+
+    def test_async_views_count_their_queries(self):
+        before = self.scrape()
+        response = async_to_sync(AsyncClient().get)(reverse('api_sos_status'),
+                                                    headers={'Authorization': f'Token {self.token.key}'})
+        self.assertEqual(response.status_code, 200)
+        after = self.scrape()
+        series = 'raksha_db_queries_per_request_{}{{view="api_sos_status"}}'
+        self.assertEqual(self.sample(after, series.format('count')) - self.sample(before, series.format('count')), 1)
+        # Cold cache: the token, its user and the profile.
+        self.assertEqual(self.sample(after, series.format('sum')) - self.sample(before, series.format('sum')), 3)
+
+    @override_settings(METRICS_ALLOWED_IPS=[])
+    def test_scrape_is_restricted(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.5'], METRICS_CLIENT_IP_HEADER='HTTP_X_FORWARDED_FOR')
+    def test_scrape_behind_a_proxy(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url, HTTP_X_FORWARDED_FOR='10.0.0.5, 127.0.0.1').status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_X_FORWARDED_FOR='192.168.1.9, 10.0.0.5').status_code, 200)
+
+
+class VoiceTests(SafetyTestCase):
+    """The distress rule is deterministic, so fixed signals give fixed answers."""
+
+    def feed(self, *chunks, stream='s'):
+        return [voice.analyze_chunk(self.user.id, chunk, RATE, stream=stream, seq=i) for i, chunk in enumerate(chunks)]
+
+    def test_features(self):
+        features = voice.extract_features(tone(700, amplitude=0.4), RATE)
+        self.assertAlmostEqual(float(np.median(features['pitch'])), 700, delta=15)
+        self.assertLess(float(np.median(features['zcr'])), voice.NOISE_ZCR)
+        self.assertGreater(float(np.median(features['rms_db'])), -15)
+
+    def test_scream_after_quiet_is_danger(self):
+        quiet, scream = self.feed(tone(150, amplitude=0.002), tone(700, amplitude=0.4))
+        self.assertFalse(quiet['danger_detected'])
+        self.assertTrue(scream['danger_detected'])
+        self.assertEqual(scream['confidence'], scream['score'])
+
+    def test_speech_and_noise_are_not_danger(self):
+        speech = tone(150, amplitude=0.05)
+        noise = np.random.default_rng(1).normal(0, 0.3, 2 * RATE).astype(np.float32)
+        self.assertFalse(any(r['danger_detected'] for r in self.feed(speech, speech, noise)))
+
+    def test_only_new_frames_are_processed(self):
+        chunk = tone(700, amplitude=0.4, seconds=0.5)
+        first, second = self.feed(chunk, chunk)
+        n, hop = voice.frame_size(RATE)
+        self.assertEqual(first['frames'] + second['frames'], (2 * len(chunk) - n) // hop + 1)
+        retry = voice.analyze_chunk(self.user.id, chunk, RATE, stream='s', seq=1)
+        self.assertEqual(retry['frames'], 0)
+        self.assertEqual(retry['score'], second['score'])
+
+    def test_async_analysis_continues_the_same_stream(self):
+        chunk = tone(700, amplitude=0.4, seconds=0.5)
+        expected = self.feed(chunk, chunk, chunk, stream='sync')
+        voice.analyze_chunk(self.user.id, chunk, RATE, stream='s', seq=0)
+        analyze = async_to_sync(voice.aanalyze_chunk)
+        self.assertEqual([analyze(self.user.id, chunk, RATE, stream='s', seq=seq) for seq in (1, 2)], expected[1:])
+        self.assertEqual(voice.analyze_chunk(self.user.id, chunk, RATE, stream='s', seq=2)['frames'], 0)
+
+    @override_settings(VOICE_WORKERS=2, VOICE_TIMEOUT_SECONDS=0.01)
+    def test_busy_pool_leaves_the_stream_untouched(self):
+        chunk = tone(700, amplitude=0.4, seconds=0.5)
+        with override_settings(VOICE_WORKERS=0):
+            voice.analyze_chunk(self.user.id, chunk, RATE, stream='s', seq=0)
+        stuck = mock.Mock(submit=lambda *args: Future())
+        with mock.patch.object(voice, '_get_pool', return_value=stuck):
+            with self.assertRaises(voice.VoiceBusy):
+                voice.features_for(chunk, RATE)
+            with self.assertRaises(voice.VoiceBusy):
+                voice.analyze_chunk(self.user.id, chunk, RATE, stream='s', seq=1)
+        # The timed-out chunk was not counted, so its resend is analysed.
+        with override_settings(VOICE_WORKERS=0):
+            self.assertEqual(voice.analyze_chunk(self.user.id, chunk, RATE, stream='s', seq=1),
+                             self.feed(chunk, chunk, stream='t')[1])
+
+    @override_settings(VOICE_WORKERS=2, VOICE_TIMEOUT_SECONDS=0.01)
+    def test_busy_pool_is_a_503_for_async_views(self):
+        stuck = mock.Mock(submit=lambda *args: Future())
+        with mock.patch.object(voice, '_get_pool', return_value=stuck):
+            with self.assertRaises(voice.VoiceBusy):
+                async_to_sync(voice.aanalyze_chunk)(self.user.id, tone(700), RATE, stream='s', seq=0)
+            response = self.client.post(reverse('api_analyze_voice'), data={'audio': wav_file(tone(700))},
+                                        HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(response.status_code, 503)
+
+    def test_rejects_bad_audio(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.post(reverse('analyze_voice')).status_code, 400)
+        response = self.client.post(reverse('analyze_voice'), data=b'RIFFjunk', content_type='audio/wav')
+        self.assertEqual(response.status_code, 400)
+
+
+class RoutingTests(SafetyTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Keep the budget fixtures' incidents out of the way of the row under test.
+        IncidentReport.objects.all().delete()
+
+    def plan(self, safety=None):
+        return routing.plan(grid_point(10, 0), grid_point(10, 20), safety)
+
+    def test_build_skips_unwalkable_ways(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, 'grid.osm.gz')
+            with gzip.open(source, 'wb') as f:
+                f.write(grid_osm())
+            output = os.path.join(tmp, 'graph.npz')
+            call_command('build_walk_graph', source, output=output, stdout=io.StringIO())
+            graph = routing.Graph.load(output)
+        n = GRID_SIZE
+        self.assertEqual(graph.node_count, n * n)
+        # Every street segment both ways, and no diagonal.
+        self.assertEqual(len(graph.indices), 2 * 2 * n * (n - 1))
+
+    def test_straight_route_without_incidents(self):
+        route = self.plan()
+        self.assertAlmostEqual(route['distance_m'], 20 * GRID_STEP * routing.METRES_PER_DEG * 0.924, delta=15)
+        self.assertEqual(len(route['path']), 21)
+        self.assertEqual(route['risk']['level'], 'minimal')
+
+    def test_route_detours_around_new_incident(self):
+        straight = self.plan()
+        graph = routing.get_graph()
+        built_at = graph.risk_built_at
+        IncidentReport.objects.create(user=self.user, latitude=grid_point(10, 10)[0],
+                                      longitude=grid_point(10, 10)[1], description='Attack', severity='high')
+        detour = self.plan()
+        # Picked up incrementally, without a rebuild.
+        self.assertEqual(graph.risk_built_at, built_at)
+        self.assertGreater(detour['distance_m'], straight['distance_m'])
+        self.assertLess(detour['risk']['peak'], routing.plan(grid_point(10, 0), grid_point(10, 20), 0)['risk']['peak'])
+        self.assertNotIn([round(v, 6) for v in grid_point(10, 10)], detour['path'])
+
+    def test_deleted_incident_is_forgotten(self):
+        incident = IncidentReport.objects.create(user=self.user, latitude=grid_point(10, 10)[0],
+                                                 longitude=grid_point(10, 10)[1], description='x', severity='high')
+        detour = self.plan()
+        incident.delete()
+        self.assertLess(self.plan()['distance_m'], detour['distance_m'])
+
+    def test_errors(self):
+        self.client.force_login(self.user)
+        url = reverse('route_plan')
+        self.assertEqual(self.client.get(url + '?from=22.56,88.35').status_code, 400)
+        self.assertEqual(self.client.get(url + '?from=22.56,88.35&to=22.56,88.36&safety=-1').status_code, 400)
+        far = self.client.get(url + '?from=22.56,88.35&to=23.5,88.35')
+        self.assertEqual(far.status_code, 400)
+        with override_settings(ROUTING_GRAPH_PATH=os.path.join(SNAPSHOT_DIR, 'missing.npz')):
+            self.assertEqual(self.client.get(url + '?from=22.56,88.35&to=22.56,88.36').status_code, 503)
+
+
+class GeocoderTests(SafetyTestCase):
+
+    def search(self, query, **params):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('geocode'), {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_prefix_ranked_by_proximity_to_last_location(self):
+        results = self.search('park st')
+        self.assertEqual([r['name'] for r in results[:2]], ['Park Street', 'Park Street'])
+        self.assertLess(results[0]['distance_km'], results[1]['distance_km'])
+        # An explicit position overrides the stored one.
+        far = self.search('park st', lat=23.2, lon=88.9)
+        self.assertEqual((far[0]['lat'], far[0]['lon']), (23.2, 88.9))
+
+    def test_autocomplete_and_typos(self):
+        self.assertEqual({r['name'] for r in self.search('par')},
+                         {'Park Street', 'Park Circus', 'Parkview Hospital'})
+        self.assertEqual(self.search('cafe')[0]['name'], 'Café Coffee Day')
+        self.assertEqual(self.search('salt lak stadum')[0]['name'], 'Salt Lake Stadium')
+        self.assertEqual(self.search('zzzz'), [])
+
+    def test_import_command_reads_osm(self):
+        osm = b"""<osm>
+            <node id="1" lat="22.55" lon="88.35"><tag k="amenity" v="police"/><tag k="name" v="Park Street Thana"/></node>
+            <node id="2" lat="22.570" lon="88.37"/><node id="3" lat="22.571" lon="88.37"/><node id="4" lat="22.572" lon="88.37"/>
+            <node id="5" lat="22.59" lon="88.39"><tag k="highway" v="crossing"/><tag k="name" v="Nameless crossing"/></node>
+            <way id="10"><nd ref="2"/><nd ref="3"/><nd ref="4"/><tag k="highway" v="residential"/><tag k="name" v="Lindsay Street"/></way>
+            <way id="11"><nd ref="3"/><nd ref="4"/><tag k="highway" v="residential"/><tag k="name" v="Lindsay Street"/></way>
+        </osm>"""
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, 'city.osm')
+            with open(source, 'wb') as f:
+                f.write(osm)
+            output = os.path.join(tmp, 'places.npz')
+            call_command('import_places', source, output=output, stdout=io.StringIO())
+            index = geocoder.PlaceIndex.load(output)
+        self.assertEqual(sorted(index.name.tolist()), ['Lindsay Street', 'Park Street Thana'])
+        street = index.search('lindsay')[0]
+        self.assertEqual((street['kind'], street['lat']), ('street', 22.571))
+
+    def test_journey_keeps_destination_coordinates(self):
+        token = {'HTTP_AUTHORIZATION': f'Token {self.token.key}'}
+        response = self.client.post(reverse('api_journey'), {
+            'destination': 'Park Street', 'eta_minutes': 20, 'destination_lat': 22.553, 'destination_lon': 88.352,
+        }, content_type='application/json', **token)
+        self.assertEqual((response.json()['destination_lat'], response.json()['destination_lon']), (22.553, 88.352))
+        response = self.client.post(reverse('api_journey'), {
+            'destination': 'Park Street', 'eta_minutes': 20, 'destination_lat': 22.553,
+        }, content_type='application/json', **token)
+        self.assertEqual(response.status_code, 400)
+
+    def test_missing_index(self):
+        self.client.force_login(self.user)
+        with override_settings(GEOCODER_INDEX_PATH=os.path.join(SNAPSHOT_DIR, 'missing.npz')):
+            self.assertEqual(self.client.get(reverse('geocode'), {'q': 'park'}).status_code, 503)
+        self.assertEqual(self.client.get(reverse('geocode'), {'q': ' '}).status_code, 400)
+
+
+class RiskTileTests(SafetyTestCase):
+
+    def test_new_incident_evicts_exactly_the_tiles_it_reaches(self):
+        lat, lon = 13.05, 80.25
+        x, y, _, _ = risk.tile_for(lat, lon, risk.POINT_ZOOM)
+        tiles = [(risk.POINT_ZOOM, x + dx, y + dy) for dx in range(-3, 4) for dy in range(-3, 4)]
+        tiles += [(10, *risk.tile_for(lat, lon, 10)[:2]), (10, *risk.tile_for(*KOLKATA, 10)[:2])]
+        before = {tile: risk.get_grid(*tile) for tile in tiles}
+        for tile in tiles:
+            risk.get_png(*tile)
+        touched = set(risk.touched_tiles(lat, lon))
+
+        IncidentReport.objects.create(user=self.user, latitude=lat, longitude=lon, description='Followed',
+                                      severity='high')
+        cache = caches['risk_tiles']
+        for tile in tiles:
+            evicted = {cache.get(risk._tile_key(*tile)) is None, cache.get(risk._png_key(*tile)) is None}
+            self.assertEqual(evicted, {tile in touched}, tile)
+        # Every tile whose grid the incident changes was evicted, and some were kept.
+        changed = {tile for tile in tiles if not np.array_equal(risk.get_grid(*tile), before[tile])}
+        self.assertTrue(changed)
+        self.assertLessEqual(changed, touched)
+        self.assertTrue(set(tiles) - touched)
+
+
+class ViewportTests(SafetyTestCase):
+    """Chennai, away from the fixture incidents. At zoom 10 a cell is 360 / 2**10 / 4 = 0.087890625 degrees."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def viewport(self, bbox, zoom):
+        return self.client.get(reverse('incidents_viewport'), {'bbox': bbox, 'zoom': zoom})
+
+    def report(self, lat, lon, severity='medium'):
+        IncidentReport.objects.create(user=self.user, latitude=lat, longitude=lon, description='Followed',
+                                      severity=severity)
+
+    def test_incidents_are_bucketed_by_cell(self):
+        # Cell (912, 148) spans 80.15625..80.24414 E, 13.00781..13.09570 N.
+        self.report(13.02, 80.17, 'high')
+        self.report(13.04, 80.20, 'low')
+        self.report(13.03, 80.25)  # the cell to the east
+        self.report(13.00, 80.17)  # the cell to the south
+        body = self.viewport('80.0,12.9,80.4,13.2', 10).json()
+        self.assertEqual((body['mode'], body['cell_degrees']), ('cells', 0.087890625))
+        cells = sorted((round(c['lat'], 6), round(c['lon'], 6), c['count'], c['low'], c['medium'], c['high'])
+                       for c in body['cells'])
+        self.assertEqual(cells, [(13.0, 80.17, 1, 0, 1, 0), (13.03, 80.185, 2, 1, 0, 1), (13.03, 80.25, 1, 0, 1, 0)])
+
+    def test_zoom_picks_cells_or_points(self):
+        self.report(13.02, 80.17)
+        cell_widths = [self.viewport('80.0,12.9,80.4,13.2', zoom).json().get('cell_degrees') for zoom in (0, 14)]
+        self.assertEqual(cell_widths, [90.0, 360.0 / 2 ** 14 / 4])
+        points = self.viewport('80.0,12.9,80.4,13.2', views.INCIDENT_POINTS_MIN_ZOOM).json()
+        self.assertEqual((points['mode'], len(points['incidents']), points['truncated']), ('points', 1, False))
+        # Zoom is bounded to the map's 0..22 and must be a whole level.
+        for zoom in (-1, 23, 10.5):
+            self.assertEqual(self.viewport('80.0,12.9,80.4,13.2', zoom).status_code, 400)
+
+    def test_empty_viewport(self):
+        self.assertEqual(self.viewport('80.0,12.9,80.4,13.2', 10).json()['cells'], [])
+        self.assertEqual(self.viewport('80.0,12.9,80.4,13.2', 16).json()['incidents'], [])
+
+    def test_viewport_across_the_antimeridian(self):
+        self.report(-17.7, 179.9)
+        self.report(-17.7, -179.9)
+        body = self.viewport('179.5,-18,-179.5,-17', 8).json()
+        self.assertEqual(sum(c['count'] for c in body['cells']), 2)
+
+
+class PaginationTests(SafetyTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Three runs of identical timestamps, each longer than a page.
+        now = timezone.now()
+        ids = list(SOSLog.objects.filter(user=self.user).order_by('id').values_list('id', flat=True))
+        for i, chunk in enumerate([ids[:12], ids[12:20], ids[20:]]):
+            SOSLog.objects.filter(id__in=chunk).update(timestamp=now - timedelta(minutes=i))
+        self.expected = list(SOSLog.objects.filter(user=self.user).order_by('-timestamp', '-id')
+                             .values_list('id', flat=True))
+
+    def test_ties_across_page_boundaries(self):
+        seen = []
+        url, params = reverse('api_sos_history'), {'page_size': 7}
+        while url:
+            page = self.client.get(url, params, HTTP_AUTHORIZATION=f'Token {self.token.key}').json()
+            seen += [row['id'] for row in page['results']]
+            url, params = page['next'], None
+        self.assertEqual(seen, self.expected)
+
+    def test_merged_pages_keep_the_order(self):
+        queryset = SOSLog.objects.filter(user=self.user)
+        seen, cursor = [], None
+        for _ in range(10):
+            page = pagination.paginate(queryset, '-timestamp', cursor=cursor, page_size=5, using=['default'])
+            seen += [log.id for log in page.items]
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        self.assertEqual(seen, self.expected)
+
+
+class OutboxTests(SafetyTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.dispatcher = outbox.Dispatcher(workers=2)
+
+    def notify(self, priority, **fields):
+        return Notification.objects.create(user=self.user, priority=priority, channel='email',
+                                           recipient='c0@example.com', body='Help', **fields)
+
+    def fail_delivery(self):
+        return mock.patch.object(outbox, 'deliver', side_effect=OSError('gateway down'))
+
+    def test_autostart_is_opt_in(self):
+        config = apps.get_app_config('safety_app')
+        with mock.patch.object(outbox.dispatcher, 'start') as start, \
+                mock.patch.object(outbox.dispatcher, 'wake'):
+            config.ready()
+            outbox.wake()
+            start.assert_not_called()
+            with override_settings(OUTBOX_AUTOSTART=True):
+                config.ready()
+                outbox.wake()
+            self.assertEqual(start.call_count, 2)
+
+    def test_claims_most_urgent_first(self):
+        queued = timezone.now() - timedelta(minutes=1)
+        safe = self.notify(Notification.PRIORITY_SAFE, next_attempt_at=queued - timedelta(minutes=1))
+        sos = self.notify(Notification.PRIORITY_SOS, next_attempt_at=queued)
+        duress = self.notify(Notification.PRIORITY_DURESS, next_attempt_at=queued)
+        claimed = [self.dispatcher.claim_next().id for _ in range(3)]
+        self.assertEqual(claimed, [duress.id, sos.id, safe.id])
+        self.assertIsNone(self.dispatcher.claim_next())
+
+    @override_settings(OUTBOX_BACKOFF_SECONDS=5)
+    def test_failed_sends_back_off(self):
+        row = self.notify(Notification.PRIORITY_SOS)
+        for attempt, delay in [(1, 5), (2, 10), (3, 20)]:
+            notification = self.dispatcher.claim_next()
+            self.assertEqual(notification.attempts, attempt)
+            before = timezone.now()
+            with self.fail_delivery():
+                self.assertFalse(self.dispatcher.send(notification))
+            row.refresh_from_db()
+            self.assertEqual((row.status, row.last_error), ('pending', 'gateway down'))
+            self.assertGreaterEqual(row.next_attempt_at, before + timedelta(seconds=delay))
+            self.assertLess(row.next_attempt_at, before + timedelta(seconds=delay + 5))
+            # Not due until the backoff has passed.
+            self.assertIsNone(self.dispatcher.claim_next())
+            Notification.objects.filter(id=row.id).update(next_attempt_at=before)
+        self.assertTrue(self.dispatcher.send(self.dispatcher.claim_next()))
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), ('sent', 4))
+
+    def test_expired_lease_is_reclaimed(self):
+        row = self.notify(Notification.PRIORITY_SOS)
+        self.assertEqual(self.dispatcher.claim_next().id, row.id)
+        # The worker holding the claim dies; nobody else may send it meanwhile.
+        self.assertIsNone(self.dispatcher.claim_next())
+        Notification.objects.filter(id=row.id).update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        reclaimed = self.dispatcher.claim_next()
+        self.assertEqual((reclaimed.id, reclaimed.status, reclaimed.attempts), (row.id, 'sending', 2))
+
+    def test_gives_up_after_max_attempts(self):
+        row = self.notify(Notification.PRIORITY_DURESS, attempts=self.dispatcher.max_attempts - 1)
+        with self.fail_delivery():
+            self.assertFalse(self.dispatcher.send(self.dispatcher.claim_next()))
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), ('failed', self.dispatcher.max_attempts))
+        Notification.objects.filter(id=row.id).update(next_attempt_at=timezone.now() - timedelta(hours=1))
+        self.assertIsNone(self.dispatcher.claim_next())
+
+
+class JourneySchedulerTests(SafetyTestCase):
+
+    def test_heap_pops_journeys_after_their_grace(self):
+        due = self.start_journey(eta_minutes=10)
+        later = self.start_journey(eta_minutes=60)
+        scheduler = journeys.JourneyScheduler()
+        scheduler.rebuild()
+        deadline = due.deadline.timestamp()
+        self.assertEqual(scheduler.pop_due(deadline + scheduler.grace - 1), [])
+        self.assertEqual(scheduler.pop_due(deadline + scheduler.grace), [due.id])
+        # Popped once; the later journey is still waiting.
+        self.assertEqual(scheduler.pop_due(deadline + scheduler.grace), [])
+        self.assertEqual(scheduler._scheduled, {later.id})
+
+    def test_each_journey_expires_once(self):
+        journey = self.start_journey()
+        arrived = self.start_journey()
+        JourneyTracker.objects.filter(id=arrived.id).update(status='arrived')
+        self.assertEqual(journeys.expire([journey.id, arrived.id]), 1)
+        # Another process popping the same journey loses the conditional update.
+        self.assertEqual(journeys.expire([journey.id, arrived.id]), 0)
+        self.assertEqual(JourneyTracker.objects.get(id=journey.id).status, 'expired')
+        self.assertEqual(JourneyTracker.objects.get(id=arrived.id).status, 'arrived')
+        self.assertEqual(SOSLog.objects.filter(user=self.user, action='auto_journey').count(), 1)
+        self.assertTrue(Profile.objects.get(user=self.user).is_sos_active)
+
+    def test_autostart_is_opt_in(self):
+        config = apps.get_app_config('safety_app')
+        with mock.patch.object(journeys.scheduler, 'start') as start:
+            config.ready()
+            self.start_journey()
+            start.assert_not_called()
+            with override_settings(JOURNEY_SCHEDULER_AUTOSTART=True):
+                config.ready()
+            start.assert_called_once_with()
+
+
+class LocationWriterTests(SafetyTestCase):
+
+    def test_compacted_day_reads_back_simplified(self):
+        # An L-shaped walk three days ago: 1 km north, then 1 km east, with a metre or two of GPS jitter.
+        start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=3)
+        corner = destination(*KOLKATA, 0, 1)
+        path = [destination(*KOLKATA, 0, i * 0.1) for i in range(10)] + \
+               [destination(*corner, 90, i * 0.1) for i in range(11)]
+        jitter = [0.00001 * (-1) ** i for i in range(len(path))]
+        times = [start + timedelta(hours=6, minutes=i) for i in range(len(path))]
+        LocationPoint.objects.bulk_create([
+            LocationPoint(user=self.user, recorded_at=at, latitude=lat + d, longitude=lon)
+            for at, (lat, lon), d in zip(times, path, jitter)
+        ])
+
+        self.assertEqual(history.compact(tolerance_m=10), {'days': 1, 'raw': 21, 'kept': 3, 'purged': 0})
+        self.assertFalse(LocationPoint.objects.filter(user=self.user).exists())
+        track = history.trail(self.user, start, start + timedelta(days=1))
+        self.assertEqual([row[0] for row in track], [times[0].timestamp(), times[10].timestamp(),
+                                                     times[20].timestamp()])
+        np.testing.assert_allclose(track[:, 1:], [
+            (path[0][0] + jitter[0], path[0][1]),
+            (path[10][0] + jitter[10], path[10][1]),
+            (path[20][0] + jitter[20], path[20][1]),
+        ])
+
+    def test_batch_is_one_transaction(self):
+        writer = location_writer.LocationWriter(window_ms=0)
+        now = timezone.now()
+        futures = [
+            writer.submit(self.user.id, [(now - timedelta(seconds=2), 22.571, 88.361)]),
+            writer.submit(self.user.id, [(now - timedelta(seconds=1), 22.572, 88.362)]),
+            writer.submit(self.neighbour.id, [(now, 22.576, 88.366)]),
+        ]
+        # SAVEPOINT, one UPDATE per user, one INSERT for all points, RELEASE.
+        with self.assertNumQueries(5):
+            self.assertEqual(writer.write_pending(), 3)
+        self.assertTrue(all(f.result(timeout=0) for f in futures))
+        self.assertEqual(UserLocation.objects.get(user=self.user).latitude, 22.572)
+        self.assertEqual(LocationPoint.objects.filter(user=self.user).count(), 2)
+
+    def test_older_fixes_never_move_the_user_back(self):
+        now = timezone.now()
+        UserLocation.objects.filter(user=self.user).update(last_updated=now - timedelta(days=1))
+        # Out of order within a batch: the newest fix wins.
+        location_writer.write_fixes({self.user.id: [(now - timedelta(hours=1), 5.0, 88.36),
+                                                    (now - timedelta(hours=2), 6.0, 88.36)]})
+        self.assertEqual(UserLocation.objects.get(user=self.user).latitude, 5.0)
+        location_writer.write_fixes({self.user.id: [(now, 10.0, 88.36)]})
+        # A delayed batch, older than the stored fix, only adds to the history.
+        location_writer.write_fixes({self.user.id: [(now - timedelta(hours=3), 1.0, 88.36),
+                                                    (now - timedelta(hours=4), 2.0, 88.36)]})
+        location = UserLocation.objects.get(user=self.user)
+        self.assertEqual((location.latitude, location.last_updated), (10.0, now))
+        self.assertEqual(LocationPoint.objects.filter(user=self.user).count(), 5)
+
+    def test_failed_batch_reports_to_every_caller(self):
+        writer = location_writer.LocationWriter(window_ms=0)
+        future = writer.submit(self.user.id, [(timezone.now(), 'not-a-number', 88.36)])
+        writer.write_pending()
+        with self.assertRaises(ValueError):
+            future.result(timeout=0)
+
+    @override_settings(LOCATION_WRITE_BATCHING=True)
+    def test_sos_user_fixes_skip_the_queue(self):
+        location_writer.record(self.neighbour, [(timezone.now(), 22.58, 88.37)])
+        self.assertEqual(UserLocation.objects.get(user=self.neighbour).latitude, 22.58)
+        async_to_sync(location_writer.arecord)(self.neighbour, [(timezone.now(), 22.59, 88.37)])
+        self.assertEqual(UserLocation.objects.get(user=self.neighbour).latitude, 22.59)
+        self.assertIsNone(location_writer.writer._thread)
+
+    def test_batches_wait_for_urgent_writes(self):
+        started = threading.Event()
+        batch = threading.Thread(target=lambda: (location_writer._wait_for_urgent(), started.set()))
+        with location_writer.urgent():
+            batch.start()
+            self.assertFalse(started.wait(0.05))
+        self.assertTrue(started.wait(1))
+        batch.join()
+
+
+class RetentionTests(SafetyTestCase):
+
+    def setUp(self):
+        super().setUp()
+        archive = override_settings(RETENTION_ARCHIVE_DIR=tempfile.mkdtemp(dir=SNAPSHOT_DIR),
+                                    RETENTION_BATCH_PAUSE_SECONDS=0)
+        archive.enable()
+        self.addCleanup(archive.disable)
+        self.now = timezone.now()
+        logs = list(SOSLog.objects.order_by('id').values_list('id', flat=True))
+        # 25 of the 30 logs are past a year old, spread over two months.
+        for i, log_id in enumerate(logs[:25]):
+            SOSLog.objects.filter(id=log_id).update(timestamp=self.now - timedelta(days=400 + i * 2))
+        self.notification = Notification.objects.create(
+            user=self.user, sos_log_id=logs[0], priority=Notification.PRIORITY_SOS, channel='email',
+            recipient='c0@example.com', body='SOS',
+        )
+
+    def test_expired_rows_move_to_the_archive_in_batches(self):
+        with CaptureQueriesContext(connection) as ctx:
+            moved = retention.purge(retention.POLICIES['soslog'], 365, batch_size=10)
+        self.assertEqual(moved, 25)
+        self.assertEqual(SOSLog.objects.count(), 5)
+        # Three batches, each deleted in its own transaction.
+        self.assertEqual(sum(q['sql'].startswith('DELETE') for q in ctx.captured_queries), 3)
+        self.notification.refresh_from_db()
+        self.assertIsNone(self.notification.sos_log_id)
+
+        rows = list(retention.search('soslog', user_id=self.user.id))
+        self.assertEqual(len(rows), 25)
+        self.assertEqual(rows[0]['action'], 'auto_shake')
+        months = sorted(p.name for p in retention.archive_dir().joinpath('soslog').iterdir())
+        self.assertEqual(len(months), len({retention._month(self.now - timedelta(days=400 + i * 2)) for i in range(25)}))
+
+        start, end = self.now - timedelta(days=410), self.now - timedelta(days=400)
+        self.assertEqual(len(list(retention.search('soslog', start=start, end=end))), 5)
+        self.assertEqual(list(retention.search('soslog', user_id=self.neighbour.id)), [])
+
+    def test_replayed_batch_is_not_duplicated(self):
+        # A crash between the archive write and the delete appends the batch again.
+        rows = list(SOSLog.objects.filter(timestamp__lt=self.now - timedelta(days=365)).values())
+        retention.append(retention.POLICIES['soslog'], rows)
+        retention.purge(retention.POLICIES['soslog'], 365)
+        self.assertEqual(len(list(retention.search('soslog'))), 25)
+
+    def test_commands(self):
+        JourneyTracker.objects.bulk_create([
+            JourneyTracker(user=self.user, destination='Old', eta_minutes=10, status='arrived'),
+            JourneyTracker(user=self.user, destination='Stuck', eta_minutes=10, status='active'),
+        ])
+        JourneyTracker.objects.update(started_at=self.now - timedelta(days=200))
+        out = io.StringIO()
+        call_command('purge_expired', stdout=out)
+        self.assertIn('soslog: archived 25 rows', out.getvalue())
+        self.assertIn('journeytracker: archived 1 rows', out.getvalue())
+        self.assertIn('incidentreport: archived 0 rows', out.getvalue())
+        self.assertEqual(list(JourneyTracker.objects.values_list('destination', flat=True)), ['Stuck'])
+
+        out = io.StringIO()
+        call_command('search_archive', 'journeytracker', user='asha', stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['destination'], 'Old')
+
+
+# A second database standing in for a region shard. The test runner only
+# creates it for test cases that list it in ``databases``.
+REGION_DB = 'region_east'
+connections.settings[REGION_DB] = {
+    **connections.settings['default'],
+    'TEST': {**connections.settings['default']['TEST'], 'NAME': None},
+}
+KOLKATA = (22.5726, 88.3639)
+# Outside every shard prefix, so stored in default.
+DELHI = (28.6139, 77.2090)
+
+
+@override_settings(REGION_SHARDS={'tun': REGION_DB})
+class RegionShardTests(SafetyTestCase):
+    databases = {'default', REGION_DB}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('asha', password='pw-asha-123')
+        Profile.objects.create(user=cls.user)
+        cls.neighbour = User.objects.create_user('bina', password='pw-bina-123')
+        Profile.objects.create(user=cls.neighbour, is_sos_active=True)
+        cls.auth = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=cls.user).key}'}
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def default_queries(self, table):
+        return CaptureQueriesContext(connections['default']), f'safety_app_{table}'
+
+    def test_routing(self):
+        self.assertEqual(regions.shard_for(*KOLKATA), REGION_DB)
+        self.assertEqual(regions.shard_for(*DELHI), 'default')
+        self.assertEqual(regions.shards_near(*KOLKATA, 5), [REGION_DB])
+        self.assertEqual(regions.shards_for_box(8.0, 68.0, 35.0, 97.0), ['default', REGION_DB])
+        self.assertTrue(router.allow_migrate_model(REGION_DB, UserLocation))
+        self.assertFalse(router.allow_migrate_model(REGION_DB, User))
+        self.assertFalse(router.allow_migrate_model(REGION_DB, Profile))
+
+    def test_fixes_follow_the_user_between_shards(self):
+        now = timezone.now()
+        location_writer.record(self.user, [(now - timedelta(minutes=1), *KOLKATA)])
+        self.assertEqual(UserLocation.objects.using(REGION_DB).get(user=self.user).latitude, KOLKATA[0])
+        self.assertFalse(UserLocation.objects.filter(user=self.user).exists())
+
+        location_writer.record(self.user, [(now, *DELHI)])
+        self.assertFalse(UserLocation.objects.using(REGION_DB).filter(user=self.user).exists())
+        self.assertEqual(regions.user_location(self.user.id).latitude, DELHI[0])
+        self.assertEqual(LocationPoint.objects.using(REGION_DB).filter(user=self.user).count(), 1)
+        track = history.trail(self.user, now - timedelta(hours=1), now)
+        self.assertEqual(track[:, 1].tolist(), [KOLKATA[0], DELHI[0]])
+
+        # A late fix from the old region doesn't pull the user back there.
+        location_writer.record(self.user, [(now - timedelta(seconds=30), *KOLKATA)])
+        self.assertFalse(UserLocation.objects.using(REGION_DB).filter(user=self.user).exists())
+        self.assertEqual(regions.user_location(self.user.id).latitude, DELHI[0])
+
+    def test_history_is_compacted_in_its_shard(self):
+        location_writer.record(self.user, [(timezone.now() - timedelta(days=3, minutes=i), *KOLKATA) for i in range(3)])
+        self.assertEqual(history.compact()['raw'], 3)
+        self.assertEqual(LocationTrail.objects.using(REGION_DB).filter(user=self.user).count(), 1)
+        self.assertFalse(LocationPoint.objects.using(REGION_DB).exists())
+
+    def test_alerts_read_the_users_shard(self):
+        location_writer.record(self.neighbour, [(timezone.now(), 22.575, 88.365)])
+        location_writer.record(self.user, [(timezone.now(), *KOLKATA)])
+        sos_snapshot.publish()
+        # Without the shard hint the lookup fans out once and remembers where it found the user.
+        caches['user_state'].clear()
+        self.assertEqual([a['username'] for a in self.client.get(reverse('check_alerts')).json()['alerts']], ['bina'])
+        ctx, table = self.default_queries('userlocation')
+        with ctx:
+            response = self.client.get(reverse('api_check_alerts'), **self.auth)
+        self.assertEqual([a['username'] for a in response.json()['alerts']], ['bina'])
+        self.assertFalse([q for q in ctx.captured_queries if table in q['sql']])
+
+    def test_incidents_are_stored_and_read_by_region(self):
+        for (lat, lon), description in ((KOLKATA, 'Followed'), (DELHI, 'Harassed')):
+            response = self.client.post(reverse('api_incidents'), {
+                'latitude': lat, 'longitude': lon, 'description': description, 'severity': 'high',
+            }, content_type='application/json', **self.auth)
+            self.assertEqual(response.status_code, 201)
+        self.client.post(reverse('incident_report'), {
+            'latitude': '22.58', 'longitude': '88.37', 'description': 'Catcalled', 'severity': 'low',
+        })
+        self.assertEqual(IncidentReport.objects.using(REGION_DB).count(), 2)
+        self.assertEqual(IncidentReport.objects.count(), 1)
+
+        ctx, table = self.default_queries('incidentreport')
+        with ctx:
+            response = self.client.get(reverse('get_incidents'), {'lat': KOLKATA[0], 'lon': KOLKATA[1]})
+        self.assertEqual(len(response.json()['incidents']), 2)
+        self.assertFalse([q for q in ctx.captured_queries if table in q['sql']])
+        self.assertEqual(len(self.client.get(reverse('get_incidents')).json()['incidents']), 3)
+
+        # Pages merge across shards, newest first.
+        page = self.client.get(reverse('api_incidents'), {'page_size': 2}, **self.auth).json()
+        self.assertEqual([i['description'] for i in page['results']], ['Catcalled', 'Harassed'])
+        page = self.client.get(page['next'], **self.auth).json()
+        self.assertEqual([i['description'] for i in page['results']], ['Followed'])
+        self.assertIsNone(page['next'])
+
+        cells = self.client.get(reverse('incidents_viewport'), {'bbox': '68,8,97,35', 'zoom': 4}).json()['cells']
+        self.assertEqual(sum(c['count'] for c in cells), 3)
+        self.assertEqual(set(routing.get_graph().last_incident_ids), {REGION_DB})
+
+    def test_incident_export_merges_shards_by_time(self):
+        for (lat, lon), description in ((KOLKATA, 'Followed'), (DELHI, 'Harassed'), (KOLKATA, 'Cornered')):
+            self.client.post(reverse('api_incidents'), {
+                'latitude': lat, 'longitude': lon, 'description': description, 'severity': 'high',
+            }, content_type='application/json', **self.auth)
+        response = self.client.get(reverse('api_incidents_export', args=['ndjson']), **self.auth)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['description'] for row in rows], ['Followed', 'Harassed', 'Cornered'])
+
+    def test_deleting_a_user_clears_their_shard_rows(self):
+        location_writer.record(self.user, [(timezone.now(), *KOLKATA)])
+        self.user.delete()
+        self.assertFalse(UserLocation.objects.using(REGION_DB).exists())
+        self.assertFalse(LocationPoint.objects.using(REGION_DB).exists())
+
+
+class GeohashTests(TestCase):
+
+    def test_encode(self):
+        self.assertEqual(geohash.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(geohash.encode(*KOLKATA), 'tunb6v0wu')
+        self.assertEqual(geohash.encode(90, 180), 'zzzzzzzzz')
+        self.assertEqual(geohash.encode(-90, -180), '000000000')
+
+    def test_cells_meeting_at_an_edge(self):
+        # The four cells around the origin; a point on the edge belongs to the north-east one.
+        e = 1e-7
+        corners = [geohash.encode(lat, lon, 5) for lat, lon in [(e, e), (e, -e), (-e, e), (-e, -e)]]
+        self.assertEqual(corners, ['s0000', 'ebpbp', 'kpbpb', '7zzzz'])
+        self.assertEqual(geohash.encode(0, 0, 5), 's0000')
+        self.assertEqual(geohash.box_cells(-0.01, -0.01, 0.01, 0.01, 5), set(corners))
+
+    def test_antimeridian(self):
+        self.assertEqual((geohash.encode(0, 179.9, 1), geohash.encode(0, -179.9, 1)), ('x', '8'))
+        self.assertEqual(geohash.box_cells(-1, 179.5, 1, 180.5, 1), {'x', '8', 'r', '2'})
+
+    def test_box_cells_cover_every_point(self):
+        rng = np.random.default_rng(7)
+        for _ in range(20):
+            south, west = rng.uniform(-80, 80), rng.uniform(-180, 180)
+            north, east = south + rng.uniform(0, 0.2), west + rng.uniform(0, 0.2)
+            cells = geohash.box_cells(south, west, north, east, 6)
+            for lat in np.linspace(south, north, 9):
+                for lon in np.linspace(west, east, 9):
+                    self.assertIn(geohash.encode(lat, (lon + 180) % 360 - 180, 6), cells)
+
+    @override_settings(REGION_SHARDS={'t': 'south_asia', 'tun': 'kolkata', 'x': 'east', '8': 'west'})
+    def test_cell_lookup(self):
+        self.assertEqual(regions.shard_for(*KOLKATA), 'kolkata')
+        self.assertEqual(regions.shard_for(*DELHI), 'south_asia')
+        self.assertEqual(regions.shard_for(51.5, -0.1), 'default')
+        self.assertEqual(regions.shard_for_cell('tunb'), 'kolkata')
+        self.assertEqual(regions.shard_for_cell('tu'), 'south_asia')
+        # West past east: the box crosses the antimeridian.
+        self.assertEqual(regions.shards_for_box(0.5, 179.5, 1, -179.5), ['east', 'west'])
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """The scalar formula the vectorised geodesy functions replaced."""
+    d_lat = math.radians(lat2 - lat1)
+    d_lon = math.radians(lon2 - lon1)
+    a = math.sin(d_lat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(d_lon / 2) ** 2
+    return geodesy.EARTH_RADIUS_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def destination(lat, lon, bearing, km):
+    """The point ``km`` along a great circle leaving (lat, lon) at ``bearing`` degrees."""
+    lat1, lon1, theta = math.radians(lat), math.radians(lon), math.radians(bearing)
+    angle = km / geodesy.EARTH_RADIUS_KM
+    lat2 = math.asin(math.sin(lat1) * math.cos(angle) + math.cos(lat1) * math.sin(angle) * math.cos(theta))
+    lon2 = lon1 + math.atan2(math.sin(theta) * math.sin(angle) * math.cos(lat1),
+                             math.cos(angle) - math.sin(lat1) * math.sin(lat2))
+    return math.degrees(lat2), (math.degrees(lon2) + 180) % 360 - 180
+
+
+class GeodesyTests(TestCase):
+
+    def test_within_radius_matches_scalar_haversine(self):
+        rng = np.random.default_rng(3)
+        lats = KOLKATA[0] + rng.uniform(-0.1, 0.1, 500)
+        lons = KOLKATA[1] + rng.uniform(-0.1, 0.1, 500)
+        indices, distances = geodesy.within_radius(*KOLKATA, lats, lons, 5)
+        expected = sorted((haversine_km(*KOLKATA, lat, lon), i) for i, (lat, lon) in enumerate(zip(lats, lons)))
+        expected = [(d, i) for d, i in expected if d <= 5]
+        self.assertEqual(list(indices), [i for _, i in expected])
+        np.testing.assert_allclose(distances, [d for d, _ in expected], rtol=1e-12)
+
+    def test_radius_boundary(self):
+        # Mid-latitude, both sides of the antimeridian and around each pole.
+        for centre in [KOLKATA, (0.0, 179.99), (60.0, -179.999), (89.9, 0.0), (-89.99, 10.0)]:
+            for radius in (0.5, 5.0):
+                # A few millimetres either side of the circle.
+                inside = [destination(*centre, bearing, radius * (1 - 1e-6)) for bearing in range(0, 360, 15)]
+                outside = [destination(*centre, bearing, radius * (1 + 1e-6)) for bearing in range(0, 360, 15)]
+                lats, lons = zip(*inside, *outside)
+                indices, distances = geodesy.within_radius(*centre, lats, lons, radius)
+                self.assertEqual(sorted(indices), list(range(len(inside))), (centre, radius))
+                for i, distance in zip(indices, distances):
+                    self.assertAlmostEqual(distance, haversine_km(*centre, lats[i], lons[i]), places=9)
+
+    def test_bounding_box_holds_the_circle(self):
+        for centre in [KOLKATA, (0.0, 179.99), (89.9, 0.0)]:
+            box = geodesy.bounding_box(*centre, 5)
+            points = [destination(*centre, bearing, 5 * (1 - 1e-9)) for bearing in range(0, 360, 5)]
+            self.assertTrue(geodesy.in_bounding_box(*zip(*points), box).all(), centre)
+
+    def walk(self, offsets_m):
+        """A track north from Kolkata, 100 m a step, each point offset east by the given metres."""
+        points = [destination(*destination(*KOLKATA, 0, i * 0.1), 90, offset / 1000)
+                  for i, offset in enumerate(offsets_m)]
+        return zip(*points)
+
+    def test_simplify_track_short_inputs(self):
+        for n in range(3):
+            lats, lons = [KOLKATA[0]] * n, [KOLKATA[1]] * n
+            self.assertEqual(list(geodesy.simplify_track(lats, lons, 10)), list(range(n)))
+
+    def test_simplify_track_keeps_both_endpoints(self):
+        rng = np.random.default_rng(5)
+        lats = KOLKATA[0] + np.cumsum(rng.normal(0, 1e-4, 200))
+        lons = KOLKATA[1] + np.cumsum(rng.normal(0, 1e-4, 200))
+        for tolerance in (0, 10, 1e7):
+            kept = geodesy.simplify_track(lats, lons, tolerance)
+            self.assertEqual((kept[0], kept[-1]), (0, 199), tolerance)
+        # However far the tolerance, nothing between the ends survives.
+        self.assertEqual(list(geodesy.simplify_track(lats, lons, 1e7)), [0, 199])
+        # Standing still: every point is the same, so only the ends remain.
+        self.assertEqual(list(geodesy.simplify_track([KOLKATA[0]] * 5, [KOLKATA[1]] * 5, 10)), [0, 4])
+
+    def test_simplify_track_drops_points_within_tolerance(self):
+        self.assertEqual(list(geodesy.simplify_track(*self.walk([0] * 11), 10)), [0, 10])
+        self.assertEqual(list(geodesy.simplify_track(*self.walk([0, 5, -5, 9, 0, -9, 3, 0, 0, 4, 0]), 10)), [0, 10])
+
+    def test_simplify_track_keeps_points_past_tolerance(self):
+        self.assertEqual(list(geodesy.simplify_track(*self.walk([0, 0, 0, 0, 0, 12, 0, 0, 0, 0, 0]), 10)),
+                         [0, 5, 10])
+        # The same detour is noise at a coarser tolerance.
+        self.assertEqual(list(geodesy.simplify_track(*self.walk([0, 0, 0, 0, 0, 12, 0, 0, 0, 0, 0]), 20)), [0, 10])
+
+
+class AlertBrokerTests(TestCase):
+
+    def event(self, username='bina', active=True, at=(None, None)):
+        return {'username': username, 'active': active, 'lat': at[0], 'lon': at[1]}
+
+    def test_publish_reaches_subscribers_until_they_leave(self):
+        broker = alerts.AlertBroker()
+        event = self.event(at=(22.575, 88.365))
+
+        async def scenario():
+            first, second = broker.subscribe(), broker.subscribe()
+            # As from a sync view on a worker thread.
+            await asyncio.to_thread(broker.publish, event)
+            received = [await asyncio.wait_for(queue.get(), 1) for _, queue in (first, second)]
+            broker.unsubscribe(second)
+            broker.publish(self.event(active=False))
+            await asyncio.sleep(0)
+            return received, first[1].qsize(), second[1].qsize()
+
+        received, first_left, second_left = async_to_sync(scenario)()
+        self.assertEqual(received, [event, event])
+        self.assertEqual((first_left, second_left), (1, 0))
+
+    def test_slow_and_closed_subscribers_are_skipped(self):
+        broker = alerts.AlertBroker()
+
+        async def scenario():
+            _, queue = broker.subscribe()
+            for _ in range(queue.maxsize + 10):
+                broker.publish(self.event())
+            await asyncio.sleep(0)
+            return queue.qsize(), queue.maxsize
+
+        size, maxsize = async_to_sync(scenario)()
+        self.assertEqual(size, maxsize)
+        # The scenario's loop is closed now; publishing must not raise.
+        broker.publish(self.event())
+
+    def test_only_events_that_change_the_list_are_relevant(self):
+        radius = 5.0
+        shown = {'bina'}
+        cases = [
+            (self.event(active=False), True),
+            (self.event('chitra', active=False), False),
+            (self.event('chitra', at=KOLKATA), True),
+            # Within the margin for the subscriber having moved, then past it.
+            (self.event('chitra', at=destination(*KOLKATA, 90, radius * 1.4)), True),
+            (self.event('chitra', at=destination(*KOLKATA, 90, radius * 1.6)), False),
+            (self.event('chitra'), True),
+        ]
+        for event, relevant in cases:
+            self.assertEqual(alerts._is_relevant(event, KOLKATA, shown, radius), relevant, event)
+        # Nowhere to measure from: every new SOS might be near.
+        self.assertTrue(alerts._is_relevant(self.event('chitra', at=(0.0, 0.0)), None, set(), radius))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite-specific')
+class IndexUsageTests(TestCase):
+    """The hot access paths are served by the index declared for them."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('asha')
+
+    def assertUsesIndex(self, queryset, index):
+        self.assertIn(f'INDEX {index}', queryset.explain())
+
+    def test_active_journey(self):
+        self.assertUsesIndex(JourneyTracker.objects.filter(user=self.user, status='active')[:1],
+                             'journey_active_user_idx')
+
+    def test_sos_history_page(self):
+        after = pagination._after(['timestamp', 'id'], [timezone.now(), 1], descending=True)
+        queryset = SOSLog.objects.filter(after, user=self.user).order_by('-timestamp', '-id')[:26]
+        self.assertUsesIndex(queryset, 'soslog_user_time_idx')
+
+    def test_recent_incidents(self):
+        queryset = IncidentReport.objects.filter(reported_at__gte=timezone.now() - timedelta(days=30))
+        self.assertUsesIndex(queryset.order_by('-reported_at', '-id')[:26], 'incident_recent_idx')
+
+    def test_retention_batches(self):
+        cutoff = timezone.now() - timedelta(days=365)
+        for name, index in [('soslog', 'soslog_time_idx'), ('journeytracker', 'journey_started_idx'),
+                            ('incidentreport', 'incident_recent_idx')]:
+            policy = retention.POLICIES[name]
+            queryset = policy.expired(cutoff).order_by(policy.time_field, 'id').values(*policy.fields)[:500]
+            self.assertUsesIndex(queryset, index)
+
+    def test_nearby_sos(self):
+        # The alert snapshot looks up SOS users' locations by user, not by area.
+        queryset = UserLocation.objects.filter(user_id__in=[self.user.id], latitude__isnull=False,
+                                               longitude__isnull=False)
+        self.assertUsesIndex(queryset, 'sqlite_autoindex_safety_app_userlocation_1')
+
+    def test_active_sos_profiles(self):
+        self.assertUsesIndex(Profile.objects.filter(is_sos_active=True), 'profile_sos_active_idx')
+
+
+class LoadgenTests(TestCase):
+
+    def stage(self, users, p95_ms, error_rate=0.0, active_users=None):
+        return {'users': users, 'active_users': users if active_users is None else active_users,
+                'error_rate': error_rate, 'endpoints': {'alerts_poll': {'p95_ms': p95_ms}}}
+
+    def test_percentile_is_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual([loadgen.percentile(values, q) for q in (0, 50, 95, 99, 100)], [1, 50, 95, 99, 100])
+        self.assertEqual(loadgen.percentile([7], 99), 7)
+        self.assertIsNone(loadgen.percentile([], 50))
+
+    def test_report(self):
+        recorder = loadgen.Recorder()
+        for ms in range(1, 101):
+            recorder.add('alerts_poll', ms / 1000, ok=ms != 100)
+        recorder.add('sos_trigger', 0.2, ok=True)
+        report = recorder.report(elapsed=10)
+        self.assertEqual((report['requests'], report['errors'], report['error_rate'], report['throughput_rps']),
+                         (101, 1, 0.0099, 10.1))
+        alerts = report['endpoints']['alerts_poll']
+        self.assertEqual((alerts['p50_ms'], alerts['p95_ms'], alerts['max_ms'], alerts['error_rate']),
+                         (50.0, 95.0, 100.0, 0.01))
+
+    def test_capacity_is_the_largest_passing_stage_per_process(self):
+        results = {'server_processes': 2, 'stages': [
+            self.stage(100, 200),
+            self.stage(200, 900),
+            self.stage(400, 1500),
+            self.stage(300, 300, error_rate=0.05),
+            self.stage(250, 100, active_users=240),
+        ]}
+        self.assertEqual(loadgen.capacity(results), 100)
+        self.assertEqual(loadgen.capacity(results, slo_ms=2000), 200)
+        self.assertEqual(loadgen.capacity({'stages': results['stages'][2:]}), 0)
+
+    def test_sos_posts_a_valid_action(self):
+        options = {'seed': 0, 'user_prefix': 'loadtest-', 'base_url': 'http://127.0.0.1:8000/api'}
+        user = loadgen.VirtualUser(0, options, loadgen.Recorder(), threading.Event())
+        sent = []
+        user.client.request = lambda endpoint, method, path, payload=None, **kwargs: sent.append(payload)
+        user.sos(now=0)
+        self.assertIn(sent[0]['trigger'], dict(SOSLog.ACTION_CHOICES))
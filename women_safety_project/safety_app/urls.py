@@ -24,12 +24,15 @@ urlpatterns = [
     # Location & Alerts
     path('update_location/', views.update_location, name='update_location'),
     path('check_alerts/', views.check_alerts, name='check_alerts'),
+    path('alert_stream/', views.alert_stream, name='alert_stream'),
 
     # Voice
     path('analyze_voice/', views.analyze_voice, name='analyze_voice'),
 
     # Safe Route
     path('safe_route/', views.safe_route, name='safe_route'),
+    path('safe_route/plan/', views.route_plan, name='route_plan'),
+    path('geocode/', views.geocode, name='geocode'),
 
     # Safe Walk / Journey Tracker
     path('safe_walk/', views.safe_walk, name='safe_walk'),
@@ -40,4 +43,10 @@ urlpatterns = [
     path('incident_report/', views.log_incident, name='incident_report'),
     path('incident_report/success/', views.incident_success, name='incident_success'),
     path('get_incidents/', views.get_incidents, name='get_incidents'),
+    path('get_incidents/viewport/', views.incidents_viewport, name='incidents_viewport'),
+    path('risk/tiles/<int:z>/<int:x>/<int:y>.png', views.risk_tile, name='risk_tile'),
+    path('risk/point/', views.risk_point, name='risk_point'),
+
+    # Operations
+    path('metrics', views.prometheus_metrics, name='metrics'),
 ]
@@ -0,0 +1,152 @@
+"""
+Read-through cache of per-user state: the User row behind a session or API
+token, trusted contacts and profile.
+
+Entries live in the ``user_state`` cache alias (LocMem by default: LRU,
+bounded by MAX_ENTRIES, expiring after TIMEOUT) and are dropped by the
+save/delete signals in safety_app.signals. LocMem is per process, so other
+workers only see a change once their entry expires. That includes a logout
+or a deactivated account, so token and User entries expire after the
+shorter USER_CACHE_AUTH_SECONDS: a revoked token keeps working on other
+workers for at most that long. Point ``user_state`` at a shared backend
+(Redis, Memcached) to make invalidation immediate everywhere.
+
+The a-prefixed readers are the same lookups for async views, through the
+cache's and the ORM's async APIs.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from rest_framework.authtoken.models import Token
+
+from .models import Profile, TrustedContact
+
+
+def _cache():
+    return caches['user_state']
+
+
+def _auth_timeout():
+    return getattr(settings, 'USER_CACHE_AUTH_SECONDS', 10)
+
+
+def _user_key(user_id):
+    return f'user:{user_id}'
+
+
+def _token_key(key):
+    return f'token:{key}'
+
+
+def _contacts_key(user_id):
+    return f'contacts:{user_id}'
+
+
+def _profile_key(user_id):
+    return f'profile:{user_id}'
+
+
+def user_for(user_id):
+    """The User with this id, or None."""
+    key = _user_key(user_id)
+    user = _cache().get(key)
+    if user is None:
+        user = User.objects.filter(pk=user_id).first()
+        if user is not None:
+            _cache().set(key, user, _auth_timeout())
+    return user
+
+
+def token_user_id(key):
+    """Id of the user owning this API token, or None if there is no such token."""
+    cache_key = _token_key(key)
+    user_id = _cache().get(cache_key)
+    if user_id is None:
+        user_id = Token.objects.filter(key=key).values_list('user_id', flat=True).first()
+        if user_id is not None:
+            _cache().set(cache_key, user_id, _auth_timeout())
+    return user_id
+
+
+def contacts_for(user):
+    """The user's trusted contacts as a list."""
+    key = _contacts_key(user.id)
+    contacts = _cache().get(key)
+    if contacts is None:
+        contacts = list(TrustedContact.objects.filter(user=user).order_by('id'))
+        _cache().set(key, contacts)
+    return contacts
+
+
+def profile_for(user):
+    """The user's Profile, created on first use."""
+    key = _profile_key(user.id)
+    profile = _cache().get(key)
+    if profile is None:
+        profile, _ = Profile.objects.get_or_create(user=user)
+        _cache().set(key, profile)
+    # Reattach the caller's user so profile.user costs no query.
+    profile.user = user
+    return profile
+
+
+async def auser_for(user_id):
+    key = _user_key(user_id)
+    user = await _cache().aget(key)
+    if user is None:
+        user = await User.objects.filter(pk=user_id).afirst()
+        if user is not None:
+            await _cache().aset(key, user, _auth_timeout())
+    return user
+
+
+async def atoken_user_id(key):
+    cache_key = _token_key(key)
+    user_id = await _cache().aget(cache_key)
+    if user_id is None:
+        user_id = await Token.objects.filter(key=key).values_list('user_id', flat=True).afirst()
+        if user_id is not None:
+            await _cache().aset(cache_key, user_id, _auth_timeout())
+    return user_id
+
+
+async def aprofile_for(user):
+    key = _profile_key(user.id)
+    profile = await _cache().aget(key)
+    if profile is None:
+        profile, _ = await Profile.objects.aget_or_create(user=user)
+        await _cache().aset(key, profile)
+    profile.user = user
+    return profile
+
+
+def set_sos_active(user, active):
+    """Flip the SOS flag with a single UPDATE and keep the cached profile in step."""
+    if not Profile.objects.filter(user=user).update(is_sos_active=active):
+        _, created = Profile.objects.get_or_create(user=user, defaults={'is_sos_active': active})
+        if not created:
+            # Lost a race with a concurrent first write.
+            Profile.objects.filter(user=user).update(is_sos_active=active)
+        invalidate_profile(user.id)
+        return
+    key = _profile_key(user.id)
+    profile = _cache().get(key)
+    if profile is not None:
+        profile.is_sos_active = active
+        _cache().set(key, profile)
+
+
+def invalidate_contacts(user_id):
+    _cache().delete(_contacts_key(user_id))
+
+
+def invalidate_profile(user_id):
+    _cache().delete(_profile_key(user_id))
+
+
+def invalidate_user(user_id):
+    _cache().delete(_user_key(user_id))
+
+
+def invalidate_token(key):
+    _cache().delete(_token_key(key))
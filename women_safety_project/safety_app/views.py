@@ -2,12 +2,20 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.decorators import login_required
-from .models import TrustedContact, Profile, UserLocation, SOSLog, JourneyTracker, IncidentReport
-from django.core.mail import send_mail
-from django.http import JsonResponse
+from django.contrib.auth.models import User
+from .models import TrustedContact, Profile, UserLocation, SOSLog, JourneyTracker, IncidentReport, Notification
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.http import parse_header_parameters
 from django.conf import settings
-import math, random, time
+from django.db import transaction
+from django.db.models import Avg, Count, F, Q
+from django.db.models.functions import Floor
+from . import (geocoder, geodesy, journeys, location_writer, metrics, outbox, pagination, regions, risk,
+               routing, sos_snapshot, user_cache, voice)
+from .alerts import alert_event_stream, publish_sos_state
 from datetime import timedelta
 
 
@@ -56,10 +64,7 @@ def home(request):
 
 @login_required
 def profile_settings(request):
-    try:
-        profile = request.user.profile
-    except Profile.DoesNotExist:
-        profile = Profile.objects.create(user=request.user)
+    profile = user_cache.profile_for(request.user)
 
     success = False
     error = None
@@ -79,7 +84,8 @@ def profile_settings(request):
         else:
             profile.real_pin = real_pin
             profile.duress_pin = duress_pin
-            profile.save()
+            # The cached copy may be stale; don't write its SOS flag back.
+            profile.save(update_fields=['real_pin', 'duress_pin'])
             success = True
 
     return render(request, 'safety_app/profile.html', {
@@ -102,7 +108,15 @@ def add_trusted_contact(request):
         name = request.POST['name']
         email = request.POST['email']
         phone_number = request.POST['phone_number']
-        TrustedContact.objects.create(user=request.user, name=name, email=email, phone_number=phone_number)
+        username = request.POST.get('account', '').strip()
+        account = User.objects.filter(username=username).first() if username else None
+        if username and account is None:
+            return render(request, 'safety_app/add_trusted_contact.html', {
+                'error': f'No Raksha account is called {username!r}.'
+            })
+        TrustedContact.objects.create(
+            user=request.user, name=name, email=email, phone_number=phone_number, account=account
+        )
         return redirect('trusted_contacts')
     return render(request, 'safety_app/add_trusted_contact.html')
 
@@ -117,114 +131,110 @@ def delete_trusted_contact(request, contact_id):
 # ─── SOS ─────────────────────────────────────────────────────────────────────
 
 def _send_sos_alert(user, lat, lon, contacts, trigger_type='triggered'):
-    """Helper to send SOS alerts + mock SMS and create a log entry."""
+    """Helper to log an SOS and queue alerts to every trusted contact."""
     lat_val = lat or 'Unknown'
     lon_val = lon or 'Unknown'
-
-    # Log to database
-    SOSLog.objects.create(
-        user=user,
-        action=trigger_type,
-        latitude=float(lat) if lat else None,
-        longitude=float(lon) if lon else None,
-    )
-
-    if contacts:
-        map_url = f'https://www.google.com/maps/search/?api=1&query={lat_val},{lon_val}'
-        subject = 'SOS Alert'
-        message = f'{user.username} is in an emergency. Location: {map_url}'
-        recipient_list = [contact.email for contact in contacts]
-        send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, recipient_list)
-
-        # Mock SMS Gateway
+    map_url = f'https://www.google.com/maps/search/?api=1&query={lat_val},{lon_val}'
+
+    with transaction.atomic():
+        # Log to database
+        log = SOSLog.objects.create(
+            user=user,
+            action=trigger_type,
+            latitude=float(lat) if lat else None,
+            longitude=float(lon) if lon else None,
+        )
+        if trigger_type == 'auto_journey':
+            # Client fired it at the deadline; stop the server-side fallback.
+            JourneyTracker.objects.filter(user=user, status='active').update(status='expired')
+        queued = outbox.enqueue(
+            user, contacts, Notification.PRIORITY_SOS,
+            'SOS Alert',
+            f'{user.username} is in an emergency. Location: {map_url}',
+            sos_log=log,
+        )
+        publish_sos_state(user, True, lat, lon)
+
+    if queued:
         print("\n" + "!"*60)
         print("🚨 URGENT SOS ALERT INITIATED 🚨")
         print(f"Trigger: {trigger_type.upper()} | User: {user.username}")
         print(f"Location Map: {map_url}")
-        print("-" * 60)
-        for contact in contacts:
-            print(f"📡 [SMS GATEWAY]: Sending to +{contact.phone_number} ({contact.name})...")
-            time.sleep(0.3)
-            print(f"✅  SMS DELIVERED to {contact.name}")
+        print(f"📨 {queued} notifications queued for dispatch")
         print("!"*60 + "\n")
 
 
+def _send_safe_update(user, contacts):
+    """Log a real-PIN deactivation and queue low-priority 'safe' texts."""
+    with transaction.atomic():
+        log = SOSLog.objects.create(user=user, action='deactivated')
+        outbox.enqueue(
+            user, contacts, Notification.PRIORITY_SAFE,
+            'SOS Deactivated',
+            f'{user.username} is now safe.',
+            channels=('sms',),
+            sos_log=log,
+        )
+        publish_sos_state(user, False)
+
+
+def _send_duress_alert(user, contacts, notes='Duress PIN entered; covert alert sent'):
+    """Log a duress PIN entry and queue covert top-priority alerts."""
+    with transaction.atomic():
+        log = SOSLog.objects.create(user=user, action='duress', notes=notes)
+        queued = outbox.enqueue(
+            user, contacts, Notification.PRIORITY_DURESS,
+            'HIGH PRIORITY SILENT ALERT - DURESS PIN ENTERED',
+            f'URGENT: {user.username} entered their DURESS PIN. They may be forced to deactivate. Send immediate help!',
+            sos_log=log,
+        )
+
+    if queued:
+        print("\n" + "X"*60)
+        print("☠️  DURESS PIN DETECTED - COVERT HIGH-PRIORITY DISPATCH ☠️")
+        print(f"📨 {queued} notifications queued for dispatch")
+        print("X"*60 + "\n")
+
+
+def _set_session_sos(request, active):
+    """Record the SOS flag in the session, writing it only when it changes."""
+    if request.session.get('sos_active', False) != active:
+        request.session['sos_active'] = active
+
+
 @login_required
+@location_writer.urgent()
 def sos(request):
     if request.method == 'POST':
         user = request.user
-        contacts = TrustedContact.objects.filter(user=user)
-        request.session['sos_active'] = True
+        _set_session_sos(request, True)
         trigger = request.POST.get('trigger', 'triggered')
-
-        try:
-            profile = user.profile
-            profile.is_sos_active = True
-            profile.save()
-        except Profile.DoesNotExist:
-            profile = Profile.objects.create(user=user, is_sos_active=True)
+        user_cache.set_sos_active(user, True)
 
         lat = request.POST.get('lat')
         lon = request.POST.get('lon')
-        _send_sos_alert(user, lat, lon, contacts, trigger_type=trigger)
+        _send_sos_alert(user, lat, lon, user_cache.contacts_for(user), trigger_type=trigger)
         return redirect('home')
     return redirect('home')
 
 
 @login_required
+@location_writer.urgent()
 def deactivate_sos(request):
     if request.method == 'POST':
         pin = request.POST.get('pin')
-        try:
-            profile = request.user.profile
-        except Profile.DoesNotExist:
-            profile = Profile.objects.create(user=request.user)
+        profile = user_cache.profile_for(request.user)
 
         if pin == profile.real_pin:
-            request.session['sos_active'] = False
-            profile.is_sos_active = False
-            profile.save()
-
-            # Log deactivation
-            SOSLog.objects.create(user=request.user, action='deactivated')
-
-            user = request.user
-            contacts = TrustedContact.objects.filter(user=user)
-            if contacts:
-                print("\n" + "="*60)
-                print("🟢 SOS DEACTIVATED - USER IS SAFE 🟢")
-                print("-" * 60)
-                for contact in contacts:
-                    print(f"📡 [SMS GATEWAY]: Sending 'Safe' update to +{contact.phone_number}...")
-                    time.sleep(0.3)
-                    print(f"✅  SMS DELIVERED: '{user.username} is now safe.'")
-                print("="*60 + "\n")
-
+            _set_session_sos(request, False)
+            user_cache.set_sos_active(request.user, False)
+            _send_safe_update(request.user, user_cache.contacts_for(request.user))
             return redirect('home')
 
         elif pin == profile.duress_pin:
-            request.session['sos_active'] = False
+            _set_session_sos(request, False)
             # Do NOT set is_sos_active = False — keeps community alert live
-
-            # Log duress event
-            SOSLog.objects.create(user=request.user, action='duress', notes='Duress PIN entered; covert alert sent')
-
-            user = request.user
-            contacts = TrustedContact.objects.filter(user=user)
-            if contacts:
-                subject = 'HIGH PRIORITY SILENT ALERT - DURESS PIN ENTERED'
-                message = f'URGENT: {user.username} entered their DURESS PIN. They may be forced to deactivate. Send immediate help!'
-                recipient_list = [contact.email for contact in contacts]
-                send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, recipient_list)
-
-                print("\n" + "X"*60)
-                print("☠️  DURESS PIN DETECTED - COVERT HIGH-PRIORITY DISPATCH ☠️")
-                for contact in contacts:
-                    print(f"📡 [SECURE SMS]: Sending covert alert to +{contact.phone_number}...")
-                    time.sleep(0.3)
-                    print(f"🚨  CRITICAL SMS DELIVERED to {contact.name}")
-                print("X"*60 + "\n")
-
+            _send_duress_alert(request.user, user_cache.contacts_for(request.user))
             return redirect('home')
         else:
             return render(request, 'safety_app/home.html', {
@@ -238,88 +248,279 @@ def deactivate_sos(request):
 
 @login_required
 def sos_history(request):
-    logs = SOSLog.objects.filter(user=request.user)
-    return render(request, 'safety_app/sos_history.html', {'logs': logs})
+    try:
+        page = pagination.paginate_request(request, SOSLog.objects.filter(user=request.user), '-timestamp')
+    except ValueError:
+        return redirect('sos_history')
+    return render(request, 'safety_app/sos_history.html', {
+        'logs': page.items,
+        'next_cursor': page.next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
+    })
 
 
 # ─── Location & Community Alerts ─────────────────────────────────────────────
 
 def haversine(lat1, lon1, lat2, lon2):
-    R = 6371
-    dLat = math.radians(lat2 - lat1)
-    dLon = math.radians(lon2 - lon1)
-    a = math.sin(dLat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dLon/2)**2
-    return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return float(geodesy.distances_km(lat1, lon1, lat2, lon2))
+
+ALERT_RADIUS_KM = 5.0
+
+
+def _nearby_sos_alerts(user, my_loc, radius_km=ALERT_RADIUS_KM):
+    """Users with a live SOS within radius_km of my_loc, nearest first (read from the SOS snapshot)."""
+    active = sos_snapshot.current()
+    cutoff = (timezone.now() - timedelta(minutes=10)).timestamp()
+    active = active[(active['updated_at'] >= cutoff) & (active['user_id'] != user.id)]
+    if not len(active):
+        return []
+    indices, distances = geodesy.within_radius(
+        my_loc.latitude, my_loc.longitude, active['lat'], active['lon'], radius_km,
+    )
+    return [{
+        'username': str(active['username'][i]),
+        'distance': round(float(distance), 2),
+        'lat': float(active['lat'][i]),
+        'lon': float(active['lon'][i]),
+    } for i, distance in zip(indices, distances)]
+
+
+def _parse_radius_query(params, default_radius_km=ALERT_RADIUS_KM, max_radius_km=50.0):
+    """
+    Read optional ?lat=&lon=&radius_km= filters.
+
+    Returns None when no centre was given and raises ValueError on bad input.
+    """
+    lat = params.get('lat')
+    lon = params.get('lon')
+    if not lat or not lon:
+        return None
+    lat, lon = float(lat), float(lon)
+    radius_km = float(params.get('radius_km') or default_radius_km)
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180 and 0 < radius_km <= max_radius_km):
+        raise ValueError('lat/lon/radius_km out of range')
+    return lat, lon, radius_km
+
+
+def _bounding_box_filter(queryset, lat, lon, radius_km):
+    """Narrow a latitude/longitude queryset to the box around a radius (done in SQL)."""
+    min_lat, max_lat, min_lon, max_lon = geodesy.bounding_box(lat, lon, radius_km)
+    queryset = queryset.filter(latitude__range=(min_lat, max_lat))
+    if -180 <= min_lon and max_lon <= 180:
+        queryset = queryset.filter(longitude__range=(min_lon, max_lon))
+    return queryset
+
+
+def _filter_radius(rows, lat, lon, radius_km, nearest_first=True):
+    """Rows (dicts or instances) within radius_km, in one vectorised pass."""
+    if not rows:
+        return []
+    coords = [(row['latitude'], row['longitude']) if isinstance(row, dict) else (row.latitude, row.longitude)
+              for row in rows]
+    lats, lons = zip(*coords)
+    indices, _ = geodesy.within_radius(lat, lon, lats, lons, radius_km)
+    if not nearest_first:
+        indices = sorted(indices)
+    return [rows[i] for i in indices]
+
+
+def _within_radius(queryset, lat, lon, radius_km):
+    """
+    Rows of a latitude/longitude queryset within radius_km, nearest first.
+
+    The bounding box is pushed into SQL, on each region shard it overlaps;
+    exact distances are computed for the survivors in one vectorised pass.
+    """
+    rows = list(regions.fan_out(_bounding_box_filter(queryset, lat, lon, radius_km),
+                                regions.shards_near(lat, lon, radius_km)))
+    return _filter_radius(rows, lat, lon, radius_km)
+
+# The polling endpoints (location, alerts, journey, voice) are async: under
+# ASGI a poll holds a thread only while one of its queries runs, so idle
+# clients and slow voice chunks don't take workers from SOS requests.
 
 @login_required
-def update_location(request):
+async def update_location(request):
     if request.method == 'POST':
         lat = request.POST.get('lat')
         lon = request.POST.get('lon')
         if lat and lon:
-            loc, _ = UserLocation.objects.get_or_create(user=request.user)
-            loc.latitude = float(lat)
-            loc.longitude = float(lon)
-            loc.save()
+            lat, lon = float(lat), float(lon)
+            await location_writer.arecord(await request.auser(), [(timezone.now(), lat, lon)])
             return JsonResponse({'status': 'success'})
     return JsonResponse({'status': 'error'}, status=400)
 
+
+async def _check_alerts(user):
+    """Nearby SOS alerts for an async view (the snapshot may rebuild from the database)."""
+    my_loc = await regions.auser_location(user.id)
+    if my_loc is None or not my_loc.latitude:
+        return []
+    return await sync_to_async(_nearby_sos_alerts)(user, my_loc)
+
+
 @login_required
-def check_alerts(request):
-    try:
-        my_loc = request.user.userlocation
-        if not my_loc.latitude:
-            return JsonResponse({'alerts': []})
-    except UserLocation.DoesNotExist:
-        return JsonResponse({'alerts': []})
-
-    time_threshold = timezone.now() - timedelta(minutes=10)
-    nearby_alerts = []
-
-    active_users = UserLocation.objects.filter(
-        last_updated__gte=time_threshold,
-        user__profile__is_sos_active=True
-    ).exclude(user=request.user)
-
-    for active_user in active_users:
-        if active_user.latitude is None or active_user.longitude is None:
-            continue
-        distance = haversine(my_loc.latitude, my_loc.longitude, active_user.latitude, active_user.longitude)
-        if distance <= 5.0:
-            nearby_alerts.append({
-                'username': active_user.user.username,
-                'distance': round(distance, 2),
-                'lat': active_user.latitude,
-                'lon': active_user.longitude,
-            })
+async def check_alerts(request):
+    return JsonResponse({'alerts': await _check_alerts(await request.auser())})
 
-    return JsonResponse({'alerts': nearby_alerts})
+@login_required
+async def alert_stream(request):
+    """Server-Sent Events feed of nearby alerts; check_alerts remains the polling fallback."""
+    if not isinstance(request, ASGIRequest):
+        # A long-lived stream would pin a WSGI worker. 204 tells EventSource
+        # to stop reconnecting, and the page falls back to polling.
+        return HttpResponse(status=204)
+    user = await request.auser()
+    response = StreamingHttpResponse(alert_event_stream(user), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 
 # ─── Voice Analysis ───────────────────────────────────────────────────────────
 
+WAV_TYPES = ('audio/wav', 'audio/x-wav', 'audio/wave')
+
+
+def _read_audio(request):
+    """(samples, rate) from an 'audio' WAV upload or a WAV / audio/l16 body. Raises ValueError."""
+    content_type, params = parse_header_parameters(request.META.get('CONTENT_TYPE', ''))
+    if content_type == 'multipart/form-data':
+        upload = request.FILES.get('audio')
+        if upload is None:
+            raise ValueError('audio required')
+        return voice.decode_wav(upload.read())
+    if not request.body:
+        raise ValueError('audio required')
+    if content_type in WAV_TYPES:
+        return voice.decode_wav(request.body)
+    if content_type == 'audio/l16':
+        try:
+            rate = int(params.get('rate', 16000))
+        except ValueError:
+            raise ValueError('Invalid sample rate')
+        return voice.decode_pcm(request.body, rate), rate
+    raise ValueError('Send WAV or audio/l16 PCM')
+
+
+async def _analyze_voice_chunk(request, user):
+    """Feed the request's audio chunk into the user's voice stream. Raises ValueError."""
+    samples, rate = _read_audio(request)
+    try:
+        seq = int(request.headers['X-Audio-Seq'])
+    except (KeyError, ValueError):
+        seq = None
+    return await voice.aanalyze_chunk(user.id, samples, rate,
+                                      stream=request.headers.get('X-Audio-Stream', ''), seq=seq)
+
+
 @login_required
-def analyze_voice(request):
+async def analyze_voice(request):
     if request.method == 'POST':
-        time.sleep(0.5)
-        danger_detected = random.random() > 0.90
-        return JsonResponse({
-            'status': 'success',
-            'danger_detected': danger_detected,
-            'confidence': round(random.uniform(0.7, 0.99), 2) if danger_detected else 0.0
-        })
+        try:
+            result = await _analyze_voice_chunk(request, await request.auser())
+        except ValueError as exc:
+            return JsonResponse({'status': 'error', 'error': str(exc)}, status=400)
+        except voice.VoiceBusy as exc:
+            return JsonResponse({'status': 'error', 'error': str(exc)}, status=503)
+        return JsonResponse({'status': 'success', **result})
     return JsonResponse({'status': 'error'}, status=400)
 
 
 # ─── Safe Route ───────────────────────────────────────────────────────────────
 
+MAX_ROUTE_SAFETY = 10.0
+
+
 @login_required
 def safe_route(request):
     return render(request, 'safety_app/safe_route.html')
 
 
+def _parse_route_query(params):
+    """Read ?from=lat,lon&to=lat,lon[&safety=]. Raises ValueError."""
+    points = []
+    for name in ('from', 'to'):
+        lat, lon = (float(v) for v in params.get(name, '').split(','))
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError(f'{name} out of range')
+        points.append((lat, lon))
+    safety = params.get('safety')
+    if safety is not None:
+        safety = float(safety)
+        if not 0 <= safety <= MAX_ROUTE_SAFETY:
+            raise ValueError('safety out of range')
+    return points[0], points[1], safety
+
+@login_required
+def route_plan(request):
+    """AJAX endpoint — incident-aware walking route for the Safe Route map."""
+    try:
+        start, end, safety = _parse_route_query(request.GET)
+    except ValueError:
+        return JsonResponse({'status': 'error'}, status=400)
+    try:
+        return JsonResponse({'status': 'success', **routing.plan(start, end, safety)})
+    except routing.RoutingError as exc:
+        return JsonResponse({'status': 'error', 'error': str(exc)}, status=exc.status)
+
+
+# ─── Place Search ─────────────────────────────────────────────────────────────
+
+MAX_GEOCODE_RESULTS = 20
+
+
+def _parse_geocode_query(params):
+    """Read ?q=[&lat=&lon=][&limit=]. Raises ValueError."""
+    query = params.get('q', '').strip()
+    limit = int(params.get('limit', 8))
+    if not query or not 1 <= limit <= MAX_GEOCODE_RESULTS:
+        raise ValueError('q and limit=1..20 required')
+    origin = _parse_point(params) if 'lat' in params or 'lon' in params else None
+    return query, origin, limit
+
+
+def _geocode(user, query, origin, limit):
+    """
+    Places matching ``query``, nearest to ``origin`` or else to the user's
+    last known location. None when no place index has been built.
+    """
+    index = geocoder.get_index()
+    if index is None:
+        return None
+    if origin is None:
+        location = regions.user_location(user.id)
+        origin = (location.latitude, location.longitude) if location else None
+    return index.search(query, origin, limit)
+
+@login_required
+def geocode(request):
+    """AJAX endpoint — destination autocomplete for Safe Route and Safe Walk."""
+    try:
+        query, origin, limit = _parse_geocode_query(request.GET)
+    except ValueError:
+        return JsonResponse({'status': 'error'}, status=400)
+    results = _geocode(request.user, query, origin, limit)
+    if results is None:
+        return JsonResponse({'status': 'error', 'error': 'Place search is not set up'}, status=503)
+    return JsonResponse({'status': 'success', 'results': results})
+
+
 # ─── Safe Walk / Journey Tracker ─────────────────────────────────────────────
 
+def _destination_point(data):
+    """Optional destination_lat/destination_lon pair from a form or JSON body. Raises ValueError."""
+    lat, lon = data.get('destination_lat'), data.get('destination_lon')
+    if lat in (None, '') and lon in (None, ''):
+        return None, None
+    try:
+        lat, lon = float(lat), float(lon)
+    except TypeError:
+        raise ValueError('destination_lat and destination_lon go together')
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError('destination out of range')
+    return lat, lon
+
 @login_required
 def safe_walk(request):
     # Cancel any other active journeys first
@@ -329,17 +530,27 @@ def safe_walk(request):
         destination = request.POST.get('destination', '').strip()
         eta = request.POST.get('eta_minutes', '').strip()
 
+        try:
+            dest_lat, dest_lon = _destination_point(request.POST)
+        except ValueError:
+            # A stale suggestion shouldn't block the walk; keep the name only.
+            dest_lat = dest_lon = None
+
         if destination and eta and eta.isdigit() and int(eta) > 0:
             active_journeys.update(status='cancelled')
             journey = JourneyTracker.objects.create(
                 user=request.user,
                 destination=destination,
+                destination_lat=dest_lat,
+                destination_lon=dest_lon,
                 eta_minutes=int(eta),
             )
+            journeys.schedule(journey)
             return redirect('home')
 
     return render(request, 'safety_app/safe_walk.html', {
         'active_journey': active_journeys.first(),
+        'eta_presets': [15, 30, 45, 60],
     })
 
 @login_required
@@ -353,20 +564,18 @@ def arrive_safe(request):
     return JsonResponse({'status': 'error'}, status=400)
 
 @login_required
-def check_journey(request):
+async def check_journey(request):
     """AJAX poll — returns remaining seconds for active journey, or -1 if none."""
-    journey = JourneyTracker.objects.filter(user=request.user, status='active').first()
+    user = await request.auser()
+    journey = await JourneyTracker.objects.filter(user=user, status='active').afirst()
     if not journey:
         return JsonResponse({'active': False})
 
-    elapsed = (timezone.now() - journey.started_at).total_seconds()
-    total_seconds = journey.eta_minutes * 60
-    remaining = total_seconds - elapsed
-
+    remaining = journey.remaining_seconds()
     if remaining <= 0:
-        # Mark expired
-        journey.status = 'expired'
-        journey.save()
+        # Expiry and the auto_journey SOS are handled server-side by
+        # safety_app.journeys; make sure the scheduler is running.
+        journeys.ensure_started()
         return JsonResponse({'active': True, 'expired': True, 'destination': journey.destination})
 
     return JsonResponse({
@@ -388,10 +597,11 @@ def log_incident(request):
         severity = request.POST.get('severity', 'low')
 
         if lat and lon and description:
-            IncidentReport.objects.create(
+            lat, lon = float(lat), float(lon)
+            IncidentReport.objects.using(regions.shard_for(lat, lon)).create(
                 user=request.user,
-                latitude=float(lat),
-                longitude=float(lon),
+                latitude=lat,
+                longitude=lon,
                 description=description,
                 severity=severity,
             )
@@ -406,10 +616,16 @@ def incident_success(request):
 @login_required
 def get_incidents(request):
     """AJAX endpoint — returns recent incident reports as JSON for heatmap."""
+    try:
+        near = _parse_radius_query(request.GET)
+    except ValueError:
+        return JsonResponse({'status': 'error'}, status=400)
+
     cutoff = timezone.now() - timedelta(days=30)
     incidents = IncidentReport.objects.filter(reported_at__gte=cutoff).values(
         'latitude', 'longitude', 'severity', 'description', 'reported_at'
     )
+    incidents = _within_radius(incidents, *near) if near else regions.fan_out(incidents)
     data = []
     for inc in incidents:
         data.append({
@@ -419,3 +635,134 @@ def get_incidents(request):
             'description': inc['description'],
         })
     return JsonResponse({'incidents': data})
+
+
+INCIDENT_WINDOW = timedelta(days=30)
+INCIDENT_POINTS_MIN_ZOOM = 15
+INCIDENT_CELLS_PER_TILE = 4
+MAX_VIEWPORT_POINTS = 500
+
+
+def _parse_viewport(params):
+    """Read ?bbox=west,south,east,north&zoom= (Leaflet's toBBoxString order). Raises ValueError."""
+    west, south, east, north = (float(v) for v in params.get('bbox', '').split(','))
+    zoom = int(params.get('zoom', ''))
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180 and 0 <= zoom <= 22):
+        raise ValueError('bbox/zoom out of range')
+    return west, south, east, north, zoom
+
+
+def _incident_viewport(west, south, east, north, zoom):
+    """
+    Recent incidents inside a map viewport.
+
+    Below INCIDENT_POINTS_MIN_ZOOM the database groups them into grid cells
+    (about a quarter of a map tile wide) and only per-severity counts are
+    returned; individual points and descriptions are sent once zoomed in.
+    Only the region shards the viewport overlaps are queried.
+    """
+    shards = regions.shards_for_box(south, west, north, east)
+    incidents = IncidentReport.objects.filter(
+        reported_at__gte=timezone.now() - INCIDENT_WINDOW,
+        latitude__range=(south, north),
+    )
+    if west <= east:
+        incidents = incidents.filter(longitude__range=(west, east))
+    else:
+        # Viewport straddles the antimeridian.
+        incidents = incidents.filter(Q(longitude__gte=west) | Q(longitude__lte=east))
+
+    if zoom >= INCIDENT_POINTS_MIN_ZOOM:
+        rows = list(regions.fan_out(
+            incidents.values('latitude', 'longitude', 'severity', 'description')[:MAX_VIEWPORT_POINTS + 1], shards,
+        ))
+        return {
+            'mode': 'points',
+            'truncated': len(rows) > MAX_VIEWPORT_POINTS,
+            'incidents': [{
+                'lat': inc['latitude'],
+                'lon': inc['longitude'],
+                'severity': inc['severity'],
+                'description': inc['description'],
+            } for inc in rows[:MAX_VIEWPORT_POINTS]],
+        }
+
+    cell = 360.0 / 2 ** zoom / INCIDENT_CELLS_PER_TILE
+    grouped = (
+        incidents
+        .annotate(cx=Floor(F('longitude') / cell), cy=Floor(F('latitude') / cell))
+        .values('cx', 'cy', 'severity')
+        .annotate(n=Count('id'), lat=Avg('latitude'), lon=Avg('longitude'))
+        .order_by()
+    )
+    cells = {}
+    for row in regions.fan_out(grouped, shards):
+        c = cells.setdefault((row['cx'], row['cy']), {'lat': 0.0, 'lon': 0.0, 'count': 0, 'low': 0, 'medium': 0, 'high': 0})
+        c[row['severity']] = c.get(row['severity'], 0) + row['n']
+        c['lat'] += row['lat'] * row['n']
+        c['lon'] += row['lon'] * row['n']
+        c['count'] += row['n']
+    for c in cells.values():
+        c['lat'] /= c['count']
+        c['lon'] /= c['count']
+    return {'mode': 'cells', 'cell_degrees': cell, 'cells': list(cells.values())}
+
+@login_required
+def incidents_viewport(request):
+    """AJAX endpoint — zoom-aware incidents for the visible part of the heatmap."""
+    try:
+        viewport = _parse_viewport(request.GET)
+    except ValueError:
+        return JsonResponse({'status': 'error'}, status=400)
+    return JsonResponse(_incident_viewport(*viewport))
+
+
+def _risk_tile_response(z, x, y):
+    """PNG risk tile, or 404 outside the tile pyramid."""
+    if not (0 <= z <= risk.MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return HttpResponse(status=404)
+    response = HttpResponse(risk.get_png(z, x, y), content_type='image/png')
+    response['Cache-Control'] = 'private, max-age=60'
+    return response
+
+
+def _parse_point(params):
+    """Read ?lat=&lon=. Raises ValueError."""
+    lat, lon = float(params.get('lat', '')), float(params.get('lon', ''))
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError('lat/lon out of range')
+    return lat, lon
+
+@login_required
+def risk_tile(request, z, x, y):
+    """Risk heatmap tile for the Leaflet overlay."""
+    return _risk_tile_response(z, x, y)
+
+@login_required
+def risk_point(request):
+    """AJAX endpoint — risk score at a single point."""
+    try:
+        lat, lon = _parse_point(request.GET)
+    except ValueError:
+        return JsonResponse({'status': 'error'}, status=400)
+    return JsonResponse(risk.risk_at(lat, lon))
+
+
+# ─── Metrics ─────────────────────────────────────────────────────────────────
+
+def _client_ip(request):
+    """
+    REMOTE_ADDR, or the address the proxy appended to METRICS_CLIENT_IP_HEADER
+    when one is set (behind a proxy REMOTE_ADDR is the proxy itself).
+    """
+    header = getattr(settings, 'METRICS_CLIENT_IP_HEADER', None)
+    if header and request.META.get(header):
+        return request.META[header].split(',')[-1].strip()
+    return request.META.get('REMOTE_ADDR')
+
+
+def prometheus_metrics(request):
+    """Prometheus scrape endpoint, open only to METRICS_ALLOWED_IPS."""
+    if _client_ip(request) not in getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1', '::1']):
+        return HttpResponse(status=403)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
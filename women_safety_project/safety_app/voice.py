@@ -0,0 +1,279 @@
+"""
+Voice-distress detection for Guardian Mode.
+
+Clients stream short chunks of mono audio (a WAV file, or raw 16-bit
+little-endian PCM sent as ``audio/l16; rate=16000``). Each chunk is cut into
+overlapping 64 ms frames and every frame gets four features, all computed
+with whole-array NumPy operations in a process pool:
+
+- loudness: RMS energy in dBFS
+- brightness: spectral centroid
+- noisiness: zero-crossing rate
+- pitch: autocorrelation F0 and how strongly voiced the frame is
+
+A fixed rule turns the features into a per-frame score. A frame only scores
+when it is well above the user's ambient level. It scores higher when it is
+bright and voiced at scream pitch, and it is discarded when it is noise
+(high zero-crossing rate). Danger is reported once the mean score over the
+last second reaches VOICE_DANGER_THRESHOLD.
+
+Per-user stream state lives in the ``user_state`` cache: the samples not yet
+framed, the ambient baseline, recent frame scores and the last chunk
+sequence number. A chunk therefore only costs its own new frames, and a
+retried chunk is not analysed twice. When the pool is too busy to answer
+within VOICE_TIMEOUT_SECONDS the chunk is not folded in and VoiceBusy is
+raised, so the client can send it again. Async views call ``aanalyze_chunk()``,
+which awaits the pool rather than blocking a thread on it.
+"""
+import asyncio
+import io
+import logging
+import multiprocessing
+import wave
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from numpy.lib.stride_tricks import sliding_window_view
+
+logger = logging.getLogger(__name__)
+
+MIN_RATE = 8000
+MAX_RATE = 48000
+MAX_CHUNK_SECONDS = 10
+FRAME_SECONDS = 0.064
+WINDOW_SECONDS = 1.0
+PITCH_RANGE_HZ = (80.0, 1000.0)
+
+# Decision rule. Levels are dB, frequencies Hz.
+LOUDNESS_MARGIN_DB = 15.0
+LOUDNESS_FLOOR_DB = -35.0
+LOUDNESS_SPAN_DB = 12.0
+SCREAM_PITCH_HZ = 350.0
+VOICED = 0.5
+NOISE_ZCR = 0.3
+BRIGHTNESS_RANGE_HZ = (1000.0, 3000.0)
+BASELINE_ALPHA = 0.1
+# Assumed ambient level until a stream has shown its own.
+AMBIENT_DB = -50.0
+
+
+# ─── Decoding ────────────────────────────────────────────────────────────────
+
+def decode_wav(data):
+    """(float32 mono samples in [-1, 1], rate) from 16-bit PCM WAV bytes. Raises ValueError."""
+    try:
+        with wave.open(io.BytesIO(data)) as w:
+            if w.getsampwidth() != 2:
+                raise ValueError('Only 16-bit PCM WAV is supported')
+            rate, channels = w.getframerate(), w.getnchannels()
+            frames = w.readframes(min(w.getnframes(), MAX_CHUNK_SECONDS * rate))
+    except (wave.Error, EOFError) as exc:
+        raise ValueError(f'Unreadable WAV: {exc}')
+    samples = decode_pcm(frames, rate)
+    if channels > 1:
+        samples = samples[:len(samples) // channels * channels].reshape(-1, channels).mean(axis=1)
+    return samples, rate
+
+
+def decode_pcm(data, rate):
+    """float32 samples from raw 16-bit little-endian PCM. Raises ValueError."""
+    if not MIN_RATE <= rate <= MAX_RATE:
+        raise ValueError(f'Sample rate must be between {MIN_RATE} and {MAX_RATE} Hz')
+    data = data[:len(data) // 2 * 2][:MAX_CHUNK_SECONDS * rate * 2]
+    return np.frombuffer(data, dtype='<i2').astype(np.float32) / 32768.0
+
+
+# ─── Features ────────────────────────────────────────────────────────────────
+
+def frame_size(rate):
+    """(frame length, hop): a power of two near FRAME_SECONDS, half overlapping."""
+    n = 1 << int(round(np.log2(rate * FRAME_SECONDS)))
+    return n, n // 2
+
+
+def extract_features(samples, rate):
+    """Per-frame features of ``samples`` as a dict of equal-length arrays (runs in the pool)."""
+    n, hop = frame_size(rate)
+    if len(samples) < n:
+        empty = np.empty(0, dtype=np.float32)
+        return {'rms_db': empty, 'centroid': empty, 'zcr': empty, 'pitch': empty, 'voicing': empty}
+    frames = sliding_window_view(samples, n)[::hop]
+
+    rms = np.sqrt(np.mean(frames ** 2, axis=1))
+    rms_db = 20 * np.log10(np.maximum(rms, 1e-10))
+
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (n - 1)
+
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(n), axis=1))
+    freqs = np.fft.rfftfreq(n, 1 / rate)
+    centroid = (spectrum * freqs).sum(axis=1) / np.maximum(spectrum.sum(axis=1), 1e-10)
+
+    # Autocorrelation via the power spectrum; the strongest lag in the pitch
+    # range gives F0 and its normalised height how voiced the frame is.
+    centred = frames - frames.mean(axis=1, keepdims=True)
+    acf = np.fft.irfft(np.abs(np.fft.rfft(centred, n=2 * n, axis=1)) ** 2, axis=1)[:, :n]
+    lo = int(rate / PITCH_RANGE_HZ[1])
+    hi = min(int(rate / PITCH_RANGE_HZ[0]), n - 1)
+    lags = np.argmax(acf[:, lo:hi], axis=1) + lo
+    voicing = acf[np.arange(len(frames)), lags] / np.maximum(acf[:, 0], 1e-10)
+    pitch = np.where(voicing >= VOICED, rate / lags, 0.0)
+
+    return {'rms_db': rms_db, 'centroid': centroid, 'zcr': zcr, 'pitch': pitch, 'voicing': voicing}
+
+
+def frame_scores(features, baseline_db):
+    """Deterministic 0..1 distress score per frame."""
+    threshold = max(baseline_db + LOUDNESS_MARGIN_DB, LOUDNESS_FLOOR_DB)
+    loud = np.clip((features['rms_db'] - threshold) / LOUDNESS_SPAN_DB, 0.0, 1.0)
+    low, high = BRIGHTNESS_RANGE_HZ
+    bright = np.clip((features['centroid'] - low) / (high - low), 0.0, 1.0)
+    scream_pitch = (features['pitch'] >= SCREAM_PITCH_HZ).astype(float)
+    tonal = (features['zcr'] < NOISE_ZCR).astype(float)
+    return loud * tonal * (0.45 + 0.3 * scream_pitch + 0.25 * bright)
+
+
+# ─── Process pool ────────────────────────────────────────────────────────────
+
+class VoiceBusy(Exception):
+    """The analysis pool did not answer in time."""
+
+
+_pool = None
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # spawn: forking a process that runs the outbox and scheduler threads is unsafe.
+        _pool = ProcessPoolExecutor(max_workers=getattr(settings, 'VOICE_WORKERS', 2),
+                                    mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def features_for(samples, rate):
+    """extract_features() in the pool, or inline when VOICE_WORKERS is 0."""
+    global _pool
+    if not getattr(settings, 'VOICE_WORKERS', 2):
+        return extract_features(samples, rate)
+    future = _get_pool().submit(extract_features, samples, rate)
+    try:
+        return future.result(timeout=getattr(settings, 'VOICE_TIMEOUT_SECONDS', 5))
+    except TimeoutError:
+        # Queued behind other chunks; drop it rather than tie up this worker too.
+        future.cancel()
+        raise VoiceBusy('Voice analysis is busy, try again')
+    except BrokenProcessPool:
+        logger.warning('Voice analysis pool died; restarting it', exc_info=True)
+        _pool = None
+        return extract_features(samples, rate)
+
+
+async def afeatures_for(samples, rate):
+    """features_for() for async views."""
+    global _pool
+    inline = sync_to_async(extract_features, thread_sensitive=False)
+    if not getattr(settings, 'VOICE_WORKERS', 2):
+        return await inline(samples, rate)
+    try:
+        # On timeout wait_for() cancels the wrapped future, and with it the queued task.
+        return await asyncio.wait_for(asyncio.wrap_future(_get_pool().submit(extract_features, samples, rate)),
+                                      getattr(settings, 'VOICE_TIMEOUT_SECONDS', 5))
+    except asyncio.TimeoutError:
+        raise VoiceBusy('Voice analysis is busy, try again')
+    except BrokenProcessPool:
+        logger.warning('Voice analysis pool died; restarting it', exc_info=True)
+        _pool = None
+        return await inline(samples, rate)
+
+
+# ─── Per-user streams ────────────────────────────────────────────────────────
+
+def _state_key(user_id):
+    return f'voice:{user_id}'
+
+
+def _new_state(stream, rate):
+    return {
+        'stream': stream,
+        'rate': rate,
+        'seq': None,
+        'pending': np.empty(0, dtype=np.float32),
+        'baseline_db': AMBIENT_DB,
+        'recent': np.empty(0),
+        'result': {'danger_detected': False, 'confidence': 0.0, 'score': 0.0, 'frames': 0},
+    }
+
+
+def analyze_chunk(user_id, samples, rate, stream='', seq=None):
+    """
+    Feed one chunk of the user's stream and return
+    {'danger_detected', 'confidence', 'score', 'frames'}.
+
+    A new ``stream`` id or sample rate starts over. A chunk whose ``seq`` is
+    not past the last one seen is a retry and gets the previous answer.
+    """
+    cache = caches['user_state']
+    key = _state_key(user_id)
+    state = _resume(cache.get(key), stream, rate)
+    if _is_retry(state, seq):
+        return {**state['result'], 'frames': 0}
+    buffered = np.concatenate([state['pending'], samples.astype(np.float32)])
+    _advance(state, buffered, features_for(buffered, rate), seq)
+    cache.set(key, state, getattr(settings, 'VOICE_STATE_SECONDS', 120))
+    return state['result']
+
+
+async def aanalyze_chunk(user_id, samples, rate, stream='', seq=None):
+    """analyze_chunk() for async views."""
+    cache = caches['user_state']
+    key = _state_key(user_id)
+    state = _resume(await cache.aget(key), stream, rate)
+    if _is_retry(state, seq):
+        return {**state['result'], 'frames': 0}
+    buffered = np.concatenate([state['pending'], samples.astype(np.float32)])
+    _advance(state, buffered, await afeatures_for(buffered, rate), seq)
+    await cache.aset(key, state, getattr(settings, 'VOICE_STATE_SECONDS', 120))
+    return state['result']
+
+
+def _resume(state, stream, rate):
+    """The cached state, or a fresh one for a new stream id or sample rate."""
+    if state is None or state['stream'] != stream or state['rate'] != rate:
+        return _new_state(stream, rate)
+    return state
+
+
+def _is_retry(state, seq):
+    return seq is not None and state['seq'] is not None and seq <= state['seq']
+
+
+def _advance(state, buffered, features, seq):
+    """Fold one chunk's frames into the stream state and set its result."""
+    rate = state['rate']
+    _, hop = frame_size(rate)
+    count = len(features['rms_db'])
+    # Keep what the next chunk's first frame needs.
+    state['pending'] = buffered[count * hop:]
+
+    if count:
+        scores = frame_scores(features, state['baseline_db'])
+        # The quieter frames track the ambient level; short bursts barely move it.
+        ambient = float(np.percentile(features['rms_db'], 25))
+        state['baseline_db'] += BASELINE_ALPHA * (ambient - state['baseline_db'])
+        window = max(int(WINDOW_SECONDS * rate / hop), 1)
+        state['recent'] = np.concatenate([state['recent'], scores])[-window:]
+
+    score = float(state['recent'].mean()) if len(state['recent']) else 0.0
+    danger = score >= getattr(settings, 'VOICE_DANGER_THRESHOLD', 0.5)
+    state['seq'] = seq
+    state['result'] = {
+        'danger_detected': danger,
+        'confidence': round(score, 3) if danger else 0.0,
+        'score': round(score, 3),
+        'frames': count,
+    }
@@ -3,6 +3,11 @@ ASGI config for women_safety_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Under ASGI the polling endpoints (location updates, alert and journey polls,
+SOS status, voice chunks) run as async views, so one process holds
+thousands of mostly idle clients; see safety_app.loadgen for the benchmark
+against the WSGI deployment.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
@@ -12,5 +17,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'women_safety_project.settings')
+os.environ['RAKSHA_SERVER'] = 'asgi'
 
 application = get_asgi_application()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import tempfile
 from pathlib import Path
 
 # Default primary key field type
@@ -47,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'safety_app.metrics.metrics_middleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -80,6 +82,8 @@ WSGI_APPLICATION = 'women_safety_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# Development defaults; women_safety_project.settings_production tunes SQLite
+# for concurrent writers (WAL, busy timeout, persistent connections).
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
@@ -136,11 +140,17 @@ DEFAULT_FROM_EMAIL = 'noreply@safewalk.local'
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'login'
+# Session and user lookups go through caches so background polls cost no
+# queries before the view runs (see safety_app.user_cache). cached_db still
+# writes through to the database; with several workers put the default
+# cache on a shared backend so a logout is seen by all of them.
+AUTHENTICATION_BACKENDS = ['safety_app.backends.CachedModelBackend']
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
 
 # Django REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -150,3 +160,123 @@ REST_FRAMEWORK = {
 
 # CORS — allow the Expo app to reach this server
 CORS_ALLOW_ALL_ORIGINS = True  # Fine for development; lock down in production
+
+# Community alert stream (served under ASGI; see safety_app.alerts)
+ALERT_STREAM_REFRESH_SECONDS = 30
+ALERT_STREAM_KEEPALIVE_SECONDS = 15
+
+# Notification outbox (see safety_app.outbox). Run `manage.py run_outbox`
+# once per deployment; OUTBOX_AUTOSTART starts a dispatcher in every process
+# instead, e.g. a lone dev server.
+OUTBOX_AUTOSTART = False
+OUTBOX_WORKERS = 4
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_BACKOFF_SECONDS = 5
+
+# Location history (see safety_app.history; compact with
+# `manage.py compact_location_history`, e.g. from a daily cron job)
+LOCATION_HISTORY_COMPACT_AFTER_DAYS = 1
+LOCATION_HISTORY_SIMPLIFY_METERS = 10
+LOCATION_HISTORY_RETENTION_DAYS = 28
+
+# Retention (see safety_app.retention; run `manage.py purge_expired` from a
+# daily cron job). Rows older than RETENTION_DAYS are moved to monthly gzip
+# NDJSON archives under RETENTION_ARCHIVE_DIR, RETENTION_BATCH_SIZE rows per
+# transaction. None keeps a model's rows forever. Keep incidents for at least
+# RISK_WINDOW_DAYS.
+RETENTION_DAYS = {'soslog': 365, 'journeytracker': 90, 'incidentreport': 365}
+RETENTION_ARCHIVE_DIR = BASE_DIR / 'archive'
+RETENTION_BATCH_SIZE = 500
+RETENTION_BATCH_PAUSE_SECONDS = 0.05
+
+# Location write batching (see safety_app.location_writer). When on, each
+# process commits location fixes from one writer thread, in one transaction
+# per LOCATION_BATCH_WINDOW_MS; SOS writes bypass the queue and go first.
+LOCATION_WRITE_BATCHING = False
+LOCATION_BATCH_WINDOW_MS = 5
+LOCATION_BATCH_MAX_FIXES = 500
+LOCATION_WRITE_TIMEOUT_SECONDS = 5
+
+# Safe Walk expiry (see safety_app.journeys). Run
+# `manage.py run_journey_scheduler` once per deployment; the autostart flag
+# starts a scheduler in every process instead, e.g. a lone dev server.
+JOURNEY_SCHEDULER_AUTOSTART = False
+JOURNEY_EXPIRY_GRACE_SECONDS = 60
+JOURNEY_SCHEDULER_RESYNC_SECONDS = 60
+
+# Caches. LocMem is per process and evicts the least recently used entries
+# past MAX_ENTRIES; point an alias at a shared backend (Redis, Memcached) to
+# share entries and invalidations between workers.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Incident risk tiles (see safety_app.risk)
+    'risk_tiles': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'risk-tiles',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 512},
+    },
+    # Per-user contacts and profile (see safety_app.user_cache)
+    'user_state': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'user-state',
+        'TIMEOUT': 60,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+# LocMem is per worker: another worker accepts a revoked token or a
+# deactivated user until its cached entry expires. Keep that window short,
+# or point 'user_state' at a shared cache.
+USER_CACHE_AUTH_SECONDS = 10
+
+# Incident risk surface (see safety_app.risk)
+RISK_WINDOW_DAYS = 30
+RISK_KERNEL_METERS = 150
+RISK_SEVERITY_WEIGHTS = {'low': 1.0, 'medium': 2.0, 'high': 4.0}
+RISK_SATURATION = 4.0
+
+# Active-SOS snapshot shared by every worker on this host (see
+# safety_app.sos_snapshot). Point it at tmpfs (e.g. /dev/shm) in production.
+SOS_SNAPSHOT_PATH = Path(tempfile.gettempdir()) / 'raksha_sos_snapshot.bin'
+SOS_SNAPSHOT_MAX_AGE_SECONDS = 30
+
+# Prometheus metrics at /metrics (see safety_app.metrics). Every process
+# flushes to METRICS_DIR; it must be shared by all workers on the host.
+METRICS_DIR = Path(tempfile.gettempdir()) / 'raksha_metrics'
+METRICS_FLUSH_SECONDS = 1.0
+# Checked against REMOTE_ADDR. Behind a reverse proxy that is the proxy's
+# address, so every client would match; set METRICS_CLIENT_IP_HEADER to the
+# META key the proxy fills (e.g. 'HTTP_X_FORWARDED_FOR', whose last entry is
+# used). Only set it when all traffic passes the proxy: clients can send it.
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+METRICS_CLIENT_IP_HEADER = None
+
+# Guardian Mode voice analysis (see safety_app.voice). Feature extraction
+# runs in a pool of VOICE_WORKERS processes per web worker; 0 runs it inline.
+VOICE_WORKERS = 2
+VOICE_TIMEOUT_SECONDS = 5
+VOICE_DANGER_THRESHOLD = 0.5
+VOICE_STATE_SECONDS = 120
+
+# Offline Safe Route planning (see safety_app.routing). Build the graph with
+# `manage.py build_walk_graph <extract.osm.gz>`. ROUTING_DEFAULT_SAFETY is
+# how many metres of detour one unit of incident exposure is worth.
+ROUTING_GRAPH_PATH = BASE_DIR / 'data' / 'walk_graph.npz'
+ROUTING_DEFAULT_SAFETY = 2.0
+ROUTING_MAX_SNAP_METERS = 300
+ROUTING_RISK_REBUILD_SECONDS = 3600
+
+# Offline destination search (see safety_app.geocoder). Build the index with
+# `manage.py import_places <extract.osm.gz | places.csv>`. Results fall off
+# with distance on the scale of GEOCODER_PROXIMITY_KM.
+GEOCODER_INDEX_PATH = BASE_DIR / 'data' / 'places.npz'
+GEOCODER_PROXIMITY_KM = 5.0
+
+# Region shards (see safety_app.regions). Map geohash prefixes to extra
+# DATABASES aliases, e.g. {'tun': 'kolkata'} alongside a 'kolkata' database,
+# then `manage.py migrate --database=kolkata`. Empty keeps every table in
+# default.
+DATABASE_ROUTERS = ['safety_app.regions.RegionRouter']
+REGION_SHARDS = {}
@@ -0,0 +1,49 @@
+"""
+Production database profile for a single-host SQLite deployment.
+
+Use it with DJANGO_SETTINGS_MODULE=women_safety_project.settings_production.
+It layers over settings.py and changes only the database tier:
+
+- WAL journal: readers never block the writer, and the writer doesn't block
+  readers. synchronous=NORMAL is durable in WAL mode except for the last
+  commits before a power loss.
+- A busy timeout, so a writer waits for the lock instead of failing at once
+  with "database is locked".
+- IMMEDIATE transactions take the write lock at BEGIN. A deferred
+  transaction that upgrades from read to write part-way through can hit
+  SQLITE_BUSY without waiting at all.
+- Persistent connections with health checks, so the pragmas and SQLite's
+  page cache survive between requests. Not under ASGI (asgi.py sets
+  RAKSHA_SERVER=asgi): there each request's queries run on a thread of
+  their own, so a connection left open would never be used again.
+- Location fixes are group-committed by safety_app.location_writer.
+
+Every alias in DATABASES gets the same tuning, region shards included.
+"""
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
+
+DATABASES = {
+    alias: {
+        **database,
+        'CONN_MAX_AGE': 0 if os.environ.get('RAKSHA_SERVER') == 'asgi' else 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA temp_store=MEMORY;'
+                'PRAGMA cache_size=-65536;'
+                'PRAGMA mmap_size=268435456;'
+                'PRAGMA journal_size_limit=67108864;'
+            ),
+        },
+    }
+    for alias, database in DATABASES.items()
+}
+
+LOCATION_WRITE_BATCHING = True